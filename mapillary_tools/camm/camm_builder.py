@@ -5,7 +5,9 @@
 
 from __future__ import annotations
 
+import heapq
 import io
+import itertools
 import typing as T
 
 from .. import geo
@@ -17,15 +19,62 @@ from ..mp4 import (
 from . import camm_parser
 
 
-def _build_camm_sample(measurement: camm_parser.TelemetryMeasurement) -> bytes:
-    if camm_parser.GoProGPSSampleEntry.serializable(measurement):
-        return camm_parser.GoProGPSSampleEntry.serialize(measurement)
+# Serializable measurements are matched by exact type (see CAMMSampleEntry.serializable)
+_SAMPLE_ENTRY_CLS_BY_TELEMETRY_CLS: dict[type, T.Type[camm_parser.CAMMSampleEntry]] = {
+    sample_entry_cls.telemetry_cls_type: sample_entry_cls
+    for sample_entry_cls in T.cast(
+        T.List[T.Type[camm_parser.CAMMSampleEntry]],
+        [
+            camm_parser.GoProGPSSampleEntry,
+            *camm_parser.SAMPLE_ENTRY_CLS_BY_CAMM_TYPE.values(),
+        ],
+    )
+}
+
+# Number of samples packed into one buffer when writing the CAMM samples
+_ENCODE_BATCH_SIZE = 4096
 
-    for sample_entry_cls in camm_parser.SAMPLE_ENTRY_CLS_BY_CAMM_TYPE.values():
-        if sample_entry_cls.serializable(measurement):
-            return sample_entry_cls.serialize(measurement)
 
-    raise ValueError(f"Unsupported measurement type {type(measurement)}")
+def _sample_entry_cls(
+    measurement: camm_parser.TelemetryMeasurement,
+) -> T.Type[camm_parser.CAMMSampleEntry]:
+    sample_entry_cls = _SAMPLE_ENTRY_CLS_BY_TELEMETRY_CLS.get(type(measurement))
+    if sample_entry_cls is None:
+        raise ValueError(f"Unsupported measurement type {type(measurement)}")
+    return sample_entry_cls
+
+
+def encode_camm_samples(
+    measurements: T.Sequence[camm_parser.TelemetryMeasurement],
+) -> tuple[bytearray, list[int]]:
+    """
+    Pack the measurements as consecutive CAMM samples into a single preallocated buffer.
+    Return the buffer (i.e. the mdat payload of the samples) and the sample sizes.
+    """
+    sample_entry_clses = [_sample_entry_cls(m) for m in measurements]
+    sizes = [cls.sample_struct().size for cls in sample_entry_clses]
+
+    payload = bytearray(sum(sizes))
+    offset = 0
+    for measurement, sample_entry_cls, size in zip(
+        measurements, sample_entry_clses, sizes
+    ):
+        sample_entry_cls.pack_into(payload, offset, measurement)
+        offset += size
+
+    return payload, sizes
+
+
+def _iterate_encoded_batches(
+    measurements: T.Iterable[camm_parser.TelemetryMeasurement],
+) -> T.Generator[io.BytesIO, None, None]:
+    it = iter(measurements)
+    while True:
+        batch = list(itertools.islice(it, _ENCODE_BATCH_SIZE))
+        if not batch:
+            break
+        payload, _ = encode_camm_samples(batch)
+        yield io.BytesIO(payload)
 
 
 def _create_edit_list_from_points(
@@ -77,19 +126,27 @@ def _create_edit_list_from_points(
 
 
 def convert_telemetry_to_raw_samples(
-    measurements: T.Sequence[camm_parser.TelemetryMeasurement],
+    measurements: T.Iterable[camm_parser.TelemetryMeasurement],
     timescale: int,
 ) -> T.Generator[sample_parser.RawSample, None, None]:
-    for idx, measurement in enumerate(measurements):
-        camm_sample_data = _build_camm_sample(measurement)
-
-        if idx + 1 < len(measurements):
-            timedelta = int((measurements[idx + 1].time - measurement.time) * timescale)
+    """
+    Convert time-ordered measurements to CAMM samples. Measurements are consumed lazily,
+    i.e. one sample is yielded once the next measurement is read.
+    """
+    it = iter(measurements)
+    measurement = next(it, None)
+    while measurement is not None:
+        # The sample size is fixed by the CAMM type, so no need to encode it here
+        sample_size = _sample_entry_cls(measurement).sample_struct().size
+
+        next_measurement = next(it, None)
+        if next_measurement is not None:
+            timedelta = int((next_measurement.time - measurement.time) * timescale)
         else:
             timedelta = 0
 
         assert 0 <= timedelta <= builder.UINT32_MAX, (
-            f"expected timedelta {timedelta} between {measurements[idx]} and {measurements[idx + 1]} with timescale {timescale} to be <= UINT32_MAX"
+            f"expected timedelta {timedelta} between {measurement} and {next_measurement} with timescale {timescale} to be <= UINT32_MAX"
         )
 
         yield sample_parser.RawSample(
@@ -97,16 +154,13 @@ def convert_telemetry_to_raw_samples(
             description_idx=1,
             # will update later
             offset=0,
-            size=len(camm_sample_data),
+            size=sample_size,
             timedelta=timedelta,
             composition_offset=0,
             is_sync=True,
         )
 
-
-_STBLChildrenBuilderConstruct = cparser.Box32ConstructBuilder(
-    T.cast(cparser.SwitchMapType, cparser.CMAP[b"stbl"])
-)
+        measurement = next_measurement
 
 
 def _create_camm_stbl(
@@ -120,22 +174,31 @@ def _create_camm_stbl(
         }
     ]
 
-    stbl_children_boxes = builder.build_stbl_from_raw_samples(descriptions, raw_samples)
-
-    stbl_data = _STBLChildrenBuilderConstruct.build_boxlist(stbl_children_boxes)
     return {
         "type": b"stbl",
-        "data": stbl_data,
+        "data": builder.build_stbl_data_from_raw_samples(descriptions, raw_samples),
     }
 
 
 def create_camm_trak(
-    raw_samples: T.Sequence[sample_parser.RawSample],
+    raw_samples: T.Iterable[sample_parser.RawSample],
     media_timescale: int,
     creation_time: int = 0,
     modification_time: int = 0,
 ) -> builder.BoxDict:
-    stbl = _create_camm_stbl(raw_samples)
+    """
+    Create the CAMM trak box. The raw samples are consumed in a single pass,
+    so they can be streamed from a generator.
+    """
+    media_duration = 0
+
+    def _sum_duration() -> T.Generator[sample_parser.RawSample, None, None]:
+        nonlocal media_duration
+        for raw_sample in raw_samples:
+            media_duration += raw_sample.timedelta
+            yield raw_sample
+
+    stbl = _create_camm_stbl(_sum_duration())
 
     hdlr: builder.BoxDict = {
         "type": b"hdlr",
@@ -145,7 +208,6 @@ def create_camm_trak(
         },
     }
 
-    media_duration = sum(s.timedelta for s in raw_samples)
     assert media_timescale <= builder.UINT64_MAX
 
     # Media Header Box
@@ -224,7 +286,41 @@ def create_camm_trak(
     }
 
 
-def camm_sample_generator2(camm_info: camm_parser.CAMMInfo):
+def camm_sample_generator2(
+    camm_info: camm_parser.CAMMInfo,
+    telemetry_stream: T.Callable[[], T.Iterable[camm_parser.TelemetryMeasurement]]
+    | None = None,
+):
+    """
+    Create the sample generator that adds the CAMM track built from camm_info to an MP4.
+
+    telemetry_stream, if specified, returns time-ordered measurements (e.g. IMU data)
+    to be added in addition to those in camm_info. It is called twice, once for building
+    the sample table and once for writing the samples, so the measurements are streamed
+    instead of held in memory.
+    """
+
+    # Multiplex the measurements in camm_info
+    in_memory_measurements: list[camm_parser.TelemetryMeasurement] = [
+        *(camm_info.gps or []),
+        *(camm_info.mini_gps or []),
+        *(camm_info.accl or []),
+        *(camm_info.gyro or []),
+        *(camm_info.magn or []),
+    ]
+    in_memory_measurements.sort(key=lambda m: m.time)
+
+    def _iterate_measurements() -> T.Iterator[camm_parser.TelemetryMeasurement]:
+        measurements: T.Iterable[camm_parser.TelemetryMeasurement]
+        if telemetry_stream is None:
+            measurements = in_memory_measurements
+        else:
+            # Stable merge: on ties, measurements in camm_info come first
+            measurements = heapq.merge(
+                in_memory_measurements, telemetry_stream(), key=lambda m: m.time
+            )
+        return (m for m in measurements if m.time >= 0)
+
     def _f(
         fp: T.BinaryIO,
         moov_children: list[builder.BoxDict],
@@ -249,25 +345,12 @@ def camm_sample_generator2(camm_info: camm_parser.CAMMInfo):
             track = [p for p in track if p.time >= 0]
         elst = _create_edit_list_from_points([track], movie_timescale, media_timescale)
 
-        # Multiplex telemetry measurements
-        measurements: list[camm_parser.TelemetryMeasurement] = [
-            *(camm_info.gps or []),
-            *(camm_info.mini_gps or []),
-            *(camm_info.accl or []),
-            *(camm_info.gyro or []),
-            *(camm_info.magn or []),
-        ]
-        measurements.sort(key=lambda m: m.time)
-        if measurements and measurements[0].time < 0:
-            measurements = [m for m in measurements if m.time >= 0]
-
-        # Serialize the telemetry measurements into MP4 samples
-        camm_samples = list(
-            convert_telemetry_to_raw_samples(measurements, media_timescale)
-        )
-
+        # First pass over the measurements: pack the sample table of the CAMM samples
         camm_trak = create_camm_trak(
-            camm_samples, media_timescale, creation_time, modification_time
+            convert_telemetry_to_raw_samples(_iterate_measurements(), media_timescale),
+            media_timescale,
+            creation_time,
+            modification_time,
         )
 
         if T.cast(T.Dict, elst["data"])["entries"]:
@@ -302,9 +385,8 @@ def camm_sample_generator2(camm_info: camm_parser.CAMMInfo):
                 }
             )
 
+        # Second pass: write the samples
         # if yield, the moov_children will not be modified
-        return (
-            io.BytesIO(_build_camm_sample(measurement)) for measurement in measurements
-        )
+        return _iterate_encoded_batches(_iterate_measurements())
 
     return _f
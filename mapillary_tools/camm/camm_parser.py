@@ -8,15 +8,17 @@ from __future__ import annotations
 
 import abc
 import dataclasses
-import io
+import functools
 import logging
+import struct
 import typing as T
 from enum import Enum
 
 import construct as C
 from typing_extensions import TypeIs
 
-from .. import geo, telemetry
+from .. import constants, geo, telemetry
+from ..mp4 import io_utils
 from ..mp4.mp4_sample_parser import MovieBoxParser, Sample, TrackBoxParser
 
 
@@ -61,7 +63,8 @@ class CAMMInfo:
 
 
 def extract_camm_info(fp: T.BinaryIO, telemetry_only: bool = False) -> CAMMInfo | None:
-    moov = MovieBoxParser.parse_stream(fp)
+    # Only the camm track is needed, so skip reading the video and audio tracks
+    moov = MovieBoxParser.parse_stream(fp, sample_formats={b"camm"})
 
     make, model = "", ""
     if not telemetry_only:
@@ -69,9 +72,6 @@ def extract_camm_info(fp: T.BinaryIO, telemetry_only: bool = False) -> CAMMInfo
         if udta_boxdata is not None:
             make, model = _extract_camera_make_and_model_from_utda_boxdata(udta_boxdata)
 
-    gps_only_construct = _construct_with_selected_camm_types(
-        [CAMMType.MIN_GPS, CAMMType.GPS]
-    )
     # Optimization: skip parsing sample data smaller than 16 bytes
     # because we are only interested in MIN_GPS and GPS which are larger than 16 bytes
     MIN_GPS_SAMPLE_SIZE = 17
@@ -79,13 +79,13 @@ def extract_camm_info(fp: T.BinaryIO, telemetry_only: bool = False) -> CAMMInfo
     for track in moov.extract_tracks():
         if _contains_camm_description(track):
             if telemetry_only:
-                maybe_measurements = (
-                    _parse_telemetry_from_sample(fp, sample)
+                camm_samples = (
+                    sample
                     for sample in track.extract_samples()
                     if _is_camm_description(sample.description)
                 )
                 measurements = _filter_telemetry_by_track_elst(
-                    moov, track, (m for m in maybe_measurements if m is not None)
+                    moov, track, _iterate_telemetry_from_samples(fp, camm_samples)
                 )
 
                 accl: list[telemetry.AccelerationData] = []
@@ -102,14 +102,18 @@ def extract_camm_info(fp: T.BinaryIO, telemetry_only: bool = False) -> CAMMInfo
 
                 return CAMMInfo(accl=accl, gyro=gyro, magn=magn)
             else:
-                maybe_measurements = (
-                    _parse_telemetry_from_sample(fp, sample, gps_only_construct)
+                camm_samples = (
+                    sample
                     for sample in track.extract_samples()
                     if _is_camm_description(sample.description)
                     and sample.raw_sample.size >= MIN_GPS_SAMPLE_SIZE
                 )
                 measurements = _filter_telemetry_by_track_elst(
-                    moov, track, (m for m in maybe_measurements if m is not None)
+                    moov,
+                    track,
+                    _iterate_telemetry_from_samples(
+                        fp, camm_samples, [CAMMType.MIN_GPS, CAMMType.GPS]
+                    ),
                 )
 
                 mini_gps: list[geo.Point] = []
@@ -127,7 +131,8 @@ def extract_camm_info(fp: T.BinaryIO, telemetry_only: bool = False) -> CAMMInfo
 
 
 def extract_camera_make_and_model(fp: T.BinaryIO) -> tuple[str, str]:
-    moov = MovieBoxParser.parse_stream(fp)
+    # Only udta is needed, so skip reading all tracks
+    moov = MovieBoxParser.parse_stream(fp, sample_formats=set())
     udta_boxdata = moov.extract_udta_boxdata()
     if udta_boxdata is None:
         return "", ""
@@ -141,6 +146,10 @@ class CAMMSampleEntry(abc.ABC, T.Generic[TTelemetry]):
 
     construct: C.Struct
 
+    # Little-endian struct format of the data that follows the sample header,
+    # equivalent to the construct above, used for both parsing and building
+    struct_format: str
+
     @classmethod
     def serializable(cls, data: T.Any, throw: bool = False) -> TypeIs[TTelemetry]:
         # Use "is" for exact type match, instead of isinstance
@@ -154,14 +163,44 @@ class CAMMSampleEntry(abc.ABC, T.Generic[TTelemetry]):
 
         return False
 
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def sample_struct(cls) -> struct.Struct:
+        """
+        The precompiled layout of the whole sample, i.e. the 2 reserved bytes,
+        the CAMM type and the data
+        """
+        return struct.Struct(f"<2xH{cls.struct_format}")
+
     @classmethod
     @abc.abstractmethod
-    def serialize(cls, data: TTelemetry) -> bytes:
+    def serialize_values(cls, data: TTelemetry) -> tuple:
+        """
+        Return the field values of the data in the order of struct_format
+        """
         raise NotImplementedError
 
+    @classmethod
+    def pack_into(cls, buffer: bytearray, offset: int, data: TTelemetry) -> None:
+        """
+        Pack the data as a CAMM sample into the buffer at the offset.
+        The buffer must have at least sample_struct().size bytes left
+        """
+        cls.sample_struct().pack_into(
+            buffer, offset, cls.serialized_camm_type.value, *cls.serialize_values(data)
+        )
+
+    @classmethod
+    def serialize(cls, data: TTelemetry) -> bytes:
+        cls.serializable(data, throw=True)
+
+        return cls.sample_struct().pack(
+            cls.serialized_camm_type.value, *cls.serialize_values(data)
+        )
+
     @classmethod
     @abc.abstractmethod
-    def deserialize(cls, sample: Sample, data: T.Any) -> TTelemetry:
+    def deserialize(cls, sample: Sample, data: tuple) -> TTelemetry:
         raise NotImplementedError
 
 
@@ -172,8 +211,10 @@ class MinGPSSampleEntry(CAMMSampleEntry):
 
     construct = _Double[3]  # type: ignore
 
+    struct_format = "3d"
+
     @classmethod
-    def deserialize(cls, sample: Sample, data: T.Any) -> geo.Point:
+    def deserialize(cls, sample: Sample, data: tuple) -> geo.Point:
         return geo.Point(
             time=sample.exact_time,
             lat=data[0],
@@ -183,19 +224,8 @@ class MinGPSSampleEntry(CAMMSampleEntry):
         )
 
     @classmethod
-    def serialize(cls, data: geo.Point) -> bytes:
-        cls.serializable(data, throw=True)
-
-        return CAMMSampleData.build(
-            {
-                "type": cls.serialized_camm_type.value,
-                "data": [
-                    data.lat,
-                    data.lon,
-                    -1.0 if data.alt is None else data.alt,
-                ],
-            }
-        )
+    def serialize_values(cls, data: geo.Point) -> tuple:
+        return (data.lat, data.lon, -1.0 if data.alt is None else data.alt)
 
 
 class GPSSampleEntry(CAMMSampleEntry):
@@ -217,45 +247,40 @@ class GPSSampleEntry(CAMMSampleEntry):
         "speed_accuracy" / _Float,  # type: ignore
     )
 
+    struct_format = "didd7f"
+
     @classmethod
-    def deserialize(cls, sample: Sample, data: T.Any) -> telemetry.CAMMGPSPoint:
+    def deserialize(cls, sample: Sample, data: tuple) -> telemetry.CAMMGPSPoint:
         return telemetry.CAMMGPSPoint(
             time=sample.exact_time,
-            lat=data.latitude,
-            lon=data.longitude,
-            alt=data.altitude,
+            lat=data[2],
+            lon=data[3],
+            alt=data[4],
             angle=None,
-            time_gps_epoch=data.time_gps_epoch,
-            gps_fix_type=data.gps_fix_type,
-            horizontal_accuracy=data.horizontal_accuracy,
-            vertical_accuracy=data.vertical_accuracy,
-            velocity_east=data.velocity_east,
-            velocity_north=data.velocity_north,
-            velocity_up=data.velocity_up,
-            speed_accuracy=data.speed_accuracy,
+            time_gps_epoch=data[0],
+            gps_fix_type=data[1],
+            horizontal_accuracy=data[5],
+            vertical_accuracy=data[6],
+            velocity_east=data[7],
+            velocity_north=data[8],
+            velocity_up=data[9],
+            speed_accuracy=data[10],
         )
 
     @classmethod
-    def serialize(cls, data: telemetry.CAMMGPSPoint) -> bytes:
-        cls.serializable(data, throw=True)
-
-        return CAMMSampleData.build(
-            {
-                "type": cls.serialized_camm_type.value,
-                "data": {
-                    "time_gps_epoch": data.time_gps_epoch,
-                    "gps_fix_type": data.gps_fix_type,
-                    "latitude": data.lat,
-                    "longitude": data.lon,
-                    "altitude": -1.0 if data.alt is None else data.alt,
-                    "horizontal_accuracy": data.horizontal_accuracy,
-                    "vertical_accuracy": data.vertical_accuracy,
-                    "velocity_east": data.velocity_east,
-                    "velocity_north": data.velocity_north,
-                    "velocity_up": data.velocity_up,
-                    "speed_accuracy": data.speed_accuracy,
-                },
-            }
+    def serialize_values(cls, data: telemetry.CAMMGPSPoint) -> tuple:
+        return (
+            data.time_gps_epoch,
+            data.gps_fix_type,
+            data.lat,
+            data.lon,
+            -1.0 if data.alt is None else data.alt,
+            data.horizontal_accuracy,
+            data.vertical_accuracy,
+            data.velocity_east,
+            data.velocity_north,
+            data.velocity_up,
+            data.speed_accuracy,
         )
 
 
@@ -266,24 +291,15 @@ class GoProGPSSampleEntry(CAMMSampleEntry):
 
     construct = _Double[3]  # type: ignore
 
+    struct_format = "3d"
+
     @classmethod
-    def deserialize(cls, sample: Sample, data: T.Any) -> telemetry.GPSPoint:
+    def deserialize(cls, sample: Sample, data: tuple) -> telemetry.GPSPoint:
         raise NotImplementedError("Deserializing GoPro GPS Point is not supported")
 
     @classmethod
-    def serialize(cls, data: telemetry.GPSPoint) -> bytes:
-        cls.serializable(data, throw=True)
-
-        return CAMMSampleData.build(
-            {
-                "type": cls.serialized_camm_type.value,
-                "data": [
-                    data.lat,
-                    data.lon,
-                    -1.0 if data.alt is None else data.alt,
-                ],
-            }
-        )
+    def serialize_values(cls, data: telemetry.GPSPoint) -> tuple:
+        return (data.lat, data.lon, -1.0 if data.alt is None else data.alt)
 
 
 class AccelerationSampleEntry(CAMMSampleEntry):
@@ -293,8 +309,10 @@ class AccelerationSampleEntry(CAMMSampleEntry):
 
     construct: C.Struct = _Float[3]  # type: ignore
 
+    struct_format = "3f"
+
     @classmethod
-    def deserialize(cls, sample: Sample, data: T.Any) -> telemetry.AccelerationData:
+    def deserialize(cls, sample: Sample, data: tuple) -> telemetry.AccelerationData:
         return telemetry.AccelerationData(
             time=sample.exact_time,
             x=data[0],
@@ -303,15 +321,8 @@ class AccelerationSampleEntry(CAMMSampleEntry):
         )
 
     @classmethod
-    def serialize(cls, data: telemetry.AccelerationData) -> bytes:
-        cls.serializable(data, throw=True)
-
-        return CAMMSampleData.build(
-            {
-                "type": cls.serialized_camm_type.value,
-                "data": [data.x, data.y, data.z],
-            }
-        )
+    def serialize_values(cls, data: telemetry.AccelerationData) -> tuple:
+        return (data.x, data.y, data.z)
 
 
 class GyroscopeSampleEntry(CAMMSampleEntry):
@@ -321,8 +332,10 @@ class GyroscopeSampleEntry(CAMMSampleEntry):
 
     construct: C.Struct = _Float[3]  # type: ignore
 
+    struct_format = "3f"
+
     @classmethod
-    def deserialize(cls, sample: Sample, data: T.Any) -> telemetry.GyroscopeData:
+    def deserialize(cls, sample: Sample, data: tuple) -> telemetry.GyroscopeData:
         return telemetry.GyroscopeData(
             time=sample.exact_time,
             x=data[0],
@@ -331,15 +344,8 @@ class GyroscopeSampleEntry(CAMMSampleEntry):
         )
 
     @classmethod
-    def serialize(cls, data: telemetry.GyroscopeData) -> bytes:
-        cls.serializable(data)
-
-        return CAMMSampleData.build(
-            {
-                "type": cls.serialized_camm_type.value,
-                "data": [data.x, data.y, data.z],
-            }
-        )
+    def serialize_values(cls, data: telemetry.GyroscopeData) -> tuple:
+        return (data.x, data.y, data.z)
 
 
 class MagnetometerSampleEntry(CAMMSampleEntry):
@@ -349,8 +355,10 @@ class MagnetometerSampleEntry(CAMMSampleEntry):
 
     construct: C.Struct = _Float[3]  # type: ignore
 
+    struct_format = "3f"
+
     @classmethod
-    def deserialize(cls, sample: Sample, data: T.Any) -> telemetry.MagnetometerData:
+    def deserialize(cls, sample: Sample, data: tuple) -> telemetry.MagnetometerData:
         return telemetry.MagnetometerData(
             time=sample.exact_time,
             x=data[0],
@@ -359,15 +367,8 @@ class MagnetometerSampleEntry(CAMMSampleEntry):
         )
 
     @classmethod
-    def serialize(cls, data: telemetry.MagnetometerData) -> bytes:
-        cls.serializable(data)
-
-        return CAMMSampleData.build(
-            {
-                "type": cls.serialized_camm_type.value,
-                "data": [data.x, data.y, data.z],
-            }
-        )
+    def serialize_values(cls, data: telemetry.MagnetometerData) -> tuple:
+        return (data.x, data.y, data.z)
 
 
 SAMPLE_ENTRY_CLS_BY_CAMM_TYPE = {
@@ -413,30 +414,131 @@ def _construct_with_selected_camm_types(
 CAMMSampleData = _construct_with_selected_camm_types()
 
 
-def _parse_telemetry_from_sample(
-    fp: T.BinaryIO,
-    sample: Sample,
-    construct: C.Struct | None = None,
-) -> TelemetryMeasurement | None:
-    if construct is None:
-        construct = CAMMSampleData
+# Every CAMM sample starts with 2 reserved bytes and the little-endian CAMM type
+_CAMM_SAMPLE_HEADER_SIZE = 4
+
+# Precompiled layouts of the serializable CAMM types (header skipped)
+_STRUCT_BY_CAMM_TYPE: dict[int, struct.Struct] = {
+    t.value: struct.Struct(f"<{_CAMM_SAMPLE_HEADER_SIZE}x{cls.struct_format}")
+    for t, cls in SAMPLE_ENTRY_CLS_BY_CAMM_TYPE.items()
+}
 
-    fp.seek(sample.raw_sample.offset, io.SEEK_SET)
-    data = fp.read(sample.raw_sample.size)
+# Upper bound of the contiguous sample data decoded at once
+_MAX_SAMPLE_RUN_SIZE = 1024 * 1024
+
+
+@functools.lru_cache(maxsize=64)
+def _camm_type_struct(sample_size: int) -> struct.Struct:
+    # Unpack only the CAMM type of each sample in a run of samples of this size
+    return struct.Struct(f"<2xH{sample_size - _CAMM_SAMPLE_HEADER_SIZE}x")
+
+
+def _iterate_sample_runs(
+    samples: T.Iterable[Sample],
+) -> T.Generator[list[Sample], None, None]:
+    """
+    Group consecutive samples that are adjacent in the file and of the same size,
+    so that each group can be read at once and decoded with struct.iter_unpack
+    """
+    run: list[Sample] = []
+    run_size = 0
+    for sample in samples:
+        raw_sample = sample.raw_sample
+        if run:
+            last = run[-1].raw_sample
+            if (
+                raw_sample.size == last.size
+                and raw_sample.offset == last.offset + last.size
+                and run_size < _MAX_SAMPLE_RUN_SIZE
+            ):
+                run.append(sample)
+                run_size += raw_sample.size
+                continue
+            yield run
+        run = [sample]
+        run_size = raw_sample.size
+    if run:
+        yield run
+
+
+def _decode_sample_run(
+    run: T.Sequence[Sample],
+    data: bytes,
+    sample_entry_cls_by_type: T.Mapping[int, T.Type[CAMMSampleEntry]],
+) -> T.Generator[TelemetryMeasurement, None, None]:
+    sample_size = run[0].raw_sample.size
+    if sample_size < _CAMM_SAMPLE_HEADER_SIZE:
+        raise struct.error(
+            f"CAMM sample of {sample_size} bytes is smaller than the sample header"
+        )
+
+    camm_types = [t for (t,) in _camm_type_struct(sample_size).iter_unpack(data)]
+
+    # Check the sample size before decoding any sample of the run,
+    # otherwise unpacking a truncated sample would read into the next sample
+    for camm_type in set(camm_types):
+        layout = _STRUCT_BY_CAMM_TYPE.get(camm_type)
+        if (
+            camm_type in sample_entry_cls_by_type
+            and layout is not None
+            and sample_size < layout.size
+        ):
+            raise struct.error(
+                f"CAMM sample of type {camm_type} has {sample_size} bytes but requires {layout.size} bytes"
+            )
 
-    box = construct.parse(data)
+    if len(set(camm_types)) == 1:
+        # Decode the whole run in bulk
+        SampleKlass = sample_entry_cls_by_type.get(camm_types[0])
+        layout = _STRUCT_BY_CAMM_TYPE.get(camm_types[0])
+        if SampleKlass is None or layout is None:
+            return
+        if layout.size == sample_size:
+            values: T.Iterable[tuple] = layout.iter_unpack(data)
+        else:
+            values = (
+                layout.unpack_from(data, offset)
+                for offset in range(0, len(data), sample_size)
+            )
+        deserialize = SampleKlass.deserialize
+        for sample, value in zip(run, values):
+            yield deserialize(sample, value)
+    else:
+        # Interleaved CAMM types, e.g. accelerometer and gyroscope samples
+        for idx, camm_type in enumerate(camm_types):
+            SampleKlass = sample_entry_cls_by_type.get(camm_type)
+            if SampleKlass is not None:
+                value = _STRUCT_BY_CAMM_TYPE[camm_type].unpack_from(
+                    data, idx * sample_size
+                )
+                yield SampleKlass.deserialize(run[idx], value)
 
-    # boxdata=None when the construct is unable to parse the data
-    # (CAMM type not in the switch)
-    if box.data is None:
-        return None
 
-    camm_type = CAMMType(box.type)  # type: ignore
-    SampleKlass = SAMPLE_ENTRY_CLS_BY_CAMM_TYPE.get(camm_type)
-    if SampleKlass is None:
-        return None
+def _iterate_telemetry_from_samples(
+    fp: T.BinaryIO,
+    samples: T.Iterable[Sample],
+    selected_camm_types: T.Container[CAMMType] | None = None,
+) -> T.Generator[TelemetryMeasurement, None, None]:
+    """
+    Decode the telemetry measurements of the CAMM samples in order.
+    Samples of unknown, unsupported or unselected CAMM types are skipped.
+    """
+    sample_entry_cls_by_type = {
+        t.value: cls
+        for t, cls in SAMPLE_ENTRY_CLS_BY_CAMM_TYPE.items()
+        if selected_camm_types is None or t in selected_camm_types
+    }
+
+    runs = list(_iterate_sample_runs(samples))
+    run_data = io_utils.read_ranges(
+        fp,
+        [(run[0].raw_sample.offset, run[0].raw_sample.size * len(run)) for run in runs],
+        max_gap=constants.VIDEO_TELEMETRY_READ_MAX_GAP,
+        use_mmap=constants.VIDEO_TELEMETRY_READ_MMAP,
+    )
 
-    return SampleKlass.deserialize(sample, box.data)
+    for run, data in zip(runs, run_data):
+        yield from _decode_sample_run(run, data, sample_entry_cls_by_type)
 
 
 def _filter_telemetry_by_elst_segments(
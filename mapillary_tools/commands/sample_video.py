@@ -59,6 +59,12 @@ class Command:
             default=False,
             required=False,
         )
+        group.add_argument(
+            "--num_sample_workers",
+            help="The number of videos to sample concurrently. [default: the number of CPUs divided by MAPILLARY_TOOLS_VIDEO_SAMPLE_FFMPEG_THREADS]",
+            type=int,
+            required=False,
+        )
         group.add_argument(
             "--skip_sample_errors",
             help="Skip errors from the video sampling.",
@@ -67,7 +73,7 @@ class Command:
             required=False,
         )
 
-    def run(self, vars_args: dict):
+    def normalize_import_path(self, vars_args: dict) -> Path:
         video_import_path: Path = vars_args["video_import_path"]
         import_path = vars_args["import_path"]
         if import_path is None:
@@ -80,6 +86,10 @@ class Command:
                     constants.SAMPLED_VIDEO_FRAMES_FILENAME
                 )
             vars_args["import_path"] = import_path
+        return import_path
+
+    def run(self, vars_args: dict):
+        self.normalize_import_path(vars_args)
 
         sample_video(
             **(
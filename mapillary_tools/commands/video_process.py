@@ -23,7 +23,9 @@ class Command:
 
     def run(self, args: dict):
         SampleCommand().run(args)
+        self.process_samples(args)
 
+    def process_samples(self, args: dict):
         option = "filetypes"
         if args[option] != {FileType.IMAGE}:
             LOG.warning(
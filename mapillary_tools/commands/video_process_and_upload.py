@@ -3,13 +3,25 @@
 # This source code is licensed under the BSD license found in the
 # LICENSE file in the root directory of this source tree.
 
+from __future__ import annotations
+
+import concurrent.futures
 import inspect
+import logging
+import shutil
+from pathlib import Path
 
 from ..authenticate import fetch_user_items
+from ..sample_video import find_video_sample_dirs
+from .process import bold_text
+from .sample_video import Command as SampleCommand
 from .upload import Command as UploadCommand
 from .video_process import Command as VideoProcessCommand
 
 
+LOG = logging.getLogger(__name__)
+
+
 class Command:
     name = "video_process_and_upload"
     help = "sample video into images, process the images and upload to Mapillary"
@@ -18,6 +30,15 @@ class Command:
         VideoProcessCommand().add_basic_arguments(parser)
         UploadCommand().add_basic_arguments(parser)
 
+        group = parser.add_argument_group(bold_text("VIDEO PROCESS AND UPLOAD OPTIONS"))
+        group.add_argument(
+            "--stream_video_samples",
+            help="Sample, process and upload the videos one at a time, sampling the next video while the current one is uploaded, and remove the sampled images once they are uploaded. The disk space used is bounded by the samples of two videos instead of all videos.",
+            action="store_true",
+            default=False,
+            required=False,
+        )
+
     def run(self, vars_args: dict):
         if vars_args.get("desc_path") is None:
             # \x00 is a special path similiar to /dev/null
@@ -33,5 +54,88 @@ class Command:
                 }
             )
 
-        VideoProcessCommand().run(vars_args)
-        UploadCommand().run(vars_args)
+        if vars_args.get("stream_video_samples"):
+            self._run_streaming(vars_args)
+        else:
+            VideoProcessCommand().run(vars_args)
+            UploadCommand().run(vars_args)
+
+    def _run_streaming(self, vars_args: dict):
+        import_path = SampleCommand().normalize_import_path(vars_args)
+
+        video_sample_dirs = find_video_sample_dirs(
+            vars_args["video_import_path"],
+            import_path,
+            skip_subfolders=vars_args.get("skip_subfolders", False),
+        )
+
+        # Sample the next video while the current one is processed and uploaded,
+        # so the samples of at most two videos are on disk at a time
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            pending: list[tuple[Path, Path, bool, concurrent.futures.Future]] = []
+            try:
+                for video_path, sample_dir in video_sample_dirs:
+                    pending.append(
+                        self._submit_sampling(
+                            executor, vars_args, video_path, sample_dir
+                        )
+                    )
+                    if 1 < len(pending):
+                        self._process_and_upload(vars_args, *pending.pop(0))
+                while pending:
+                    self._process_and_upload(vars_args, *pending.pop(0))
+            finally:
+                # Wait for the sampling in flight (if any) and clean it up on errors
+                for _, sample_dir, remove_samples, future in pending:
+                    future.cancel()
+                    concurrent.futures.wait([future])
+                    if remove_samples:
+                        shutil.rmtree(sample_dir, ignore_errors=True)
+
+    def _submit_sampling(
+        self,
+        executor: concurrent.futures.Executor,
+        vars_args: dict,
+        video_path: Path,
+        sample_dir: Path,
+    ) -> tuple[Path, Path, bool, concurrent.futures.Future]:
+        # Keep the samples if they were there before this run
+        remove_samples = bool(vars_args.get("rerun")) or not sample_dir.exists()
+
+        # The options are shared by all videos, but the paths are per video
+        args = dict(vars_args)
+        args["video_import_path"] = video_path
+        # The video is sampled into {import_path}/{video_path.name}, i.e. sample_dir
+        args["import_path"] = sample_dir.parent
+
+        LOG.info("==> Sampling %s", video_path)
+        future = executor.submit(SampleCommand().run, args)
+
+        return video_path, sample_dir, remove_samples, future
+
+    def _process_and_upload(
+        self,
+        vars_args: dict,
+        video_path: Path,
+        sample_dir: Path,
+        remove_samples: bool,
+        future: concurrent.futures.Future,
+    ) -> None:
+        try:
+            future.result()
+
+            if not sample_dir.is_dir():
+                # Sampling errors are skipped
+                return
+
+            LOG.info("==> Processing and uploading %s", video_path)
+            args = dict(vars_args)
+            args.pop("_metadatas_from_process", None)
+            args["video_import_path"] = video_path
+            args["import_path"] = sample_dir
+            VideoProcessCommand().process_samples(args)
+            UploadCommand().run(args)
+        finally:
+            if remove_samples:
+                LOG.debug("Removing the sample directory %s", sample_dir)
+                shutil.rmtree(sample_dir, ignore_errors=True)
@@ -92,6 +92,44 @@ VIDEO_SAMPLE_INTERVAL = float(os.getenv(_ENV_PREFIX + "VIDEO_SAMPLE_INTERVAL", -
 # In meters
 VIDEO_SAMPLE_DISTANCE = float(os.getenv(_ENV_PREFIX + "VIDEO_SAMPLE_DISTANCE", 3))
 VIDEO_DURATION_RATIO = float(os.getenv(_ENV_PREFIX + "VIDEO_DURATION_RATIO", 1))
+# How to extract the frames sampled by distance from videos:
+# "decode" decodes the whole video stream in one ffmpeg run,
+# "seek" seeks to the keyframe before each group of sampled frames and decodes from there,
+# "auto" chooses "seek" when the sampled frames are sparse enough
+VIDEO_FRAME_EXTRACTION_MODE: str = (
+    os.getenv(_ENV_PREFIX + "VIDEO_FRAME_EXTRACTION_MODE", "decode").strip().lower()
+)
+# The ffmpeg profile for sampling frames from videos: "fast", "balanced" or "archival"
+VIDEO_SAMPLE_PROFILE: str = os.getenv(_ENV_PREFIX + "VIDEO_SAMPLE_PROFILE", "balanced")
+# Pipe the sampled frames from ffmpeg and write each image once with its EXIF,
+# instead of letting ffmpeg write the images and then rewriting them with EXIF
+VIDEO_SAMPLE_PIPE: bool = _yes_or_no(os.getenv(_ENV_PREFIX + "VIDEO_SAMPLE_PIPE", "NO"))
+# Keep the WIP directory of interrupted distance sampling with a checkpoint of the sampled frames,
+# and resume sampling the video from the keyframe before the first unsampled frame in the next run
+VIDEO_SAMPLE_CHECKPOINT: bool = _yes_or_no(
+    os.getenv(_ENV_PREFIX + "VIDEO_SAMPLE_CHECKPOINT", "NO")
+)
+# Sample all video streams (e.g. front, rear and interior cameras) of a video in one ffmpeg run,
+# instead of only the stream with the maximum resolution.
+# Each stream is tagged as a separate lens so its samples are grouped into their own sequences
+VIDEO_SAMPLE_ALL_STREAMS: bool = _yes_or_no(
+    os.getenv(_ENV_PREFIX + "VIDEO_SAMPLE_ALL_STREAMS", "NO")
+)
+# Copy the sampled frames of MJPEG videos from the video files as they are,
+# instead of decoding and re-encoding them with ffmpeg (not applied to the profiles that scale frames)
+VIDEO_SAMPLE_STREAM_COPY: bool = _yes_or_no(
+    os.getenv(_ENV_PREFIX + "VIDEO_SAMPLE_STREAM_COPY", "YES")
+)
+# The number of threads each ffmpeg process decodes with when sampling videos concurrently.
+# It also decides the default number of concurrent sampling jobs (the number of CPUs divided by it)
+VIDEO_SAMPLE_FFMPEG_THREADS = int(
+    os.getenv(_ENV_PREFIX + "VIDEO_SAMPLE_FFMPEG_THREADS", 4)
+)
+# Probe the start time and streams of MP4/MOV videos from their moov boxes,
+# and fall back to ffprobe for the other containers
+VIDEO_NATIVE_PROBE: bool = _yes_or_no(
+    os.getenv(_ENV_PREFIX + "VIDEO_NATIVE_PROBE", "YES")
+)
 FFPROBE_PATH: str = os.getenv(_ENV_PREFIX + "FFPROBE_PATH", "ffprobe")
 FFMPEG_PATH: str = os.getenv(_ENV_PREFIX + "FFMPEG_PATH", "ffmpeg")
 EXIFTOOL_PATH: str = os.getenv(_ENV_PREFIX + "EXIFTOOL_PATH", "exiftool")
@@ -111,6 +149,15 @@ GOPRO_GPS_FIXES: set[int] = set(
 )
 # GPS precision, in meters, is used to filter outliers
 GOPRO_GPS_PRECISION = float(os.getenv(_ENV_PREFIX + "GOPRO_GPS_PRECISION", 15))
+# Telemetry samples (GPMF, CAMM) that are at most this far apart in a video file
+# are fetched in one read, which saves round trips on network storage
+VIDEO_TELEMETRY_READ_MAX_GAP: int | None = _parse_filesize(
+    os.getenv(_ENV_PREFIX + "VIDEO_TELEMETRY_READ_MAX_GAP", "256K")
+)
+# Read telemetry samples from memory-mapped video files (local files only)
+VIDEO_TELEMETRY_READ_MMAP: bool = _yes_or_no(
+    os.getenv(_ENV_PREFIX + "VIDEO_TELEMETRY_READ_MMAP", "NO")
+)
 MAPILLARY__EXPERIMENTAL_ENABLE_IMU: bool = _yes_or_no(
     os.getenv("MAPILLARY__EXPERIMENTAL_ENABLE_IMU", "NO")
 )
@@ -125,6 +172,11 @@ CUTOFF_DISTANCE = float(os.getenv(_ENV_PREFIX + "CUTOFF_DISTANCE", 100))
 CUTOFF_TIME = float(os.getenv(_ENV_PREFIX + "CUTOFF_TIME", 60))
 DUPLICATE_DISTANCE = float(os.getenv(_ENV_PREFIX + "DUPLICATE_DISTANCE", 0.1))
 DUPLICATE_ANGLE = float(os.getenv(_ENV_PREFIX + "DUPLICATE_ANGLE", 5))
+# Compare each image against all kept images in the sequence (not only the previous one)
+# to catch non-adjacent duplicates, e.g. GPS jitter while stopped at a traffic light
+DUPLICATE_CHECK_ALL_KEPT: bool = _yes_or_no(
+    os.getenv(_ENV_PREFIX + "DUPLICATE_CHECK_ALL_KEPT", "NO")
+)
 MAX_CAPTURE_SPEED_KMH = float(
     os.getenv(_ENV_PREFIX + "MAX_CAPTURE_SPEED_KMH", 400)
 )  # 400 KM/h
@@ -148,6 +200,16 @@ ZIGZAG_DEVIATION_THRESHOLD = float(
 )
 ZIGZAG_MIN_DEVIATIONS = int(os.getenv(_ENV_PREFIX + "ZIGZAG_MIN_DEVIATIONS", 1))
 ZIGZAG_MIN_DISTANCE = float(os.getenv(_ENV_PREFIX + "ZIGZAG_MIN_DISTANCE", 30))
+# In meters. If set, also detect zig-zags that return to an earlier image within this radius,
+# beyond ZIGZAG_WINDOW_SIZE and up to ZIGZAG_GLOBAL_WINDOW_SIZE images back
+ZIGZAG_GLOBAL_RADIUS: float | None = (
+    float(os.environ[_ENV_PREFIX + "ZIGZAG_GLOBAL_RADIUS"])
+    if os.getenv(_ENV_PREFIX + "ZIGZAG_GLOBAL_RADIUS")
+    else None
+)
+ZIGZAG_GLOBAL_WINDOW_SIZE = int(
+    os.getenv(_ENV_PREFIX + "ZIGZAG_GLOBAL_WINDOW_SIZE", 30)
+)
 
 
 ##################
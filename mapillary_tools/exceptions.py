@@ -95,6 +95,13 @@ class MapillaryDuplicationError(MapillaryDescriptionError):
         self.distance = distance
         self.angle_diff = angle_diff
 
+    def __reduce__(self):
+        # Make it picklable (e.g. when returned from worker processes)
+        return (
+            self.__class__,
+            (self.args[0], self.desc, self.distance, self.angle_diff),
+        )
+
 
 class MapillaryExifToolXMLNotFoundError(MapillaryDescriptionError):
     pass
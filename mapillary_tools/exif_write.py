@@ -166,6 +166,11 @@ class ExifEdit:
             raise ValueError("Model cannot be empty")
         self._ef["0th"][piexif.ImageIFD.Model] = model
 
+    def add_lens_serial_number(self, serial_number: str) -> None:
+        if not serial_number:
+            raise ValueError("Lens serial number cannot be empty")
+        self._ef["Exif"][piexif.ExifIFD.LensSerialNumber] = serial_number
+
     def _safe_dump(self) -> bytes:
         TRUSTED_TAGS = [
             piexif.ExifIFD.DateTimeOriginal,
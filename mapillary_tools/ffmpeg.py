@@ -6,11 +6,13 @@
 # pyre-ignore-all-errors[5, 24]
 from __future__ import annotations
 
+import contextlib
 import datetime
 import json
 import logging
 import os
 import re
+import struct
 import subprocess
 import sys
 import tempfile
@@ -38,16 +40,65 @@ class Stream(T.TypedDict):
     r_frame_rate: str
     avg_frame_rate: str
     nb_frames: str
+    start_time: str
+
+
+class Format(T.TypedDict):
+    duration: str
+    start_time: str
 
 
 class ProbeOutput(T.TypedDict):
     streams: list[Stream]
+    format: Format
 
 
 class FFmpegNotFoundError(Exception):
     pass
 
 
+class SamplingProfile(T.NamedTuple):
+    """
+    Trade-offs between the throughput of sampling frames and the quality of the frames
+    """
+
+    name: str
+
+    # JPEG quality scale from 1 (best quality, largest files) to 31
+    # see https://stackoverflow.com/a/10234065
+    qscale: int
+
+    # Downscale the frames to fit in a box of this size (in pixels) if they are larger,
+    # or None to keep the original resolution
+    max_size: int | None = None
+
+
+SAMPLING_PROFILES: dict[str, SamplingProfile] = {
+    profile.name: profile
+    for profile in [
+        SamplingProfile(name="fast", qscale=5, max_size=2048),
+        SamplingProfile(name="balanced", qscale=2),
+        SamplingProfile(name="archival", qscale=1),
+    ]
+}
+
+
+def get_sampling_profile(name: str) -> SamplingProfile:
+    """
+    >>> get_sampling_profile("balanced").qscale
+    2
+    >>> get_sampling_profile("unknown")
+    Traceback (most recent call last):
+    ValueError: Expect the sampling profile to be one of fast, balanced, archival but got unknown
+    """
+    profile = SAMPLING_PROFILES.get(name.strip().lower())
+    if profile is None:
+        raise ValueError(
+            f"Expect the sampling profile to be one of {', '.join(SAMPLING_PROFILES)} but got {name}"
+        )
+    return profile
+
+
 def _truncate_begin(s: str) -> str:
     if _MAX_STDERR_LENGTH < len(s):
         return "..." + s[-_MAX_STDERR_LENGTH:]
@@ -77,6 +128,98 @@ class FFmpegCalledProcessError(Exception):
         return msg
 
 
+class JPEGStreamSplitter:
+    """
+    Split a stream of concatenated JPEG images (e.g. ffmpeg image2pipe output) into images.
+
+    Marker segments are skipped by their lengths, so that only the EOI marker
+    in entropy-coded data ends an image, where 0xFF bytes are always followed by
+    0x00 (stuffing) or a marker.
+    """
+
+    _SOI = b"\xff\xd8"
+    _EOI = 0xD9
+    _SOS = 0xDA
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        # parse position in the buffer
+        self._pos = 0
+        # whether the position is in the entropy-coded data after SOS
+        self._in_scan = False
+
+    def feed(self, data: bytes) -> list[bytes]:
+        self._buffer.extend(data)
+
+        images: list[bytes] = []
+        while True:
+            end = self._find_image_end()
+            if end is None:
+                break
+            images.append(bytes(self._buffer[:end]))
+            del self._buffer[:end]
+            self._pos = 0
+            self._in_scan = False
+
+        return images
+
+    def pending(self) -> int:
+        """Return the number of bytes of the incomplete image"""
+        return len(self._buffer)
+
+    def _find_image_end(self) -> int | None:
+        buffer = self._buffer
+
+        if self._pos == 0:
+            if len(buffer) < 2:
+                return None
+            if buffer[:2] != self._SOI:
+                raise RuntimeError(f"Expect JPEG SOI marker but got {buffer[:2]!r}")
+            self._pos = 2
+
+        while True:
+            if self._in_scan:
+                if len(buffer) < self._pos:
+                    # The SOS segment is incomplete
+                    return None
+                idx = buffer.find(b"\xff", self._pos)
+                if idx < 0 or len(buffer) <= idx + 1:
+                    self._pos = len(buffer) if idx < 0 else idx
+                    return None
+                marker = buffer[idx + 1]
+                # Byte stuffing or restart markers (RST0-RST7)
+                if marker == 0x00 or 0xD0 <= marker <= 0xD7:
+                    self._pos = idx + 2
+                    continue
+                # A marker ends the scan, e.g. EOI or DHT between progressive scans
+                self._pos = idx
+                self._in_scan = False
+                continue
+
+            if len(buffer) < self._pos + 2:
+                return None
+            if buffer[self._pos] != 0xFF:
+                raise RuntimeError(f"Expect JPEG marker at offset {self._pos}")
+            marker = buffer[self._pos + 1]
+            if marker == 0xFF:
+                # Fill bytes
+                self._pos += 1
+                continue
+            if marker == self._EOI:
+                return self._pos + 2
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                # Standalone markers without length
+                self._pos += 2
+                continue
+
+            if len(buffer) < self._pos + 4:
+                return None
+            (length,) = struct.unpack_from(">H", buffer, self._pos + 2)
+            self._pos += 2 + length
+            if marker == self._SOS:
+                self._in_scan = True
+
+
 class FFMPEG:
     FRAME_EXT = ".jpg"
 
@@ -85,6 +228,8 @@ class FFMPEG:
         ffmpeg_path: str = "ffmpeg",
         ffprobe_path: str = "ffprobe",
         stderr: int | None = None,
+        threads: int | None = None,
+        profile: SamplingProfile | None = None,
     ) -> None:
         """
         Initialize FFMPEG wrapper with paths to ffmpeg and ffprobe binaries.
@@ -94,10 +239,15 @@ class FFMPEG:
             ffprobe_path: Path to ffprobe binary executable
             stderr: Parameter passed to subprocess.run to control stderr capture.
                    Use subprocess.PIPE to capture stderr, None to inherit from parent
+            threads: Number of threads to decode the input video with.
+                     None lets ffmpeg decide (usually all CPUs)
+            profile: Sampling profile for extracting frames. Defaults to the "balanced" profile
         """
         self.ffmpeg_path = ffmpeg_path
         self.ffprobe_path = ffprobe_path
         self.stderr = stderr
+        self.threads = threads
+        self.profile = SAMPLING_PROFILES["balanced"] if profile is None else profile
 
     def probe_format_and_streams(self, video_path: Path) -> ProbeOutput:
         """
@@ -147,29 +297,63 @@ class FFMPEG:
         self._validate_stream_specifier(stream_specifier)
 
         sample_prefix = sample_dir.joinpath(video_path.stem)
-        stream_selector = ["-map", f"0:{stream_specifier}"]
         output_template = f"{sample_prefix}_{stream_specifier}_%06d{self.FRAME_EXT}"
 
         cmd: list[str] = [
+            *self._frames_by_interval_args(
+                video_path, sample_interval, stream_specifier
+            ),
+            *self._quality_args(),
+            # Output
+            output_template,
+        ]
+
+        self.run_ffmpeg_non_interactive(cmd)
+
+    def iterate_frames_by_interval(
+        self,
+        video_path: Path,
+        sample_interval: float,
+        stream_specifier: int | str = "v",
+    ) -> T.Generator[bytes, None, None]:
+        """
+        Same as extract_frames_by_interval, but yield the JPEG frames (without EXIF)
+        piped from ffmpeg instead of writing them to files.
+
+        Raises:
+            FFmpegNotFoundError: If ffmpeg binary is not found
+            FFmpegCalledProcessError: If ffmpeg command fails
+        """
+        self._validate_stream_specifier(stream_specifier)
+
+        cmd: list[str] = [
+            *self._frames_by_interval_args(
+                video_path, sample_interval, stream_specifier
+            ),
+            *self._quality_args(),
+            *self._pipe_output_args(),
+        ]
+
+        yield from self.run_ffmpeg_pipe(cmd)
+
+    def _frames_by_interval_args(
+        self,
+        video_path: Path,
+        sample_interval: float,
+        stream_specifier: int | str,
+    ) -> list[str]:
+        return [
             # Global options should be specified first
             *["-hide_banner"],
             # Input 0
+            *self._input_threads_args(),
             *["-i", str(video_path)],
             # Select stream
-            *stream_selector,
+            *["-map", f"0:{stream_specifier}"],
             # Filter videos
-            *["-vf", f"fps=1/{sample_interval}"],
-            # Video quality level (or the alias -q:v)
-            # -q:v=1 is the best quality but larger image sizes
-            # see https://stackoverflow.com/a/10234065
-            # *["-qscale:v", "1", "-qmin", "1"],
-            *["-qscale:v", "2"],
-            # Output
-            output_template,
+            *["-vf", self._with_scale_filter(f"fps=1/{sample_interval}")],
         ]
 
-        self.run_ffmpeg_non_interactive(cmd)
-
     @classmethod
     def generate_binary_search(cls, sorted_frame_indices: list[int]) -> str:
         """
@@ -215,6 +399,8 @@ class FFMPEG:
         sample_dir: Path,
         frame_indices: set[int],
         stream_specifier: int | str = "v",
+        seek_time: float | None = None,
+        start_number: int = 1,
     ) -> None:
         """
         Extract specific frames from video by frame number using select filter.
@@ -229,6 +415,10 @@ class FFMPEG:
             stream_specifier: Stream specifier to target specific stream(s).
                               Can be an integer (stream index) or "v" (all video streams)
                               See https://ffmpeg.org/ffmpeg.html#Stream-specifiers-1
+            seek_time: If specified, seek the input to this position (in seconds,
+                       relative to the start of the video) before decoding.
+                       The frame numbers are then counted from the first frame at or after this position
+            start_number: The number of the first output file
 
         Raises:
             FFmpegNotFoundError: If ffmpeg binary is not found
@@ -245,57 +435,242 @@ class FFMPEG:
             return
 
         sample_prefix = sample_dir.joinpath(video_path.stem)
-        stream_selector = ["-map", f"0:{stream_specifier}"]
         output_template = f"{sample_prefix}_{stream_specifier}_%06d{self.FRAME_EXT}"
 
+        with self._specified_frames_args(
+            video_path, frame_indices, stream_specifier, seek_time
+        ) as args:
+            cmd: list[str] = [
+                *args,
+                *self._quality_args(),
+                # output
+                *["-start_number", str(start_number)],
+                output_template,
+            ]
+            self.run_ffmpeg_non_interactive(cmd)
+
+    def iterate_specified_frames(
+        self,
+        video_path: Path,
+        frame_indices: set[int],
+        stream_specifier: int | str = "v",
+        seek_time: float | None = None,
+    ) -> T.Generator[bytes, None, None]:
+        """
+        Same as extract_specified_frames, but yield the JPEG frames (without EXIF)
+        piped from ffmpeg in the order of the frame indices instead of writing them to files.
+
+        Raises:
+            FFmpegNotFoundError: If ffmpeg binary is not found
+            FFmpegCalledProcessError: If ffmpeg command fails
+        """
+
+        self._validate_stream_specifier(stream_specifier)
+
+        if not frame_indices:
+            return
+
+        with self._specified_frames_args(
+            video_path, frame_indices, stream_specifier, seek_time
+        ) as args:
+            cmd: list[str] = [
+                *args,
+                *self._quality_args(),
+                *self._pipe_output_args(),
+            ]
+            yield from self.run_ffmpeg_pipe(cmd)
+
+    @contextlib.contextmanager
+    def _specified_frames_args(
+        self,
+        video_path: Path,
+        frame_indices: set[int],
+        stream_specifier: int | str,
+        seek_time: float | None,
+    ) -> T.Generator[list[str], None, None]:
         eqs = self.generate_binary_search(sorted(frame_indices))
 
+        with self._filter_script(self._with_scale_filter(f"select={eqs}")) as script:
+            yield [
+                # Global options should be specified first
+                *["-hide_banner"],
+                # Input 0
+                *self._input_threads_args(),
+                # Input seeking decodes from the nearest keyframe before the position,
+                # and drops the frames before it
+                *([] if seek_time is None else ["-ss", f"{seek_time:.6f}"]),
+                *["-i", str(video_path)],
+                # Select stream
+                *["-map", f"0:{stream_specifier}"],
+                # Filter videos
+                *[
+                    *["-filter_script:v", script],
+                    # Each frame is passed with its timestamp from the demuxer to the muxer
+                    *["-vsync", "0"],
+                    # Set the number of video frames to output (this is an optimization to let ffmpeg stop early)
+                    *["-frames:v", str(len(frame_indices))],
+                ],
+            ]
+
+    def extract_frames_by_interval_from_streams(
+        self,
+        video_path: Path,
+        sample_dir: Path,
+        sample_interval: float,
+        stream_specifiers: T.Sequence[int | str],
+    ) -> None:
+        """
+        Same as extract_frames_by_interval, but decode all the specified streams in one ffmpeg run.
+        The frames of each stream are written to their own files, i.e.
+        {video_stem}_{stream_specifier}_{frame_idx:06d}.jpg
+
+        Args:
+            stream_specifiers: Indices of the video streams to extract frames from
+
+        Raises:
+            FFmpegNotFoundError: If ffmpeg binary is not found
+            FFmpegCalledProcessError: If ffmpeg command fails
+        """
+        self._extract_frames_from_streams(
+            video_path,
+            sample_dir,
+            {
+                str(stream_specifier): f"fps=1/{sample_interval}"
+                for stream_specifier in stream_specifiers
+            },
+        )
+
+    def extract_specified_frames_from_streams(
+        self,
+        video_path: Path,
+        sample_dir: Path,
+        frame_indices_by_stream: T.Mapping[int | str, set[int]],
+    ) -> None:
+        """
+        Same as extract_specified_frames, but decode all the specified streams in one ffmpeg run,
+        with a select filter for each stream.
+        The frames of each stream are written to their own files, i.e.
+        {video_stem}_{stream_specifier}_{frame_idx:06d}.jpg
+
+        Args:
+            frame_indices_by_stream: Frame numbers (0-based) to extract from each video stream,
+                                     keyed by the stream index
+
+        Raises:
+            FFmpegNotFoundError: If ffmpeg binary is not found
+            FFmpegCalledProcessError: If ffmpeg command fails
+        """
+        filters: dict[str, str] = {}
+        frame_counts: dict[str, int] = {}
+        for stream_specifier, frame_indices in frame_indices_by_stream.items():
+            if not frame_indices:
+                continue
+            eqs = self.generate_binary_search(sorted(frame_indices))
+            filters[str(stream_specifier)] = f"select={eqs}"
+            frame_counts[str(stream_specifier)] = len(frame_indices)
+
+        if not filters:
+            return
+
+        self._extract_frames_from_streams(
+            video_path, sample_dir, filters, frame_counts=frame_counts
+        )
+
+    def _extract_frames_from_streams(
+        self,
+        video_path: Path,
+        sample_dir: Path,
+        filters: dict[str, str],
+        frame_counts: dict[str, int] | None = None,
+    ) -> None:
+        for stream_specifier in filters:
+            self._validate_stream_specifier(stream_specifier)
+            if not stream_specifier.isdigit():
+                # Each output needs exactly one stream
+                raise ValueError(
+                    f"Expect a stream index but got stream specifier: {stream_specifier}"
+                )
+
+        # Decode each stream once and filter it into its own output
+        filter_graph = ";".join(
+            f"[0:{stream_specifier}]{self._with_scale_filter(stream_filters)}[s{stream_specifier}]"
+            for stream_specifier, stream_filters in filters.items()
+        )
+
+        sample_prefix = sample_dir.joinpath(video_path.stem)
+
+        with self._filter_script(filter_graph) as script:
+            cmd: list[str] = [
+                # Global options should be specified first
+                *["-hide_banner"],
+                # Input 0
+                *self._input_threads_args(),
+                *["-i", str(video_path)],
+                # Filter videos
+                *["-filter_complex_script", script],
+                # Each frame is passed with its timestamp from the demuxer to the muxer
+                *([] if frame_counts is None else ["-vsync", "0"]),
+            ]
+            # Outputs
+            for stream_specifier in filters:
+                cmd.extend(["-map", f"[s{stream_specifier}]"])
+                if frame_counts is not None:
+                    cmd.extend(["-frames:v", str(frame_counts[stream_specifier])])
+                cmd.extend(self._quality_args())
+                cmd.append(f"{sample_prefix}_{stream_specifier}_%06d{self.FRAME_EXT}")
+
+            self.run_ffmpeg_non_interactive(cmd)
+
+    @contextlib.contextmanager
+    def _filter_script(self, filters: str) -> T.Generator[str, None, None]:
+        """
+        Write the filters to a temp file and yield its path
+        """
         # https://github.com/mapillary/mapillary_tools/issues/503
         if sys.platform in ["win32"]:
             delete = False
         else:
             delete = True
 
-        # Write the select filter to a temp file because:
+        # Write the filters to a temp file because:
         # The select filter could be large and
         # the maximum command line length for the CreateProcess function is 32767 characters
         # https://devblogs.microsoft.com/oldnewthing/20031210-00/?p=41553
-        with tempfile.NamedTemporaryFile(mode="w+", delete=delete) as select_file:
+        with tempfile.NamedTemporaryFile(mode="w+", delete=delete) as script_file:
             try:
-                select_file.write(f"select={eqs}")
-                select_file.flush()
+                script_file.write(filters)
+                script_file.flush()
                 # If not close, error "The process cannot access the file because it is being used by another process"
                 if not delete:
-                    select_file.close()
-                cmd: list[str] = [
-                    # Global options should be specified first
-                    *["-hide_banner"],
-                    # Input 0
-                    *["-i", str(video_path)],
-                    # Select stream
-                    *stream_selector,
-                    # Filter videos
-                    *[
-                        *["-filter_script:v", select_file.name],
-                        # Each frame is passed with its timestamp from the demuxer to the muxer
-                        *["-vsync", "0"],
-                        # Set the number of video frames to output (this is an optimization to let ffmpeg stop early)
-                        *["-frames:v", str(len(frame_indices))],
-                    ],
-                    # Video quality level (or the alias -q:v)
-                    # see https://stackoverflow.com/a/10234065
-                    *["-qscale:v", "2"],
-                    # output
-                    output_template,
-                ]
-                self.run_ffmpeg_non_interactive(cmd)
+                    script_file.close()
+                yield script_file.name
             finally:
                 if not delete:
                     try:
-                        os.remove(select_file.name)
+                        os.remove(script_file.name)
                     except FileNotFoundError:
                         pass
 
+    def _quality_args(self) -> list[str]:
+        # Video quality level (or the alias -q:v)
+        # see https://stackoverflow.com/a/10234065
+        args = ["-qscale:v", str(self.profile.qscale)]
+        if self.profile.qscale < 2:
+            # The default qmin 2 caps the quality otherwise
+            args.extend(["-qmin", str(self.profile.qscale)])
+        return args
+
+    def _with_scale_filter(self, filters: str) -> str:
+        max_size = self.profile.max_size
+        if max_size is None:
+            return filters
+        # Scale the frames after selecting them, and never upscale
+        return f"{filters},scale='min({max_size},iw)':'min({max_size},ih)':force_original_aspect_ratio=decrease"
+
+    def _pipe_output_args(self) -> list[str]:
+        # Concatenated JPEG images written to stdout
+        return ["-f", "image2pipe", "-c:v", "mjpeg", "pipe:1"]
+
     @classmethod
     def sort_selected_samples(
         cls,
@@ -417,6 +792,75 @@ class FFMPEG:
         except subprocess.CalledProcessError as ex:
             raise FFmpegCalledProcessError(ex) from ex
 
+    def run_ffmpeg_pipe(
+        self, cmd: list[str], chunk_size: int = 1024 * 1024
+    ) -> T.Generator[bytes, None, None]:
+        """
+        Execute ffmpeg command in non-interactive mode, and yield the JPEG images
+        it writes to stdout one by one.
+
+        Args:
+            cmd: List of command line arguments to pass to ffmpeg, which outputs to pipe:1
+            chunk_size: Number of bytes to read from stdout at a time
+
+        Raises:
+            FFmpegNotFoundError: If ffmpeg binary is not found
+            FFmpegCalledProcessError: If ffmpeg command fails
+        """
+        full_cmd: list[str] = [self.ffmpeg_path, "-nostdin", *cmd]
+        LOG.info(f"Running ffmpeg: {' '.join(full_cmd)}")
+
+        # Spool the captured stderr to a file, because reading stderr and stdout
+        # from the same thread deadlocks when the stderr pipe is full
+        with contextlib.ExitStack() as stack:
+            if self.stderr == subprocess.PIPE:
+                stderr: T.Any = stack.enter_context(tempfile.TemporaryFile())
+            else:
+                stderr = self.stderr
+
+            try:
+                proc = subprocess.Popen(full_cmd, stdout=subprocess.PIPE, stderr=stderr)
+            except FileNotFoundError:
+                raise FFmpegNotFoundError(
+                    f'The ffmpeg command "{self.ffmpeg_path}" not found'
+                )
+
+            with proc:
+                assert proc.stdout is not None
+                splitter = JPEGStreamSplitter()
+                try:
+                    while True:
+                        chunk = proc.stdout.read(chunk_size)
+                        if not chunk:
+                            break
+                        yield from splitter.feed(chunk)
+                finally:
+                    # The consumer may stop early
+                    if proc.poll() is None:
+                        proc.kill()
+
+                returncode = proc.wait()
+
+            if returncode != 0:
+                captured: bytes | None = None
+                if stderr is not self.stderr:
+                    stderr.seek(0)
+                    captured = stderr.read()
+                raise FFmpegCalledProcessError(
+                    subprocess.CalledProcessError(returncode, full_cmd, stderr=captured)
+                )
+
+            if splitter.pending():
+                raise RuntimeError(
+                    f"Incomplete JPEG image at the end of the ffmpeg output ({splitter.pending()} bytes)"
+                )
+
+    def _input_threads_args(self) -> list[str]:
+        # -threads before -i applies to the decoder of the input
+        if self.threads is None:
+            return []
+        return ["-threads", str(self.threads)]
+
     @classmethod
     def _extract_stream_frame_idx(
         cls, sample_basename: str, pattern: T.Pattern[str]
@@ -584,6 +1028,34 @@ class Probe:
             return None
         return video_streams[0]
 
+    def probe_stream_start_offset(self, stream: Stream) -> float:
+        """
+        Calculate the start time of a stream relative to the start time of the container.
+
+        Input seeking (-ss) positions are relative to the start time of the container,
+        so a frame presented at T seconds in the stream is at T + offset for seeking.
+
+        Args:
+            stream: Stream dictionary from the probe output
+
+        Returns:
+            Offset in seconds, or 0 if the start times are not available
+        """
+        container_start_time = self.probe_output.get("format", {}).get("start_time")
+        try:
+            return float(stream.get("start_time", 0)) - float(container_start_time or 0)
+        except ValueError:
+            # ffprobe reports "N/A" for unknown values
+            return 0.0
+
+    @classmethod
+    def is_jpeg_stream(cls, stream: Stream) -> bool:
+        """
+        Check if each frame of the video stream is a JPEG image (Motion JPEG),
+        i.e. the frames can be written to image files without decoding and encoding
+        """
+        return stream.get("codec_name") == "mjpeg"
+
     @classmethod
     def extract_stream_start_time(cls, stream: Stream) -> datetime.datetime | None:
         """
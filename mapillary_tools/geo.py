@@ -7,6 +7,7 @@
 from __future__ import annotations
 
 import bisect
+import copy
 import dataclasses
 import datetime
 import itertools
@@ -97,6 +98,185 @@ def gps_distance(latlon_1: tuple[float, float], latlon_2: tuple[float, float]) -
     return math.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2 + (z1 - z2) ** 2)
 
 
+ECEF = T.Tuple[float, float, float]
+
+
+def ecef_from_latlons(lats: T.Iterable[float], lons: T.Iterable[float]) -> list[ECEF]:
+    """
+    Batch version of _ecef_from_lla2. Convert each point to ECEF once and
+    reuse the results with ecef_distance() instead of calling gps_distance()
+    repeatedly on the same points.
+
+    >>> ecef_from_latlons([0], [0]) == [_ecef_from_lla2(0, 0)]
+    True
+    """
+    a_sq, b_sq = WGS84_a_SQ, WGS84_b_SQ
+    radians, sin, cos, sqrt = math.radians, math.sin, math.cos, math.sqrt
+
+    ecefs: list[ECEF] = []
+    for lat, lon in zip(lats, lons):
+        lat = radians(lat)
+        lon = radians(lon)
+        cos_lat = cos(lat)
+        sin_lat = sin(lat)
+        L = 1.0 / sqrt(a_sq * cos_lat**2 + b_sq * sin_lat**2)
+        K = a_sq * L * cos_lat
+        ecefs.append((K * cos(lon), K * sin(lon), b_sq * L * sin_lat))
+    return ecefs
+
+
+def ecef_distance(ecef_1: ECEF, ecef_2: ECEF) -> float:
+    """
+    Distance between two ECEF points, i.e. gps_distance() without the conversions.
+
+    >>> p1, p2 = ecef_from_latlons([42.1, 42.2], [-11.1, -11.3])
+    >>> ecef_distance(p1, p2) == gps_distance((42.1, -11.1), (42.2, -11.3))
+    True
+    """
+    x1, y1, z1 = ecef_1
+    x2, y2, z2 = ecef_2
+    return math.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2 + (z1 - z2) ** 2)
+
+
+def gps_distances(lats: T.Sequence[float], lons: T.Sequence[float]) -> list[float]:
+    """
+    Distances between consecutive (lat, lon) pairs, i.e.
+    [gps_distance(p0, p1), gps_distance(p1, p2), ...], with each point converted once.
+
+    >>> gps_distances([42.1, 42.2, 42.2], [-11.1, -11.3, -11.3])[1]
+    0.0
+    >>> gps_distances([42.1], [-11.1])
+    []
+    """
+    ecefs = ecef_from_latlons(lats, lons)
+    return [ecef_distance(cur, nxt) for cur, nxt in pairwise(ecefs)]
+
+
+def bearings(lats: T.Sequence[float], lons: T.Sequence[float]) -> list[float]:
+    """
+    Compass bearings between consecutive (lat, lon) pairs, i.e.
+    [compute_bearing(p0, p1), compute_bearing(p1, p2), ...],
+    with the trigonometry of each point computed once.
+
+    >>> bearings([0, 0, 1], [0, 1, 1])
+    [90.0, 0.0]
+    """
+    radians, sin, cos, atan2, degrees = (
+        math.radians,
+        math.sin,
+        math.cos,
+        math.atan2,
+        math.degrees,
+    )
+    pi = math.pi
+
+    rad_lats = [radians(lat) for lat in lats]
+    rad_lons = [radians(lon) for lon in lons]
+    sin_lats = [sin(lat) for lat in rad_lats]
+    cos_lats = [cos(lat) for lat in rad_lats]
+
+    output: list[float] = []
+    for sin_lat1, cos_lat1, lon1, sin_lat2, cos_lat2, lon2 in zip(
+        sin_lats, cos_lats, rad_lons, sin_lats[1:], cos_lats[1:], rad_lons[1:]
+    ):
+        dLong = lon2 - lon1
+
+        if abs(dLong) > pi:
+            if dLong > 0.0:
+                dLong = -(2.0 * pi - dLong)
+            else:
+                dLong = 2.0 * pi + dLong
+
+        y = sin(dLong) * cos_lat2
+        x = cos_lat1 * sin_lat2 - sin_lat1 * cos_lat2 * cos(dLong)
+        output.append((degrees(atan2(y, x)) + 360.0) % 360.0)
+
+    return output
+
+
+class ECEFIndex:
+    """
+    Spatial hash index of ECEF points for radius queries.
+
+    Points are bucketed into cubic cells of cell_size meters, so a radius query
+    only visits the cells that overlap the bounding box of the query sphere,
+    instead of computing distances to all points.
+
+    >>> index = ECEFIndex(cell_size=10)
+    >>> ecefs = ecef_from_latlons([0, 0, 0.01], [0, 0.00005, 0])
+    >>> for key, ecef in enumerate(ecefs):
+    ...     index.add(key, ecef)
+    >>> [key for key, _ in index.query_radius(ecefs[0], 10)]
+    [0, 1]
+    >>> [key for key, _ in index.query_radius(ecefs[0], 2000)]
+    [0, 1, 2]
+    >>> index.remove(1, ecefs[1])
+    >>> [key for key, _ in index.query_radius(ecefs[0], 2000)]
+    [0, 2]
+    """
+
+    cell_size: float
+    cells: dict[tuple[int, ...], list[tuple[int, ECEF]]]
+
+    def __init__(self, cell_size: float):
+        if not (0 < cell_size):
+            raise ValueError(f"Expect positive cell size but got {cell_size}")
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def _cell_of(self, ecef: ECEF) -> tuple[int, int, int]:
+        x, y, z = ecef
+        return (
+            math.floor(x / self.cell_size),
+            math.floor(y / self.cell_size),
+            math.floor(z / self.cell_size),
+        )
+
+    def add(self, key: int, ecef: ECEF) -> None:
+        self.cells.setdefault(self._cell_of(ecef), []).append((key, ecef))
+
+    def remove(self, key: int, ecef: ECEF) -> None:
+        """
+        Remove the point added with the key and ECEF, e.g. to keep only a sliding window of points
+        """
+        cell = self._cell_of(ecef)
+        bucket = self.cells[cell]
+        bucket.remove((key, ecef))
+        if not bucket:
+            del self.cells[cell]
+
+    def query_radius(self, ecef: ECEF, radius: float) -> list[tuple[int, float]]:
+        """
+        Return (key, distance) of the points within the radius (inclusive), sorted by key
+        """
+        x, y, z = ecef
+        min_cell = self._cell_of((x - radius, y - radius, z - radius))
+        max_cell = self._cell_of((x + radius, y + radius, z + radius))
+
+        ranges = [range(lo, hi + 1) for lo, hi in zip(min_cell, max_cell)]
+
+        buckets: T.Iterable[list[tuple[int, ECEF]]]
+        if len(self.cells) < math.prod(len(r) for r in ranges):
+            # The query covers more cells than occupied: scan the occupied ones
+            buckets = (
+                bucket
+                for cell, bucket in self.cells.items()
+                if all(c in r for c, r in zip(cell, ranges))
+            )
+        else:
+            buckets = (self.cells.get(cell, []) for cell in itertools.product(*ranges))
+
+        found: list[tuple[int, float]] = []
+        for bucket in buckets:
+            for key, other in bucket:
+                distance = ecef_distance(ecef, other)
+                if distance <= radius:
+                    found.append((key, distance))
+
+        found.sort()
+        return found
+
+
 def avg_speed(sequence: T.Sequence[PointLike]) -> float:
     """
     Calculate average speed over a sequence of points.
@@ -109,9 +289,9 @@ def avg_speed(sequence: T.Sequence[PointLike]) -> float:
     if len(sequence) < 2:
         return 0.0
 
-    total_distance = 0.0
-    for cur, nxt in pairwise(sequence):
-        total_distance += gps_distance((cur.lat, cur.lon), (nxt.lat, nxt.lon))
+    total_distance = sum(
+        gps_distances([p.lat for p in sequence], [p.lon for p in sequence])
+    )
 
     first = sequence[0]
     last = sequence[-1]
@@ -243,6 +423,9 @@ class Interpolator(T.Generic[PointLike]):
     """
     Interpolator for interpolating a sequence of timestamps incrementally.
     Preserves the type of input points (Point, GPSPoint, or CAMMGPSPoint).
+
+    Besides the incremental interpolate(), it supports random access in O(log n)
+    with interpolate_at(), and batches with interpolate_many().
     """
 
     tracks: T.Sequence[T.Sequence[PointLike]]
@@ -250,6 +433,10 @@ class Interpolator(T.Generic[PointLike]):
     # interpolation starts from the lower bound point index in the current track
     lo: int
     prev_time: float | None
+    # point times of each track, for bisecting
+    track_times: list[list[float]]
+    # running max of the track end times, for bisecting the track of a time
+    max_end_times: list[float]
 
     def __init__(self, tracks: T.Sequence[T.Sequence[PointLike]]):
         # Remove empty tracks
@@ -270,6 +457,11 @@ class Interpolator(T.Generic[PointLike]):
         self.lo = 0
         self.prev_time = None
 
+        self.track_times = [[p.time for p in track] for track in self.tracks]
+        self.max_end_times = list(
+            itertools.accumulate((track[-1].time for track in self.tracks), max)
+        )
+
     @staticmethod
     def _lsearch_left(
         track: T.Sequence[PointLike], t: float, lo: int = 0, hi: int | None = None
@@ -327,6 +519,36 @@ class Interpolator(T.Generic[PointLike]):
 
         return interpolated
 
+    def interpolate_at(self, t: float) -> PointLike:
+        """
+        Interpolate at any time t in O(log n), regardless of the previous times.
+        It gives the same result as interpolate() but does not change its state.
+        """
+        # interpolate() picks the first track that has not ended before t
+        track_idx = bisect.bisect_left(self.max_end_times, t)
+
+        if len(self.tracks) <= track_idx:
+            return _interpolate_at_segment_idx(self.tracks[-1], t, len(self.tracks[-1]))
+
+        idx = bisect.bisect_left(self.track_times[track_idx], t)
+        return _interpolate_at_segment_idx(self.tracks[track_idx], t, idx)
+
+    def interpolate_many(self, times: T.Sequence[float]) -> list[PointLike]:
+        """
+        Interpolate a batch of times. Sorted times are merge-joined with the tracks
+        in a single pass, i.e. O(n + m); unsorted times are bisected, i.e. O(m log n).
+        It does not change the state of interpolate().
+        """
+        if all(cur <= nxt for cur, nxt in pairwise(times)):
+            # Merge with a fresh cursor that shares the tracks
+            cursor = copy.copy(self)
+            cursor.track_idx = 0
+            cursor.lo = 0
+            cursor.prev_time = None
+            return [cursor.interpolate(t) for t in times]
+        else:
+            return [self.interpolate_at(t) for t in times]
+
 
 _T = T.TypeVar("_T")
 
@@ -336,22 +558,22 @@ def sample_points_by_distance(
     min_distance: float,
     point_func: T.Callable[[_T], Point],
 ) -> T.Generator[_T, None, None]:
-    prevp: Point | None = None
+    # Keep the ECEF of the previously yielded point so that each sample is converted once
+    prev_ecef: ECEF | None = None
     for sample in samples:
-        if prevp is None:
+        p = point_func(sample)
+        [ecef] = ecef_from_latlons([p.lat], [p.lon])
+        if prev_ecef is None or min_distance < ecef_distance(prev_ecef, ecef):
             yield sample
-            prevp = point_func(sample)
-        else:
-            p = point_func(sample)
-            if min_distance < gps_distance((prevp.lat, prevp.lon), (p.lat, p.lon)):
-                yield sample
-                prevp = p
+            prev_ecef = ecef
 
 
 def interpolate_directions_if_none(sequence: T.Sequence[PointLike]) -> None:
-    for cur, nex in pairwise(sequence):
-        if cur.angle is None:
-            cur.angle = compute_bearing((cur.lat, cur.lon), (nex.lat, nex.lon))
+    if any(p.angle is None for p in sequence[:-1]):
+        interpolated = bearings([p.lat for p in sequence], [p.lon for p in sequence])
+        for cur, angle in zip(sequence, interpolated):
+            if cur.angle is None:
+                cur.angle = angle
 
     if len(sequence) == 1:
         if sequence[-1].angle is None:
@@ -44,6 +44,7 @@ class GeotagImagesFromGPX(GeotagImagesFromGeneric):
         self,
         image_metadata: types.ImageMetadata,
         sorted_points: T.Sequence[geo.Point],
+        interpolator: geo.Interpolator | None = None,
     ) -> types.ImageMetadata:
         assert sorted_points, "must have at least one point"
 
@@ -73,7 +74,12 @@ class GeotagImagesFromGPX(GeotagImagesFromGeneric):
                     gpx_end_time=gpx_end_time,
                 )
 
-        interpolated = geo.interpolate(sorted_points, image_metadata.time)
+        if interpolator is None:
+            interpolated = geo.interpolate(sorted_points, image_metadata.time)
+        else:
+            # Images are interpolated in time order, so the interpolator
+            # advances along the points incrementally instead of searching them per image
+            interpolated = interpolator.interpolate(image_metadata.time)
 
         return dataclasses.replace(
             image_metadata,
@@ -148,11 +154,13 @@ class GeotagImagesFromGPX(GeotagImagesFromGeneric):
                 # TODO: this time modification seems to affect final capture times
                 image_metadata.time += image_time_offset
 
+        interpolator = geo.Interpolator([sorted_points]) if sorted_points else None
+
         for image_metadata in sorted_image_metadatas:
             try:
                 final_metadatas.append(
                     self._interpolate_image_metadata_along(
-                        image_metadata, sorted_points
+                        image_metadata, sorted_points, interpolator=interpolator
                     )
                 )
             except exceptions.MapillaryOutsideGPXTrackError as ex:
@@ -7,14 +7,19 @@ from __future__ import annotations
 
 import dataclasses
 import datetime
-import io
 import itertools
+import struct
 import typing as T
 
 import construct as C
 
-from .. import telemetry
-from ..mp4.mp4_sample_parser import MovieBoxParser, Sample, TrackBoxParser
+from .. import constants, telemetry
+from ..mp4.mp4_sample_parser import (
+    iterate_read_sample_data,
+    MovieBoxParser,
+    Sample,
+    TrackBoxParser,
+)
 
 """
 Parsing GPS from GPMF data format stored in GoPros. See the GPMF spec: https://github.com/gopro/gpmf-parser
@@ -134,6 +139,131 @@ KLV = C.Struct(
 GPMFSampleData = C.GreedyRange(KLV)
 
 
+# type char: struct format of a single value, which decodes the same as _type_mapping
+_struct_format_mapping = {
+    b"b": "b",
+    b"B": "B",
+    b"d": "d",
+    b"f": "f",
+    b"F": "4s",
+    b"G": "16s",
+    b"j": "q",
+    b"J": "Q",
+    b"l": "i",
+    b"L": "I",
+    b"q": "I",
+    b"Q": "Q",
+    b"s": "h",
+    b"S": "H",
+    b"U": "16s",
+}
+
+
+_KLV_HEADER = struct.Struct(">4scBH")
+
+
+# (type char, number of values per structure) -> struct that decodes one structure
+_structure_structs: dict[tuple[bytes, int], struct.Struct] = {}
+
+
+def _get_structure_struct(type_char: bytes, count: int) -> struct.Struct:
+    found = _structure_structs.get((type_char, count))
+    if found is None:
+        found = struct.Struct(">" + _struct_format_mapping[type_char] * count)
+        _structure_structs[(type_char, count)] = found
+    return found
+
+
+def _decode_klv_data(
+    type_char: bytes, structure_size: int, repeat: int, data: memoryview
+) -> list[T.Any]:
+    if type_char in _struct_format_mapping and type_char != b"c":
+        _, size = _type_mapping[type_char]
+        count = structure_size // size
+        if count == 0:
+            # Structures too small for a value decode to empty values, as with construct
+            return [() for _ in range(repeat)]
+        if count * size == structure_size:
+            return list(_get_structure_struct(type_char, count).iter_unpack(data))
+        # The structure has padding bytes that are not part of the values
+        structure = _get_structure_struct(type_char, count)
+        return [
+            structure.unpack_from(data, idx * structure_size) for idx in range(repeat)
+        ]
+
+    # c-style strings, complex types (?), and unknown types are kept as bytes per structure
+    return [
+        bytes(data[idx * structure_size : (idx + 1) * structure_size])
+        for idx in range(repeat)
+    ]
+
+
+def _contains_keys(data: memoryview, keys: T.Container[bytes]) -> bool:
+    """
+    Check if any top-level KLV in the GPMF data has one of the keys, without decoding the values
+    """
+    offset = 0
+    while offset + _KLV_HEADER.size <= len(data):
+        key, _, structure_size, repeat = _KLV_HEADER.unpack_from(data, offset)
+        if key in keys:
+            return True
+        data_size = structure_size * repeat
+        offset += _KLV_HEADER.size + data_size + (-data_size % 4)
+    return False
+
+
+def _parse_gpmf_sample_data(
+    data: bytes | memoryview, stream_keys: T.Container[bytes] | None = None
+) -> list[KLVDict]:
+    """
+    Parse GPMF data into KLVDicts like GPMFSampleData.parse, but walk the KLV headers directly
+    and bulk-decode the values with struct, which is much faster than construct.
+
+    Numeric values are decoded as tuples (one per structure) instead of lists.
+    If stream_keys is specified, the STRM that contain none of the keys are not decoded (empty data).
+    Like GreedyRange, parsing stops at the first KLV that exceeds the data.
+    """
+    view = memoryview(data)
+    klvs: list[KLVDict] = []
+
+    offset = 0
+    while offset + _KLV_HEADER.size <= len(view):
+        key, type_char, structure_size, repeat = _KLV_HEADER.unpack_from(view, offset)
+        data_size = structure_size * repeat
+        data_offset = offset + _KLV_HEADER.size
+        next_offset = data_offset + data_size + (-data_size % 4)
+        if len(view) < next_offset:
+            break
+
+        klv_data = view[data_offset : data_offset + data_size]
+        if type_char == b"\x00":
+            if (
+                key == b"STRM"
+                and stream_keys is not None
+                and not _contains_keys(klv_data, stream_keys)
+            ):
+                values: list[T.Any] = []
+            else:
+                values = T.cast(
+                    T.List[T.Any], _parse_gpmf_sample_data(klv_data, stream_keys)
+                )
+        else:
+            values = _decode_klv_data(type_char, structure_size, repeat, klv_data)
+
+        klvs.append(
+            {
+                "key": key,
+                "type": type_char,
+                "structure_size": structure_size,
+                "repeat": repeat,
+                "data": values,
+            }
+        )
+        offset = next_offset
+
+    return klvs
+
+
 @dataclasses.dataclass
 class GoProInfo:
     # None indicates the data has been extracted,
@@ -153,7 +283,8 @@ def extract_gopro_info(
     Return the GoProInfo object if found. None indicates it's not a valid GoPro video.
     """
 
-    moov = MovieBoxParser.parse_stream(fp)
+    # Only the gpmd track is needed, so skip reading the video and audio tracks
+    moov = MovieBoxParser.parse_stream(fp, sample_formats={b"gpmd"})
     for track in moov.extract_tracks():
         if _contains_gpmd_description(track):
             gpmd_samples = _filter_gpmd_samples(track)
@@ -376,18 +507,19 @@ def _gps9_from_stream(
         )
 
     try:
-        sample_parser = C.Sequence(
-            *[
+        sample_parser = struct.Struct(
+            ">"
+            + "".join(
                 # Changed in version 3.11: Added default argument values for length and byteorder
-                _type_mapping[t.to_bytes(length=1, byteorder="big")][0]
+                _struct_format_mapping[t.to_bytes(length=1, byteorder="big")]
                 for t in gps_value_types
-            ]
+            )
         )
     except Exception as ex:
         raise ValueError(f"Error parsing the complex type {gps_value_types!r}: {ex}")
 
     for sample_data_bytes in gps9:
-        sample_data = sample_parser.parse(sample_data_bytes)
+        sample_data = sample_parser.unpack_from(T.cast(bytes, sample_data_bytes))
 
         (
             lat,
@@ -569,6 +701,28 @@ _XYZDataT = T.TypeVar(
 )
 
 
+def _xyz_telemetry_from_device(
+    device_data: T.Sequence[KLVDict],
+    sample: Sample,
+    stream_key: bytes,
+    data_class: T.Type[_XYZDataT],
+) -> list[_XYZDataT]:
+    """Extract XYZ telemetry (ACCL/GYRO/MAGN) from a device with timestamps interpolated within the sample."""
+    samples = _find_first_telemetry_stream(device_data, stream_key)
+    if not samples:
+        return []
+    avg_delta = sample.exact_timedelta / len(samples)
+    return [
+        data_class(
+            time=sample.exact_time + avg_delta * idx,
+            x=x,
+            y=y,
+            z=z,
+        )
+        for idx, (z, x, y, *_) in enumerate(samples)
+    ]
+
+
 def _accumulate_xyz_telemetry(
     device_data: T.Sequence[KLVDict],
     sample: Sample,
@@ -578,17 +732,72 @@ def _accumulate_xyz_telemetry(
     device_id: int,
 ) -> None:
     """Extract XYZ telemetry (ACCL/GYRO/MAGN) from a device and accumulate into output_dict."""
-    samples = _find_first_telemetry_stream(device_data, stream_key)
-    if samples:
-        avg_delta = sample.exact_timedelta / len(samples)
-        output_dict.setdefault(device_id, []).extend(
-            data_class(
-                time=sample.exact_time + avg_delta * idx,
-                x=x,
-                y=y,
-                z=z,
-            )
-            for idx, (z, x, y, *_) in enumerate(samples)
+    measurements = _xyz_telemetry_from_device(
+        device_data, sample, stream_key, data_class
+    )
+    if measurements:
+        output_dict.setdefault(device_id, []).extend(measurements)
+
+
+_XYZ_STREAMS: list[tuple[bytes, type[telemetry.TimestampedMeasurement]]] = [
+    (b"ACCL", telemetry.AccelerationData),
+    (b"GYRO", telemetry.GyroscopeData),
+    (b"MAGN", telemetry.MagnetometerData),
+]
+
+
+def iterate_gopro_imu_telemetry(
+    fp: T.BinaryIO,
+) -> T.Generator[telemetry.TimestampedMeasurement, None, None]:
+    """
+    Yield the ACCL, GYRO and MAGN measurements sorted by time, one GPMF sample at a time,
+    so the memory usage does not grow with the video length.
+
+    The measurements are the same as extract_gopro_info(fp, telemetry_only=True) extracts,
+    i.e. for each stream only those from the first device that has it.
+    """
+    moov = MovieBoxParser.parse_stream(fp, sample_formats={b"gpmd"})
+    for track in moov.extract_tracks():
+        if _contains_gpmd_description(track):
+            break
+    else:
+        return
+
+    stream_keys = {key for key, _ in _XYZ_STREAMS}
+    # stream key -> the device ID that the stream is read from
+    device_ids: dict[bytes, int] = {}
+
+    for sample, sample_data in iterate_read_sample_data(
+        fp,
+        _filter_gpmd_samples(track),
+        max_gap=constants.VIDEO_TELEMETRY_READ_MAX_GAP,
+        use_mmap=constants.VIDEO_TELEMETRY_READ_MMAP,
+    ):
+        try:
+            gpmf_sample_data = _parse_gpmf_sample_data(sample_data, stream_keys)
+        except (struct.error, ValueError):
+            # Skip the malformed sample
+            continue
+
+        measurements_by_stream: dict[bytes, list[telemetry.TimestampedMeasurement]]
+        measurements_by_stream = {key: [] for key, _ in _XYZ_STREAMS}
+        for device in (klv for klv in gpmf_sample_data if klv["key"] == b"DEVC"):
+            device_id = _find_first_device_id(device["data"])
+            for stream_key, data_class in _XYZ_STREAMS:
+                if device_ids.get(stream_key, device_id) != device_id:
+                    continue
+                xyz = _xyz_telemetry_from_device(
+                    device["data"], sample, stream_key, T.cast(T.Any, data_class)
+                )
+                if xyz:
+                    device_ids[stream_key] = device_id
+                    measurements_by_stream[stream_key].extend(xyz)
+
+        # Measurements of a sample are all before those of the next sample,
+        # so sorting per sample sorts them all
+        yield from sorted(
+            itertools.chain.from_iterable(measurements_by_stream.values()),
+            key=lambda m: m.time,
         )
 
 
@@ -626,10 +835,27 @@ def _load_telemetry_from_samples(
 ) -> bool:
     device_found: bool = False
 
-    for sample, sample_data in _iterate_read_sample_data(fp, samples):
+    # Only decode the streams in use
+    stream_keys: set[bytes] = set()
+    if points_by_dvid is not None:
+        stream_keys.update([b"GPS5", b"GPS9"])
+    if accls_by_dvid is not None:
+        stream_keys.add(b"ACCL")
+    if gyros_by_dvid is not None:
+        stream_keys.add(b"GYRO")
+    if magns_by_dvid is not None:
+        stream_keys.add(b"MAGN")
+
+    for sample, sample_data in iterate_read_sample_data(
+        fp,
+        samples,
+        max_gap=constants.VIDEO_TELEMETRY_READ_MAX_GAP,
+        use_mmap=constants.VIDEO_TELEMETRY_READ_MMAP,
+    ):
         try:
-            gpmf_sample_data = T.cast(T.Dict, GPMFSampleData.parse(sample_data))
-        except C.ConstructError:
+            gpmf_sample_data = _parse_gpmf_sample_data(sample_data, stream_keys)
+        except (struct.error, ValueError):
+            # Skip the malformed sample
             continue
 
         # iterate devices
@@ -731,11 +957,3 @@ def _extract_camera_model_from_devices(device_names: dict[int, bytes]) -> str:
             return unicode_name.strip()
 
     return unicode_names[0].strip()
-
-
-def _iterate_read_sample_data(
-    fp: T.BinaryIO, samples: T.Iterable[Sample]
-) -> T.Generator[tuple[Sample, bytes], None, None]:
-    for sample in samples:
-        fp.seek(sample.raw_sample.offset, io.SEEK_SET)
-        yield (sample, fp.read(sample.raw_sample.size))
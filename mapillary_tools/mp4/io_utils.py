@@ -3,7 +3,10 @@
 # This source code is licensed under the BSD license found in the
 # LICENSE file in the root directory of this source tree.
 
+from __future__ import annotations
+
 import io
+import mmap
 import typing as T
 
 
@@ -180,3 +183,99 @@ class SlicedIO(io.IOBase):
             raise IOError("invalid whence")
         self._rel_offset = new_offset
         return self._rel_offset
+
+
+# (offset, size)
+ByteRange = tuple[int, int]
+
+
+class CoalescedRead(T.NamedTuple):
+    offset: int
+    size: int
+    # indices of the byte ranges covered by this read
+    range_indices: list[int]
+
+
+def plan_coalesced_reads(
+    ranges: T.Sequence[ByteRange],
+    max_gap: int | None = 0,
+    max_read_size: int = 16 * 1024 * 1024,
+) -> list[CoalescedRead]:
+    """
+    Sort the byte ranges by offset and merge them into reads, if the gap between two ranges
+    is at most max_gap bytes (None for no limit) and the merged read is at most max_read_size bytes
+    (unless a single range is larger).
+
+    >>> plan_coalesced_reads([(10, 5), (0, 5), (16, 4), (100, 1)], max_gap=1)
+    [CoalescedRead(offset=0, size=5, range_indices=[1]), CoalescedRead(offset=10, size=10, range_indices=[0, 2]), CoalescedRead(offset=100, size=1, range_indices=[3])]
+    >>> plan_coalesced_reads([(10, 5), (0, 5), (16, 4), (100, 1)], max_gap=None, max_read_size=20)
+    [CoalescedRead(offset=0, size=20, range_indices=[1, 0, 2]), CoalescedRead(offset=100, size=1, range_indices=[3])]
+    """
+    reads: list[CoalescedRead] = []
+
+    for idx in sorted(range(len(ranges)), key=lambda idx: ranges[idx][0]):
+        offset, size = ranges[idx]
+        if reads:
+            last = reads[-1]
+            end = max(last.offset + last.size, offset + size)
+            if (max_gap is None or offset - (last.offset + last.size) <= max_gap) and (
+                end - last.offset <= max_read_size
+            ):
+                last.range_indices.append(idx)
+                reads[-1] = last._replace(size=end - last.offset)
+                continue
+        reads.append(CoalescedRead(offset=offset, size=size, range_indices=[idx]))
+
+    return reads
+
+
+def _open_mmap(fp: T.BinaryIO) -> mmap.mmap | None:
+    try:
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (io.UnsupportedOperation, AttributeError, OSError, ValueError):
+        # Not a real file (e.g. BytesIO), or an empty file that can not be mapped
+        return None
+
+
+def read_ranges(
+    fp: T.BinaryIO,
+    ranges: T.Sequence[ByteRange],
+    max_gap: int | None = 0,
+    max_read_size: int = 16 * 1024 * 1024,
+    use_mmap: bool = False,
+) -> T.Generator[bytes, None, None]:
+    """
+    Read the byte ranges from the stream and yield the data in the order of the ranges.
+
+    Nearby ranges are merged into larger reads (see plan_coalesced_reads) to reduce
+    seeks and small reads, which are expensive on network storage. Data read ahead of
+    the range order is buffered until yielded.
+
+    If use_mmap is set and the stream is a local file, the ranges are sliced from a
+    memory map of the file instead.
+
+    >>> list(read_ranges(io.BytesIO(b"helloworld"), [(5, 5), (0, 5), (8, 10)]))
+    [b'world', b'hello', b'ld']
+    """
+    if use_mmap:
+        mm = _open_mmap(fp)
+        if mm is not None:
+            with mm:
+                for offset, size in ranges:
+                    yield mm[offset : offset + size]
+            return
+
+    pending: dict[int, bytes] = {}
+    next_idx = 0
+    for read in plan_coalesced_reads(
+        ranges, max_gap=max_gap, max_read_size=max_read_size
+    ):
+        fp.seek(read.offset, io.SEEK_SET)
+        buf = memoryview(fp.read(read.size))
+        for idx in read.range_indices:
+            offset, size = ranges[idx]
+            begin = offset - read.offset
+            pending[idx] = bytes(buf[begin : begin + size])
+        while next_idx in pending:
+            yield pending.pop(next_idx)
+            next_idx += 1
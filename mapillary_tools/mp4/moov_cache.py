@@ -0,0 +1,200 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the BSD license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+import collections
+import io
+import os
+import stat
+import threading
+import typing as T
+
+from . import simple_mp4_parser as sparser
+
+
+class FileKey(T.NamedTuple):
+    # device and inode identify the file regardless of the path it is opened with
+    device: int
+    inode: int
+    size: int
+    mtime_ns: int
+    # the stream position the moov box is searched from
+    position: int
+
+
+def stream_file_key(stream: T.BinaryIO) -> FileKey | None:
+    """
+    Return the key that identifies the current content of the file behind the stream,
+    or None if the stream is not backed by a regular file (e.g. BytesIO or pipes)
+    """
+    try:
+        st = os.fstat(stream.fileno())
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+    if not stat.S_ISREG(st.st_mode):
+        return None
+
+    return FileKey(
+        device=st.st_dev,
+        inode=st.st_ino,
+        size=st.st_size,
+        mtime_ns=st.st_mtime_ns,
+        position=stream.tell(),
+    )
+
+
+def extract_trak_sample_formats(stream: T.BinaryIO, maxsize: int) -> list[bytes]:
+    """
+    Return the formats of the sample entries of the trak box data in the stream,
+    without parsing the sample tables or the entries
+    """
+    formats: list[bytes] = []
+    parsed = sparser.parse_path(
+        stream, [b"mdia", b"minf", b"stbl", b"stsd"], maxsize=maxsize, depth=1
+    )
+    for header, box in parsed:
+        stsd = box.read(header.maxsize)
+        # skip version (1) + flags (3) + entry_count (4)
+        formats.extend(
+            entry_header.type
+            for entry_header, _ in sparser.parse_boxes(
+                io.BytesIO(stsd[8:]), maxsize=max(0, len(stsd) - 8)
+            )
+        )
+    return formats
+
+
+class MoovChild(T.NamedTuple):
+    type: bytes
+    # the range of the box (including its header) in the moov box data
+    offset: int
+    size: int
+    # the sample formats of the trak box, empty for other boxes
+    sample_formats: tuple[bytes, ...]
+
+
+class CachedMoov(T.NamedTuple):
+    """
+    The moov box data and the index of its children boxes
+    """
+
+    data: bytes
+    children: tuple[MoovChild, ...]
+
+    @classmethod
+    def from_data(cls, data: bytes) -> CachedMoov:
+        children: list[MoovChild] = []
+        stream = io.BytesIO(data)
+        for header, box in sparser.parse_boxes(
+            stream, maxsize=len(data), extend_eof=False
+        ):
+            data_offset = box.tell()
+            sample_formats: tuple[bytes, ...] = ()
+            if header.type == b"trak":
+                sample_formats = tuple(extract_trak_sample_formats(box, header.maxsize))
+            children.append(
+                MoovChild(
+                    type=header.type,
+                    offset=data_offset - header.header_size,
+                    size=header.box_size,
+                    sample_formats=sample_formats,
+                )
+            )
+        return cls(data=data, children=tuple(children))
+
+    def select_data(self, sample_formats: T.Container[bytes]) -> bytes:
+        """
+        Return the moov box data with only the trak boxes that contain any of the sample formats
+        """
+        return b"".join(
+            self.data[child.offset : child.offset + child.size]
+            for child in self.children
+            if child.type != b"trak"
+            or any(f in sample_formats for f in child.sample_formats)
+        )
+
+
+class MoovCache:
+    """
+    An in-memory LRU cache of the moov boxes of video files, indexed by their children boxes,
+    so that each video is scanned for its moov box only once per process, no matter how many
+    extractors, samplers and uploaders in the process parse it. Worker processes
+    (e.g. of utils.mp_map_maybe) have their own caches.
+
+    Entries are keyed by the file identity, size and modification time,
+    so a modified file is read again.
+    """
+
+    _entries: collections.OrderedDict[FileKey, CachedMoov]
+
+    def __init__(self, maxsize: int):
+        """
+        maxsize is the total size (in bytes) of the moov data to keep in memory,
+        and 0 disables the cache
+        """
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def read_moov(self, stream: T.BinaryIO) -> CachedMoov | None:
+        """
+        Read the moov box from the current position of the stream, or from the cache.
+
+        Return None if the stream can not be cached, or the moov box is larger than the cache,
+        in which case the stream is rewound and the caller reads it instead
+        (e.g. only the tracks it needs).
+        """
+        if self.maxsize <= 0:
+            return None
+
+        key = stream_file_key(stream)
+        if key is None:
+            return None
+
+        with self._lock:
+            moov = self._entries.get(key)
+            if moov is not None:
+                self._entries.move_to_end(key)
+                return moov
+
+        for header, box in sparser.parse_path(stream, [b"moov"]):
+            # A negative maxsize means the box extends to the end of the file
+            if header.maxsize < 0 or self.maxsize < header.maxsize:
+                break
+            moov = CachedMoov.from_data(box.read(header.maxsize))
+            with self._lock:
+                self._put(key, moov)
+            return moov
+        else:
+            raise sparser.BoxNotFoundError("unable find box at path [b'moov']")
+
+        stream.seek(key.position, io.SEEK_SET)
+        return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _put(self, key: FileKey, moov: CachedMoov) -> None:
+        if self.maxsize < len(moov.data) or key in self._entries:
+            return
+
+        self._entries[key] = moov
+        self._size += len(moov.data)
+
+        while self.maxsize < self._size:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.data)
+
+
+# Shared by all parsers in the process
+MOOV_CACHE = MoovCache(maxsize=64 * 1024 * 1024)
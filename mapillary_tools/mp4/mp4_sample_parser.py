@@ -5,19 +5,21 @@
 
 from __future__ import annotations
 
+import bisect
+import contextlib
 import datetime
+import io
+import itertools
+import struct
 import typing as T
 from pathlib import Path
 
-from . import construct_mp4_parser as cparser, simple_mp4_parser as sparser
-
-
-def _convert_to_signed_int32(unsigned_int32: int) -> int:
-    """Interpret an unsigned 32-bit value as negative if high bit is set."""
-    if (unsigned_int32 & (1 << 31)) == 0:
-        return unsigned_int32
-    else:
-        return unsigned_int32 - (1 << 32)
+from . import (
+    construct_mp4_parser as cparser,
+    io_utils,
+    moov_cache,
+    simple_mp4_parser as sparser,
+)
 
 
 class RawSample(T.NamedTuple):
@@ -60,93 +62,13 @@ class Sample(T.NamedTuple):
     description: dict
 
 
-def _extract_raw_samples(
-    sizes: T.Sequence[int],
-    chunk_entries: T.Sequence[dict],
-    chunk_offsets: T.Sequence[int],
-    timedeltas: T.Sequence[int],
-    composition_offsets: list[int] | None,
-    syncs: set[int] | None,
-) -> T.Generator[RawSample, None, None]:
-    if not sizes:
-        return
-
-    if not chunk_entries:
-        return
-
-    assert len(sizes) <= len(timedeltas), (
-        f"got less ({len(timedeltas)}) sample time deltas (stts) than expected ({len(sizes)})"
-    )
-
-    sample_idx = 0
-    chunk_idx = 0
-
-    # iterate compressed chunks
-    for entry_idx, entry in enumerate(chunk_entries):
-        if entry_idx + 1 < len(chunk_entries):
-            nbr_chunks = (
-                chunk_entries[entry_idx + 1]["first_chunk"] - entry["first_chunk"]
-            )
-        else:
-            nbr_chunks = 1
-
-        # iterate chunks
-        for _ in range(nbr_chunks):
-            sample_offset = chunk_offsets[chunk_idx]
-            # iterate samples in this chunk
-            for _ in range(entry["samples_per_chunk"]):
-                is_sync = syncs is None or (sample_idx + 1) in syncs
-                composition_offset = (
-                    composition_offsets[sample_idx]
-                    if composition_offsets is not None
-                    else 0
-                )
-                yield RawSample(
-                    description_idx=entry["sample_description_index"],
-                    offset=sample_offset,
-                    size=sizes[sample_idx],
-                    timedelta=timedeltas[sample_idx],
-                    composition_offset=composition_offset,
-                    is_sync=is_sync,
-                )
-                sample_offset += sizes[sample_idx]
-                sample_idx += 1
-            chunk_idx += 1
-
-    # below handles the single-entry case:
-    # If all the chunks have the same number of samples per chunk
-    # and use the same sample description, this table has one entry.
-
-    # iterate chunks
-    while sample_idx < len(sizes):
-        sample_offset = chunk_offsets[chunk_idx]
-        # iterate samples in this chunk
-        for _ in range(chunk_entries[-1]["samples_per_chunk"]):
-            is_sync = syncs is None or (sample_idx + 1) in syncs
-            composition_offset = (
-                composition_offsets[sample_idx]
-                if composition_offsets is not None
-                else 0
-            )
-            yield RawSample(
-                description_idx=chunk_entries[-1]["sample_description_index"],
-                offset=sample_offset,
-                size=sizes[sample_idx],
-                timedelta=timedeltas[sample_idx],
-                composition_offset=composition_offset,
-                is_sync=is_sync,
-            )
-            sample_offset += sizes[sample_idx]
-            sample_idx += 1
-        chunk_idx += 1
-
-
 def _extract_samples(
     raw_samples: T.Iterator[RawSample],
     descriptions: list,
     timescale: int,
+    decode_time: int = 0,
 ) -> T.Generator[Sample, None, None]:
-    acc_delta = 0
+    acc_delta = decode_time
     for raw_sample in raw_samples:
         yield Sample(
             raw_sample=raw_sample,
@@ -165,68 +87,623 @@ STBLBoxlistConstruct = cparser.Box64ConstructBuilder(
 ).BoxList
 
 
+class _RunLengthTable:
+    """
+    A table of (sample_count, value) runs, e.g. stts or ctts entries,
+    that maps sample indices to values without expanding the runs
+
+    >>> table = _RunLengthTable([(2, 5), (0, 9), (1, 7)])
+    >>> [table.value_at(idx) for idx in range(4)]
+    [5, 5, 7, 0]
+    >>> [table.sum_before(idx) for idx in range(5)]
+    [0, 5, 10, 17, 17]
+    >>> list(itertools.islice(table, 5))
+    [5, 5, 7, 0, 0]
+    """
+
+    def __init__(self, runs: T.Sequence[tuple[int, int]]):
+        self.runs = runs
+        # index of the first sample of each run
+        self.starts = list(itertools.accumulate((c for c, _ in runs), initial=0))
+        # sum of values before the first sample of each run
+        self.sums = list(itertools.accumulate((c * v for c, v in runs), initial=0))
+
+    def _run_at(self, sample_idx: int) -> int:
+        return bisect.bisect_right(self.starts, sample_idx) - 1
+
+    def value_at(self, sample_idx: int) -> int:
+        run_idx = self._run_at(sample_idx)
+        if run_idx < len(self.runs):
+            return self.runs[run_idx][1]
+        # samples not covered by the runs
+        return 0
+
+    def sum_before(self, sample_idx: int) -> int:
+        run_idx = self._run_at(sample_idx)
+        if run_idx < len(self.runs):
+            return (
+                self.sums[run_idx]
+                + (sample_idx - self.starts[run_idx]) * self.runs[run_idx][1]
+            )
+        return self.sums[-1]
+
+    def __iter__(self) -> T.Iterator[int]:
+        # Samples not covered by the runs get 0's
+        return itertools.chain(
+            itertools.chain.from_iterable(
+                itertools.repeat(value, count) for count, value in self.runs
+            ),
+            itertools.repeat(0),
+        )
+
+
+class _ChunkRun(T.NamedTuple):
+    # 0-based index of the first sample in the run
+    first_sample_idx: int
+    # 0-based index of the first chunk in the run
+    first_chunk_idx: int
+    nbr_chunks: int
+    samples_per_chunk: int
+    # 1-based index
+    description_idx: int
+
+
+class SampleTable:
+    """
+    A lazy view of a sample table (stbl).
+
+    Only the box headers are scanned on construction. Sample sizes and chunk offsets are
+    read in place from the box data, and the run-length encoded tables (stts, ctts, stsc)
+    are decoded as runs without being expanded per sample. Counting samples or accessing
+    a single sample by index does not decode the whole table.
+    """
+
+    def __init__(self, stbl: bytes):
+        self._stbl = stbl
+        # box type -> (data offset, data size)
+        self._boxes: dict[bytes, tuple[int, int]] = {}
+        for header, box in sparser.parse_boxes(io.BytesIO(stbl), maxsize=len(stbl)):
+            self._boxes[header.type] = (box.tell(), header.maxsize)
+
+        self._constant_size, self._size_count = self._parse_stsz_header()
+        self._chunk_offset_format, self._chunk_offsets = self._find_chunk_offsets()
+        self._chunk_runs = self._parse_chunk_runs()
+        self._chunk_run_starts = [run.first_sample_idx for run in self._chunk_runs]
+
+        self._len = 0
+        if self._chunk_runs:
+            last = self._chunk_runs[-1]
+            self._len = min(
+                self._size_count,
+                last.first_sample_idx + last.nbr_chunks * last.samples_per_chunk,
+            )
+
+        # decoded on demand
+        self._timedeltas: _RunLengthTable | None = None
+        self._composition_offsets: _RunLengthTable | None = None
+        self._syncs: set[int] | None = None
+        self._syncs_decoded = False
+        self._descriptions: list[dict] | None = None
+
+    def _find_entries(
+        self, box_type: bytes, entry_format: str, count_offset: int = 4
+    ) -> memoryview | None:
+        """
+        Return the entries (not decoded) that follow the entry count in a full box,
+        or None if the box is not found
+        """
+        found = self._boxes.get(box_type)
+        if found is None:
+            return None
+        offset, size = found
+        entry_size = struct.calcsize(entry_format)
+        start = offset + count_offset + 4
+        (count,) = struct.unpack_from(">I", self._stbl, start - 4)
+        count = min(count, max(0, offset + size - start) // entry_size)
+        return memoryview(self._stbl)[start : start + count * entry_size]
+
+    def _parse_stsz_header(self) -> tuple[int, int]:
+        found = self._boxes.get(b"stsz")
+        if found is None:
+            return 0, 0
+        offset, size = found
+        # version (1) + flags (3) + sample_size (4) + sample_count (4)
+        sample_size, sample_count = struct.unpack_from(">II", self._stbl, offset + 4)
+        if sample_size == 0:
+            # If sample_size is 0, then the samples have different sizes stored in the table
+            sample_count = min(sample_count, max(0, size - 12) // 4)
+        return sample_size, sample_count
+
+    def _find_chunk_offsets(self) -> tuple[str, memoryview]:
+        for box_type, entry_format in [(b"co64", ">Q"), (b"stco", ">I")]:
+            entries = self._find_entries(box_type, entry_format)
+            if entries is not None:
+                return entry_format, entries
+        return ">I", memoryview(b"")
+
+    def _parse_chunk_runs(self) -> list[_ChunkRun]:
+        stsc = self._find_entries(b"stsc", ">III")
+        if stsc is None:
+            return []
+        entries = list(struct.iter_unpack(">III", stsc))
+
+        remaining_chunks = len(self._chunk_offsets) // struct.calcsize(
+            self._chunk_offset_format
+        )
+        runs: list[_ChunkRun] = []
+        sample_idx = 0
+        chunk_idx = 0
+        for entry_idx, (first_chunk, samples_per_chunk, description_idx) in enumerate(
+            entries
+        ):
+            if entry_idx + 1 < len(entries):
+                nbr_chunks = max(0, entries[entry_idx + 1][0] - first_chunk)
+            else:
+                # If all the chunks have the same number of samples per chunk
+                # and use the same sample description, this table has one entry,
+                # i.e. the last entry applies to all the remaining chunks
+                nbr_chunks = remaining_chunks
+            nbr_chunks = min(nbr_chunks, remaining_chunks)
+            runs.append(
+                _ChunkRun(
+                    first_sample_idx=sample_idx,
+                    first_chunk_idx=chunk_idx,
+                    nbr_chunks=nbr_chunks,
+                    samples_per_chunk=samples_per_chunk,
+                    description_idx=description_idx,
+                )
+            )
+            sample_idx += nbr_chunks * samples_per_chunk
+            chunk_idx += nbr_chunks
+            remaining_chunks -= nbr_chunks
+
+        return runs
+
+    @property
+    def timedeltas(self) -> _RunLengthTable:
+        if self._timedeltas is None:
+            entries = self._find_entries(b"stts", ">II")
+            self._timedeltas = _RunLengthTable(
+                [] if entries is None else list(struct.iter_unpack(">II", entries))
+            )
+        return self._timedeltas
+
+    @property
+    def composition_offsets(self) -> _RunLengthTable:
+        if self._composition_offsets is None:
+            # Some encodings like H.264 and H.265 support negative offsets.
+            # We cannot rely on the version field since some encoders incorrectly set
+            # ctts version to 0 instead of 1 even when using signed offsets.
+            # Leigitimate positive values are relatively small so we can assume the value is signed.
+            entries = self._find_entries(b"ctts", ">Ii")
+            self._composition_offsets = _RunLengthTable(
+                [] if entries is None else list(struct.iter_unpack(">Ii", entries))
+            )
+        return self._composition_offsets
+
+    @property
+    def syncs(self) -> set[int] | None:
+        """
+        1-based indices of sync samples, or None if every sample is a sync sample
+        """
+        if not self._syncs_decoded:
+            entries = self._find_entries(b"stss", ">I")
+            if entries is not None:
+                self._syncs = {idx for (idx,) in struct.iter_unpack(">I", entries)}
+            self._syncs_decoded = True
+        return self._syncs
+
+    def _sum_sizes(self, start: int, stop: int) -> int:
+        if self._constant_size:
+            return self._constant_size * (stop - start)
+        offset, _ = self._boxes[b"stsz"]
+        return sum(
+            struct.unpack_from(f">{stop - start}I", self._stbl, offset + 12 + 4 * start)
+        )
+
+    def _iter_sizes(self) -> T.Iterator[int]:
+        if self._constant_size:
+            return itertools.repeat(self._constant_size)
+        entries = self._find_entries(b"stsz", ">I", count_offset=8)
+        assert entries is not None
+        return (size for (size,) in struct.iter_unpack(">I", entries))
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, sample_idx: int) -> RawSample:
+        if sample_idx < 0:
+            sample_idx += self._len
+        if not (0 <= sample_idx < self._len):
+            raise IndexError(
+                f"sample index {sample_idx} out of range (length {self._len})"
+            )
+
+        run = self._chunk_runs[
+            bisect.bisect_right(self._chunk_run_starts, sample_idx) - 1
+        ]
+        chunk_idx, idx_in_chunk = divmod(
+            sample_idx - run.first_sample_idx, run.samples_per_chunk
+        )
+        (chunk_offset,) = struct.unpack_from(
+            self._chunk_offset_format,
+            self._chunk_offsets,
+            (run.first_chunk_idx + chunk_idx)
+            * struct.calcsize(self._chunk_offset_format),
+        )
+        syncs = self.syncs
+        return RawSample(
+            description_idx=run.description_idx,
+            offset=chunk_offset
+            + self._sum_sizes(sample_idx - idx_in_chunk, sample_idx),
+            size=self._sum_sizes(sample_idx, sample_idx + 1),
+            timedelta=self.timedeltas.value_at(sample_idx),
+            composition_offset=self.composition_offsets.value_at(sample_idx),
+            is_sync=syncs is None or (sample_idx + 1) in syncs,
+        )
+
+    def decode_time(self, sample_idx: int) -> int:
+        """
+        Return the decoding time of the sample, i.e. DT(n) in the timescale of the media
+        """
+        return self.timedeltas.sum_before(sample_idx)
+
+    def composition_times(self) -> list[int]:
+        """
+        Return the composition time of each sample, i.e. CT(n) = DT(n) + CTTS(n)
+        in the timescale of the media, without reading the other fields of the samples
+        """
+        decode_times = itertools.accumulate(self.timedeltas, initial=0)
+        return [
+            decode_time + composition_offset
+            for decode_time, composition_offset in zip(
+                itertools.islice(decode_times, self._len), self.composition_offsets
+            )
+        ]
+
+    def sample_at(self, sample_idx: int, timescale: int) -> Sample:
+        """
+        Random access to the sample at the index, with times in seconds
+        """
+        raw_sample = self[sample_idx]
+        if sample_idx < 0:
+            sample_idx += self._len
+        decode_time = self.decode_time(sample_idx)
+        return Sample(
+            raw_sample=raw_sample,
+            description=self.extract_descriptions()[raw_sample.description_idx - 1],
+            exact_time=decode_time / timescale,
+            exact_timedelta=raw_sample.timedelta / timescale,
+            exact_composition_time=(decode_time + raw_sample.composition_offset)
+            / timescale,
+        )
+
+    def __iter__(self) -> T.Generator[RawSample, None, None]:
+        if not self._len:
+            return
+
+        sizes = self._iter_sizes()
+        timedeltas = iter(self.timedeltas)
+        composition_offsets = iter(self.composition_offsets)
+        chunk_offsets = struct.iter_unpack(
+            self._chunk_offset_format, self._chunk_offsets
+        )
+        syncs = self.syncs
+
+        sample_idx = 0
+        for run in self._chunk_runs:
+            for _ in range(run.nbr_chunks):
+                (sample_offset,) = next(chunk_offsets)
+                for _ in range(run.samples_per_chunk):
+                    if self._len <= sample_idx:
+                        return
+                    size = next(sizes)
+                    yield RawSample(
+                        description_idx=run.description_idx,
+                        offset=sample_offset,
+                        size=size,
+                        timedelta=next(timedeltas),
+                        composition_offset=next(composition_offsets),
+                        is_sync=syncs is None or (sample_idx + 1) in syncs,
+                    )
+                    sample_offset += size
+                    sample_idx += 1
+
+    def extract_descriptions(self) -> list[dict]:
+        if self._descriptions is None:
+            found = self._boxes.get(b"stsd")
+            if found is None:
+                self._descriptions = []
+            else:
+                offset, size = found
+                data = cparser.SampleDescriptionBox.parse(
+                    self._stbl[offset : offset + size]
+                )
+                self._descriptions = list(data["entries"])
+        return self._descriptions
+
+
 def extract_raw_samples_from_stbl_data(
     stbl: bytes,
 ) -> tuple[list[dict], T.Generator[RawSample, None, None]]:
-    descriptions: list[dict] = []
-    sizes: list[int] = []
-    chunk_offsets: list[int] = []
-    chunk_entries: list[dict] = []
-    timedeltas: list[int] = []
-    composition_offsets: list[int] | None = None
-    syncs: set[int] | None = None
-
-    stbl_children = T.cast(
-        T.Sequence[cparser.BoxDict], STBLBoxlistConstruct.parse(stbl)
-    )
+    table = SampleTable(stbl)
+    return table.extract_descriptions(), iter(table)
 
-    for box in stbl_children:
-        data: dict = T.cast(dict, box["data"])
 
-        if box["type"] == b"stsd":
-            descriptions = list(data["entries"])
-        elif box["type"] == b"stsz":
-            if data["sample_size"] == 0:
-                sizes = list(data["entries"])
-            else:
-                sizes = [data["sample_size"] for _ in range(data["sample_count"])]
-        elif box["type"] == b"stco":
-            chunk_offsets = list(data["entries"])
-        elif box["type"] == b"co64":
-            chunk_offsets = list(data["entries"])
-        elif box["type"] == b"stsc":
-            chunk_entries = list(data["entries"])
-        elif box["type"] == b"stts":
-            timedeltas = []
-            for entry in data["entries"]:
-                for _ in range(entry["sample_count"]):
-                    timedeltas.append(entry["sample_delta"])
-        elif box["type"] == b"ctts":
-            composition_offsets = []
-            for entry in data["entries"]:
-                for _ in range(entry["sample_count"]):
-                    # Some encodings like H.264 and H.265 support negative offsets.
-                    # We cannot rely on the version field since some encoders incorrectly set
-                    # ctts version to 0 instead of 1 even when using signed offsets.
-                    # Leigitimate positive values are relatively small so we can assume the value is signed.
-                    composition_offsets.append(
-                        _convert_to_signed_int32(entry["sample_offset"])
-                    )
-        elif box["type"] == b"stss":
-            syncs = set(data["entries"])
-
-    # some stbl have less timedeltas than the sample count i.e. len(sizes),
-    # in this case append 0's to timedeltas
-    while len(timedeltas) < len(sizes):
-        timedeltas.append(0)
-    if composition_offsets is not None:
-        while len(composition_offsets) < len(sizes):
-            composition_offsets.append(0)
-
-    raw_samples = _extract_raw_samples(
-        sizes, chunk_entries, chunk_offsets, timedeltas, composition_offsets, syncs
-    )
-    return descriptions, raw_samples
+# Movie fragments (ISO/IEC 14496-12 8.8)
+
+# tfhd flags
+_TFHD_BASE_DATA_OFFSET_PRESENT = 0x000001
+_TFHD_SAMPLE_DESCRIPTION_INDEX_PRESENT = 0x000002
+_TFHD_DEFAULT_SAMPLE_DURATION_PRESENT = 0x000008
+_TFHD_DEFAULT_SAMPLE_SIZE_PRESENT = 0x000010
+_TFHD_DEFAULT_SAMPLE_FLAGS_PRESENT = 0x000020
+_TFHD_DEFAULT_BASE_IS_MOOF = 0x020000
+
+# trun flags
+_TRUN_DATA_OFFSET_PRESENT = 0x000001
+_TRUN_FIRST_SAMPLE_FLAGS_PRESENT = 0x000004
+_TRUN_SAMPLE_DURATION_PRESENT = 0x000100
+_TRUN_SAMPLE_SIZE_PRESENT = 0x000200
+_TRUN_SAMPLE_FLAGS_PRESENT = 0x000400
+_TRUN_SAMPLE_COMPOSITION_TIME_OFFSET_PRESENT = 0x000800
+
+# sample_is_non_sync_sample in sample flags
+_SAMPLE_IS_NON_SYNC_SAMPLE = 0x010000
+
+_UINT32 = struct.Struct(">I")
+_UINT64 = struct.Struct(">Q")
+_INT32 = struct.Struct(">i")
+# version, flags, track_ID, default_sample_description_index,
+# default_sample_duration, default_sample_size, default_sample_flags
+_TREX = struct.Struct(">4xIIIII")
+
+
+class TrackFragmentDefaults(T.NamedTuple):
+    """
+    Default values of the samples in movie fragments, from the trex box in moov/mvex
+    """
+
+    # 1-based index
+    sample_description_index: int = 1
+    sample_duration: int = 0
+    sample_size: int = 0
+    sample_flags: int = 0
+
+
+class TrackFragment(T.NamedTuple):
+    # baseMediaDecodeTime from tfdt, None if tfdt is absent
+    base_media_decode_time: int | None
+    raw_samples: list[RawSample]
+
+
+def _iterate_box_data_ranges(
+    data: bytes,
+) -> T.Generator[tuple[bytes, int, int], None, None]:
+    # (box type, data offset, data size) of the boxes in data
+    for header, box in sparser.parse_boxes(io.BytesIO(data), maxsize=len(data)):
+        yield header.type, box.tell(), header.maxsize
+
+
+def _parse_version_and_flags(data: bytes, offset: int) -> tuple[int, int]:
+    (version_and_flags,) = _UINT32.unpack_from(data, offset)
+    return version_and_flags >> 24, version_and_flags & 0xFFFFFF
+
+
+def parse_trex_defaults(mvex_data: bytes) -> dict[int, TrackFragmentDefaults]:
+    """
+    Parse the trex boxes in the mvex box data into defaults by track_ID
+    """
+    defaults: dict[int, TrackFragmentDefaults] = {}
+    for box_type, offset, size in _iterate_box_data_ranges(mvex_data):
+        if box_type == b"trex" and _TREX.size <= size:
+            track_ID, *values = _TREX.unpack_from(mvex_data, offset)
+            defaults[track_ID] = TrackFragmentDefaults(*values)
+    return defaults
+
+
+def _parse_trun(
+    trun: bytes,
+    base_data_offset: int,
+    data_offset: int,
+    description_idx: int,
+    defaults: TrackFragmentDefaults,
+) -> list[RawSample]:
+    """
+    Parse the samples of the track run. The data offset of the run, if specified,
+    is relative to base_data_offset of the track fragment, otherwise the sample data
+    starts at data_offset.
+    """
+    version, flags = _parse_version_and_flags(trun, 0)
+    (sample_count,) = _UINT32.unpack_from(trun, 4)
+    pos = 8
+
+    if flags & _TRUN_DATA_OFFSET_PRESENT:
+        data_offset = _INT32.unpack_from(trun, pos)[0] + base_data_offset
+        pos += 4
+
+    first_sample_flags: int | None = None
+    if flags & _TRUN_FIRST_SAMPLE_FLAGS_PRESENT:
+        (first_sample_flags,) = _UINT32.unpack_from(trun, pos)
+        pos += 4
+
+    # optional per-sample fields in order: duration, size, flags, composition offset
+    field_format = ""
+    for field_flag in [
+        _TRUN_SAMPLE_DURATION_PRESENT,
+        _TRUN_SAMPLE_SIZE_PRESENT,
+        _TRUN_SAMPLE_FLAGS_PRESENT,
+    ]:
+        if flags & field_flag:
+            field_format += "I"
+    if flags & _TRUN_SAMPLE_COMPOSITION_TIME_OFFSET_PRESENT:
+        # version 1 allows negative composition offsets
+        field_format += "i" if version else "I"
+
+    if field_format:
+        entry = struct.Struct(f">{field_format}")
+        end = min(len(trun), pos + entry.size * sample_count)
+        end -= (end - pos) % entry.size
+        entries: T.Iterable[tuple] = entry.iter_unpack(trun[pos:end])
+    else:
+        entries = itertools.repeat((), sample_count)
+
+    raw_samples: list[RawSample] = []
+    for idx, fields in enumerate(entries):
+        field_idx = 0
+        duration = defaults.sample_duration
+        if flags & _TRUN_SAMPLE_DURATION_PRESENT:
+            duration = fields[field_idx]
+            field_idx += 1
+        size = defaults.sample_size
+        if flags & _TRUN_SAMPLE_SIZE_PRESENT:
+            size = fields[field_idx]
+            field_idx += 1
+        if flags & _TRUN_SAMPLE_FLAGS_PRESENT:
+            sample_flags = fields[field_idx]
+            field_idx += 1
+        elif idx == 0 and first_sample_flags is not None:
+            sample_flags = first_sample_flags
+        else:
+            sample_flags = defaults.sample_flags
+        composition_offset = 0
+        if flags & _TRUN_SAMPLE_COMPOSITION_TIME_OFFSET_PRESENT:
+            composition_offset = fields[field_idx]
+
+        raw_samples.append(
+            RawSample(
+                description_idx=description_idx,
+                offset=data_offset,
+                size=size,
+                timedelta=duration,
+                composition_offset=composition_offset,
+                is_sync=not (sample_flags & _SAMPLE_IS_NON_SYNC_SAMPLE),
+            )
+        )
+        data_offset += size
+
+    return raw_samples
+
+
+def _parse_traf(
+    traf: bytes,
+    base_data_offset: int,
+    moof_offset: int,
+    trex_defaults: T.Mapping[int, TrackFragmentDefaults],
+) -> tuple[int, TrackFragment, int]:
+    """
+    Parse the track fragment. base_data_offset is the implicit base data offset,
+    i.e. the moof offset for the first track fragment in the moof, otherwise
+    the end of the data of the preceding track fragment.
+
+    Return the track_ID, the track fragment, and the end of its data.
+    """
+    boxes: dict[bytes, list[tuple[int, int]]] = {}
+    for box_type, offset, size in _iterate_box_data_ranges(traf):
+        boxes.setdefault(box_type, []).append((offset, size))
+
+    if b"tfhd" not in boxes:
+        raise sparser.BoxNotFoundError("unable find box at path [b'tfhd'] in traf")
+
+    tfhd_offset, _ = boxes[b"tfhd"][0]
+    _, tfhd_flags = _parse_version_and_flags(traf, tfhd_offset)
+    (track_ID,) = _UINT32.unpack_from(traf, tfhd_offset + 4)
+    pos = tfhd_offset + 8
+
+    if tfhd_flags & _TFHD_BASE_DATA_OFFSET_PRESENT:
+        (base_data_offset,) = _UINT64.unpack_from(traf, pos)
+        pos += 8
+    elif tfhd_flags & _TFHD_DEFAULT_BASE_IS_MOOF:
+        base_data_offset = moof_offset
+
+    # override the defaults from trex
+    defaults = trex_defaults.get(track_ID, TrackFragmentDefaults())
+    overrides: dict[str, int] = {}
+    for flag, field in [
+        (_TFHD_SAMPLE_DESCRIPTION_INDEX_PRESENT, "sample_description_index"),
+        (_TFHD_DEFAULT_SAMPLE_DURATION_PRESENT, "sample_duration"),
+        (_TFHD_DEFAULT_SAMPLE_SIZE_PRESENT, "sample_size"),
+        (_TFHD_DEFAULT_SAMPLE_FLAGS_PRESENT, "sample_flags"),
+    ]:
+        if tfhd_flags & flag:
+            (overrides[field],) = _UINT32.unpack_from(traf, pos)
+            pos += 4
+    if overrides:
+        defaults = defaults._replace(**overrides)
+
+    base_media_decode_time: int | None = None
+    if b"tfdt" in boxes:
+        tfdt_offset, _ = boxes[b"tfdt"][0]
+        version, _ = _parse_version_and_flags(traf, tfdt_offset)
+        if version == 1:
+            (base_media_decode_time,) = _UINT64.unpack_from(traf, tfdt_offset + 4)
+        else:
+            (base_media_decode_time,) = _UINT32.unpack_from(traf, tfdt_offset + 4)
+
+    raw_samples: list[RawSample] = []
+    # the data offsets of the runs are relative to the base data offset.
+    # If a run does not specify its data offset, its data starts at the base data offset
+    # for the first run, otherwise it continues from the previous run
+    data_offset = base_data_offset
+    for trun_offset, trun_size in boxes.get(b"trun", []):
+        run = _parse_trun(
+            traf[trun_offset : trun_offset + trun_size],
+            base_data_offset,
+            data_offset,
+            defaults.sample_description_index,
+            defaults,
+        )
+        if run:
+            data_offset = run[-1].offset + run[-1].size
+        raw_samples.extend(run)
+
+    return track_ID, TrackFragment(base_media_decode_time, raw_samples), data_offset
+
+
+def iterate_track_fragments(
+    stream: T.BinaryIO,
+    track_ID: int,
+    trex_defaults: T.Mapping[int, TrackFragmentDefaults] | None = None,
+) -> T.Generator[TrackFragment, None, None]:
+    """
+    Scan the top-level boxes of the stream in a single forward pass and yield
+    the fragments of the track from the moof boxes as they are found.
+
+    Only the moof boxes are read; media data (mdat) and other boxes are skipped.
+    The scan stops at the first incomplete moof box, e.g. at the end of a file
+    that is still being written.
+    """
+    if trex_defaults is None:
+        trex_defaults = {}
+
+    stream.seek(0, io.SEEK_SET)
+    for header, box in sparser.parse_boxes(stream, extend_eof=True):
+        if header.type != b"moof":
+            continue
+
+        moof_offset = box.tell() - header.header_size
+        moof = box.read(header.maxsize)
+        if header.maxsize == -1 or len(moof) < header.maxsize:
+            break
+
+        base_data_offset = moof_offset
+        for box_type, traf_offset, traf_size in _iterate_box_data_ranges(moof):
+            if box_type != b"traf":
+                continue
+            traf_track_ID, fragment, base_data_offset = _parse_traf(
+                moof[traf_offset : traf_offset + traf_size],
+                base_data_offset,
+                moof_offset,
+                trex_defaults,
+            )
+            if traf_track_ID == track_ID:
+                yield fragment
+
+
+class _MovieFragments(T.NamedTuple):
+    # open the stream to scan the movie fragments from
+    open_stream: T.Callable[[], T.ContextManager[T.BinaryIO]]
+    trex_defaults: dict[int, TrackFragmentDefaults]
 
 
 _STSDBoxListConstruct = cparser.Box64ConstructBuilder(
@@ -239,12 +716,17 @@ class TrackBoxParser:
     trak_children: T.Sequence[cparser.BoxDict]
     stbl_data: bytes
 
-    def __init__(self, trak_children: T.Sequence[cparser.BoxDict]):
+    def __init__(
+        self,
+        trak_children: T.Sequence[cparser.BoxDict],
+        movie_fragments: _MovieFragments | None = None,
+    ):
         self.trak_children = trak_children
         stbl = cparser.find_box_at_pathx(
             self.trak_children, [b"mdia", b"minf", b"stbl"]
         )
         self.stbl_data = T.cast(bytes, stbl["data"])
+        self._movie_fragments = movie_fragments
 
     def extract_tkhd_boxdata(self) -> dict:
         return T.cast(
@@ -273,38 +755,182 @@ class TrackBoxParser:
         box = cparser.find_box_at_pathx(self.trak_children, [b"mdia", b"mdhd"])
         return T.cast(dict, box["data"])
 
+    def extract_sample_table(self) -> SampleTable:
+        return SampleTable(self.stbl_data)
+
+    def is_fragmented(self) -> bool:
+        """
+        Return True if the track has samples in movie fragments (moof) besides its sample table
+        """
+        if self._movie_fragments is None:
+            return False
+        track_ID = self.extract_tkhd_boxdata()["track_ID"]
+        return track_ID in self._movie_fragments.trex_defaults
+
+    def extract_track_fragments(self) -> T.Generator[TrackFragment, None, None]:
+        """
+        Scan the movie fragments of the track forward. Yield nothing if the track is not fragmented
+        """
+        if self._movie_fragments is None or not self.is_fragmented():
+            return
+        track_ID = self.extract_tkhd_boxdata()["track_ID"]
+        with self._movie_fragments.open_stream() as stream:
+            yield from iterate_track_fragments(
+                stream, track_ID, self._movie_fragments.trex_defaults
+            )
+
+    def count_samples(self) -> int:
+        return len(self.extract_sample_table()) + sum(
+            len(fragment.raw_samples) for fragment in self.extract_track_fragments()
+        )
+
     def extract_raw_samples(self) -> T.Generator[RawSample, None, None]:
-        _, raw_samples = extract_raw_samples_from_stbl_data(self.stbl_data)
-        yield from raw_samples
+        yield from self.extract_sample_table()
+        for fragment in self.extract_track_fragments():
+            yield from fragment.raw_samples
 
     def extract_samples(self) -> T.Generator[Sample, None, None]:
-        descriptions, raw_samples = extract_raw_samples_from_stbl_data(self.stbl_data)
-        mdhd = T.cast(
-            dict,
-            cparser.find_box_at_pathx(self.trak_children, [b"mdia", b"mdhd"])["data"],
-        )
-        yield from _extract_samples(raw_samples, descriptions, mdhd["timescale"])
+        table = self.extract_sample_table()
+        descriptions = table.extract_descriptions()
+        timescale = self.extract_mdhd_boxdata()["timescale"]
+        yield from _extract_samples(iter(table), descriptions, timescale)
+
+        # Samples in movie fragments follow the samples in the sample table
+        decode_time = table.decode_time(len(table))
+        for fragment in self.extract_track_fragments():
+            if fragment.base_media_decode_time is not None:
+                decode_time = fragment.base_media_decode_time
+            yield from _extract_samples(
+                iter(fragment.raw_samples), descriptions, timescale, decode_time
+            )
+            decode_time += sum(s.timedelta for s in fragment.raw_samples)
+
+    def extract_sample_at(self, sample_idx: int) -> Sample:
+        """
+        Random access to the sample at the index without iterating the samples before it
+        (unless the sample is in movie fragments)
+        """
+        table = self.extract_sample_table()
+        if self.is_fragmented() and not (0 <= sample_idx < len(table)):
+            samples = self.extract_samples()
+            if sample_idx < 0:
+                samples_list = list(samples)
+                return samples_list[sample_idx]
+            for sample in itertools.islice(samples, sample_idx, None):
+                return sample
+            raise IndexError(f"sample index {sample_idx} out of range")
+
+        return table.sample_at(sample_idx, self.extract_mdhd_boxdata()["timescale"])
+
+
+def _trak_contains_sample_formats(
+    stream: T.BinaryIO, maxsize: int, sample_formats: T.Container[bytes]
+) -> bool:
+    return any(
+        f in sample_formats
+        for f in moov_cache.extract_trak_sample_formats(stream, maxsize)
+    )
+
+
+def _read_moov_data_selectively(
+    stream: T.BinaryIO, sample_formats: T.Container[bytes]
+) -> bytes:
+    """
+    Read the moov box data, but only include the trak boxes that contain any of the sample formats.
+    Other trak boxes are skipped after reading their sample descriptions (stsd).
+    """
+    for moov_header, _ in sparser.parse_path(stream, [b"moov"]):
+        break
+    else:
+        raise sparser.BoxNotFoundError("unable find box at path [b'moov']")
+
+    return _select_moov_children_data(stream, moov_header.maxsize, sample_formats)
+
+
+def _select_moov_children_data(
+    stream: T.BinaryIO, maxsize: int, sample_formats: T.Container[bytes]
+) -> bytes:
+    selected: list[bytes] = []
+    for header, box in sparser.parse_boxes(stream, maxsize=maxsize, extend_eof=False):
+        data_offset = box.tell()
+        if header.type == b"trak" and not _trak_contains_sample_formats(
+            box, header.maxsize, sample_formats
+        ):
+            continue
+        box.seek(data_offset - header.header_size, io.SEEK_SET)
+        selected.append(box.read(header.box_size))
+
+    return b"".join(selected)
 
 
 class MovieBoxParser:
     moov_children: T.Sequence[cparser.BoxDict]
 
-    def __init__(self, moov_data: bytes):
+    def __init__(
+        self,
+        moov_data: bytes,
+        open_stream: T.Callable[[], T.ContextManager[T.BinaryIO]] | None = None,
+    ):
+        """
+        open_stream, if specified, opens the stream that the moov box is parsed from,
+        for reading the samples in movie fragments (moof) of fragmented MP4s
+        """
         self.moov_children = T.cast(
             T.Sequence[cparser.BoxDict],
             cparser.MOOVWithoutSTBLBuilderConstruct.BoxList.parse(moov_data),
         )
 
+        self._movie_fragments: _MovieFragments | None = None
+        mvex = cparser.find_box_at_path(self.moov_children, [b"mvex"])
+        if mvex is not None and open_stream is not None:
+            self._movie_fragments = _MovieFragments(
+                open_stream=open_stream,
+                trex_defaults=parse_trex_defaults(T.cast(bytes, mvex["data"])),
+            )
+
     @classmethod
-    def parse_file(cls, video_path: Path) -> "MovieBoxParser":
+    def parse_file(
+        cls, video_path: Path, sample_formats: T.Container[bytes] | None = None
+    ) -> "MovieBoxParser":
         with video_path.open("rb") as fp:
-            moov = sparser.parse_box_data_firstx(fp, [b"moov"])
-        return cls(moov)
+            moov = cls._parse_moov_data(fp, sample_formats=sample_formats)
+        return cls(moov, open_stream=lambda: video_path.open("rb"))
 
     @classmethod
-    def parse_stream(cls, stream: T.BinaryIO) -> "MovieBoxParser":
-        moov = sparser.parse_box_data_firstx(stream, [b"moov"])
-        return cls(moov)
+    def parse_stream(
+        cls, stream: T.BinaryIO, sample_formats: T.Container[bytes] | None = None
+    ) -> "MovieBoxParser":
+        """
+        Parse the moov box from the stream.
+
+        If sample_formats is specified (e.g. {b"gpmd"} or {b"camm"}), only the tracks
+        that contain any of the sample formats are read and parsed. The other tracks,
+        usually video and audio tracks with large sample tables, are skipped,
+        hence their stream indices are not preserved.
+
+        For fragmented MP4s, the samples in movie fragments are read from the stream
+        when extracting samples, so keep the stream open until then.
+        """
+        moov = cls._parse_moov_data(stream, sample_formats=sample_formats)
+        return cls(moov, open_stream=lambda: contextlib.nullcontext(stream))
+
+    @staticmethod
+    def _parse_moov_data(
+        stream: T.BinaryIO, sample_formats: T.Container[bytes] | None = None
+    ) -> bytes:
+        # Read the whole moov box once per file if it fits in the cache,
+        # so the other parsers of the same file skip reading it
+        moov = moov_cache.MOOV_CACHE.read_moov(stream)
+        if moov is not None:
+            if sample_formats is None:
+                return moov.data
+            return moov.select_data(sample_formats)
+
+        if sample_formats is None:
+            return sparser.parse_box_data_firstx(stream, [b"moov"])
+        else:
+            # Read only the selected tracks, skipping the other sample tables
+            return _read_moov_data_selectively(stream, sample_formats)
 
     def extract_mvhd_boxdata(self) -> dict:
         mvhd = cparser.find_box_at_pathx(self.moov_children, [b"mvhd"])
@@ -319,7 +945,10 @@ class MovieBoxParser:
     def extract_tracks(self) -> T.Generator[TrackBoxParser, None, None]:
         for box in self.moov_children:
             if box["type"] == b"trak":
-                yield TrackBoxParser(T.cast(T.Sequence[cparser.BoxDict], box["data"]))
+                yield TrackBoxParser(
+                    T.cast(T.Sequence[cparser.BoxDict], box["data"]),
+                    self._movie_fragments,
+                )
 
     def extract_track_at(self, stream_idx: int) -> TrackBoxParser:
         """
@@ -336,7 +965,27 @@ class MovieBoxParser:
         trak_children = T.cast(
             T.Sequence[cparser.BoxDict], trak_boxes[stream_idx]["data"]
         )
-        return TrackBoxParser(trak_children)
+        return TrackBoxParser(trak_children, self._movie_fragments)
+
+
+def iterate_read_sample_data(
+    fp: T.BinaryIO,
+    samples: T.Iterable[Sample],
+    max_gap: int | None = 0,
+    use_mmap: bool = False,
+) -> T.Generator[tuple[Sample, bytes], None, None]:
+    """
+    Read the data of the samples from the stream, coalescing the reads of nearby samples.
+    See io_utils.read_ranges for the parameters.
+    """
+    samples = list(samples)
+    sample_data = io_utils.read_ranges(
+        fp,
+        [(sample.raw_sample.offset, sample.raw_sample.size) for sample in samples],
+        max_gap=max_gap,
+        use_mmap=use_mmap,
+    )
+    yield from zip(samples, sample_data)
 
 
 _DT_1904 = datetime.datetime.fromtimestamp(0, datetime.timezone.utc).replace(year=1904)
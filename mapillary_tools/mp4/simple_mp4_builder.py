@@ -5,13 +5,17 @@
 
 from __future__ import annotations
 
+import array
 import dataclasses
 import io
+import itertools
+import struct
 import typing as T
 
 from . import (
     construct_mp4_parser as cparser,
     io_utils,
+    moov_cache,
     mp4_sample_parser as sample_parser,
     simple_mp4_parser as sparser,
 )
@@ -211,6 +215,132 @@ def build_stbl_from_raw_samples(
     return boxes
 
 
+_BOX_HEADER32 = struct.Struct(">I4s")
+
+
+def _pack_box(box_type: bytes, data: bytes) -> bytes:
+    box_size = _BOX_HEADER32.size + len(data)
+    if UINT32_MAX < box_size:
+        raise ValueError(f"{box_type!r} box of {box_size} bytes is too large")
+    return _BOX_HEADER32.pack(box_size, box_type) + data
+
+
+def _pack_full_box(
+    box_type: bytes,
+    entries: T.Sequence[int],
+    fields_per_entry: int = 1,
+    field_format: str = "I",
+    version: int = 0,
+) -> bytes:
+    """
+    Pack a full box that contains the entry count followed by the flattened entries
+    """
+    assert len(entries) % fields_per_entry == 0
+    count = len(entries) // fields_per_entry
+    return _pack_box(
+        box_type,
+        # version (8 bits) and flags (24 bits, always 0)
+        struct.pack(">I", version << 24)
+        + struct.pack(f">I{len(entries)}{field_format}", count, *entries),
+    )
+
+
+def build_stbl_data_from_raw_samples(
+    descriptions: T.Sequence[T.Any], raw_samples: T.Iterable[RawSample]
+) -> bytes:
+    """
+    Build the stbl box data (i.e. its children boxes) in bytes from the raw samples.
+
+    It produces the same bytes as building the boxes from build_stbl_from_raw_samples
+    with construct, but packs the sample tables with struct directly.
+    The raw samples are consumed in a single pass, keeping only the table entries,
+    so they can be streamed from a generator.
+    """
+    # flattened (sample_count, sample_delta)
+    stts_entries = array.array("q")
+    # flattened (first_chunk, samples_per_chunk, sample_description_index)
+    stsc_entries = array.array("q")
+    sizes = array.array("q")
+    chunk_offsets = array.array("q")
+    # flattened (sample_count, sample_offset)
+    ctts_entries = array.array("q")
+    sync_sample_numbers = array.array("q")
+
+    has_composition_offsets = False
+    has_negative_composition_offsets = False
+    prev_raw_sample: RawSample | None = None
+
+    for raw_sample in raw_samples:
+        if stts_entries and stts_entries[-1] == raw_sample.timedelta:
+            stts_entries[-2] += 1
+        else:
+            stts_entries.extend((1, raw_sample.timedelta))
+
+        # Same chunking as _build_chunks: a sample is added to the current chunk if it has
+        # the same description index and is next to the previous sample (contiguous)
+        if (
+            prev_raw_sample is not None
+            and raw_sample.description_idx == stsc_entries[-1]
+            and raw_sample.offset == prev_raw_sample.offset + prev_raw_sample.size
+        ):
+            stsc_entries[-2] += 1
+        else:
+            stsc_entries.extend((len(chunk_offsets) + 1, 1, raw_sample.description_idx))
+            chunk_offsets.append(raw_sample.offset)
+
+        sizes.append(raw_sample.size)
+
+        if ctts_entries and ctts_entries[-1] == raw_sample.composition_offset:
+            ctts_entries[-2] += 1
+        else:
+            ctts_entries.extend((1, raw_sample.composition_offset))
+        if raw_sample.composition_offset:
+            has_composition_offsets = True
+            if raw_sample.composition_offset < 0:
+                has_negative_composition_offsets = True
+
+        if raw_sample.is_sync:
+            sync_sample_numbers.append(len(sizes))
+
+        prev_raw_sample = raw_sample
+
+    stsd_typed_data = _STBLChildrenBuilderConstruct.build_box(_build_stsd(descriptions))
+
+    stts_typed_data = _pack_full_box(b"stts", stts_entries, 2)
+
+    stsc_typed_data = _pack_full_box(b"stsc", stsc_entries, 3)
+
+    if sizes and all(sz == sizes[0] for sz in sizes):
+        # version, flags, sample_size, sample_count
+        stsz_data = struct.pack(">III", 0, sizes[0], len(sizes))
+    else:
+        stsz_data = struct.pack(f">III{len(sizes)}I", 0, 0, len(sizes), *sizes)
+    stsz_typed_data = _pack_box(b"stsz", stsz_data)
+
+    # always build as co64 (see build_stbl_from_raw_samples)
+    co64_typed_data = _pack_full_box(b"co64", chunk_offsets, field_format="Q")
+
+    typed_data = [
+        stsd_typed_data,
+        stts_typed_data,
+        stsc_typed_data,
+        stsz_typed_data,
+        co64_typed_data,
+    ]
+    if has_composition_offsets:
+        if has_negative_composition_offsets:
+            # Version 1 allows negative composition offsets (signed 32-bit)
+            ctts_typed_data = _pack_full_box(
+                b"ctts", ctts_entries, 2, field_format="i", version=1
+            )
+        else:
+            ctts_typed_data = _pack_full_box(b"ctts", ctts_entries, 2)
+        typed_data.append(ctts_typed_data)
+    if len(sync_sample_numbers) < len(sizes):
+        typed_data.append(_pack_full_box(b"stss", sync_sample_numbers))
+    return b"".join(typed_data)
+
+
 def _filter_trak_boxes(
     boxes: T.Iterable[BoxDict],
 ) -> T.Generator[BoxDict, None, None]:
@@ -247,30 +377,25 @@ _STBLChildrenBuilderConstruct = cparser.Box32ConstructBuilder(
 def _update_sbtl_sample_offsets(trak: BoxDict, sample_offset: int) -> int:
     assert trak["type"] == b"trak"
 
-    # new samples with offsets updated
-    repositioned_samples = []
-    for sample in iterate_samples([trak]):
-        repositioned_samples.append(
-            sample_parser.RawSample(
-                description_idx=sample.description_idx,
-                offset=sample_offset,
-                size=sample.size,
-                timedelta=sample.timedelta,
-                composition_offset=sample.composition_offset,
-                is_sync=sample.is_sync,
-            )
-        )
-        sample_offset += sample.size
     stbl_box = cparser.find_box_at_pathx(trak, [b"trak", b"mdia", b"minf", b"stbl"])
-    descriptions, _ = sample_parser.extract_raw_samples_from_stbl_data(
+    descriptions, raw_samples = sample_parser.extract_raw_samples_from_stbl_data(
         T.cast(bytes, stbl_box["data"])
     )
-    stbl_children_boxes = build_stbl_from_raw_samples(
-        descriptions, repositioned_samples
+
+    sample_end_offset = sample_offset
+
+    def _reposition_samples() -> T.Generator[RawSample, None, None]:
+        nonlocal sample_end_offset
+        for sample in raw_samples:
+            yield sample._replace(offset=sample_end_offset)
+            sample_end_offset += sample.size
+
+    # new samples with offsets updated, streamed into the sample tables
+    stbl_box["data"] = build_stbl_data_from_raw_samples(
+        descriptions, _reposition_samples()
     )
-    stbl_box["data"] = _STBLChildrenBuilderConstruct.build_boxlist(stbl_children_boxes)
 
-    return sample_offset
+    return sample_end_offset
 
 
 def iterate_samples(
@@ -345,7 +470,11 @@ def transform_mp4(
 
     # extract moov
     src_fp.seek(0)
-    moov_data = sparser.parse_mp4_data_firstx(src_fp, [b"moov"])
+    moov = moov_cache.MOOV_CACHE.read_moov(src_fp)
+    if moov is not None:
+        moov_data = moov.data
+    else:
+        moov_data = sparser.parse_mp4_data_firstx(src_fp, [b"moov"])
     moov_children = _MOOVChildrenParserConstruct.parse_boxlist(moov_data)
 
     # filter tracks in moov
@@ -373,9 +502,8 @@ def build_mp4(
     ftyp_typed_data = cparser.MP4WithoutSTBLBuilderConstruct.build_box(
         {"type": b"ftyp", "data": ftyp_data}
     )
-    mdat_body_size = sum(sample.size for sample in iterate_samples(moov_children))
     # moov_children should be immutable since here
-    new_moov_typed_data = _rewrite_and_build_moov_typed_data(
+    new_moov_typed_data, mdat_body_size = _rewrite_and_build_moov_typed_data(
         len(ftyp_typed_data), moov_children
     )
     return io_utils.ChainedIO(
@@ -391,27 +519,74 @@ def build_mp4(
     )
 
 
+def _iterate_box_data_ranges(
+    data: bytes, path: T.Sequence[bytes], offset: int = 0, size: int | None = None
+) -> T.Generator[tuple[int, int], None, None]:
+    """
+    Yield (offset, size) of the data of every box at the path within data[offset:offset + size]
+    """
+    stream = io.BytesIO(data)
+    stream.seek(offset)
+    maxsize = len(data) - offset if size is None else size
+    for header, box in sparser.parse_boxes(stream, maxsize=maxsize):
+        if header.type == path[0]:
+            box_data_offset = box.tell()
+            if len(path) == 1:
+                yield box_data_offset, header.maxsize
+            else:
+                yield from _iterate_box_data_ranges(
+                    data, path[1:], box_data_offset, header.maxsize
+                )
+
+
+def _shift_co64_offsets(stbl_data: bytearray, shift: int) -> None:
+    for co64_offset, _ in _iterate_box_data_ranges(bytes(stbl_data), [b"co64"]):
+        # skip version and flags
+        (count,) = struct.unpack_from(">I", stbl_data, co64_offset + 4)
+        entries = struct.Struct(f">{count}Q")
+        shifted = [
+            offset + shift for offset in entries.unpack_from(stbl_data, co64_offset + 8)
+        ]
+        entries.pack_into(stbl_data, co64_offset + 8, *shifted)
+
+
 def _rewrite_and_build_moov_typed_data(
     moov_offset: int, moov_children: T.Sequence[BoxDict]
-) -> bytes:
-    # build moov for calculating moov size
+) -> tuple[bytes, int]:
+    """
+    Rewrite the sample tables of all tracks, so that their samples are placed one after
+    another in mdat, and build the moov box in bytes.
+    Return the moov box and the total size of the samples (i.e. the mdat body size).
+    """
+    trak_boxes = list(_filter_trak_boxes(moov_children))
+
+    # Lay out samples of all tracks relative to the mdat body
     sample_offset = 0
-    for box in _filter_trak_boxes(moov_children):
+    for box in trak_boxes:
         sample_offset = _update_sbtl_sample_offsets(box, sample_offset)
-    moov_typed_data = _build_moov_typed_data(moov_children)
-    moov_typed_data_size = len(moov_typed_data)
+    mdat_body_size = sample_offset
 
-    # mdat header size
-    mdat_body_size = sum(sample.size for sample in iterate_samples(moov_children))
+    # Chunk offsets are always built as co64, so the moov size does not depend on them.
+    # Build moov once and then shift the chunk offsets in place
+    moov_typed_data = _build_moov_typed_data(moov_children)
     mdat_header_data = _build_mdat_header_data(mdat_body_size)
+    mdat_body_offset = moov_offset + len(moov_typed_data) + len(mdat_header_data)
 
-    # build moov for real
-    sample_offset = moov_offset + len(moov_typed_data) + len(mdat_header_data)
-    for box in _filter_trak_boxes(moov_children):
-        sample_offset = _update_sbtl_sample_offsets(box, sample_offset)
-    moov_typed_data = _build_moov_typed_data(moov_children)
-    assert len(moov_typed_data) == moov_typed_data_size, (
-        f"{len(moov_typed_data)} != {moov_typed_data_size}"
+    stbl_data_ranges = list(
+        _iterate_box_data_ranges(
+            moov_typed_data, [b"moov", b"trak", b"mdia", b"minf", b"stbl"]
+        )
+    )
+    assert len(stbl_data_ranges) == len(trak_boxes), (
+        f"expect {len(trak_boxes)} stbl boxes but got {len(stbl_data_ranges)}"
     )
 
-    return moov_typed_data
+    new_moov_typed_data = bytearray(moov_typed_data)
+    for box, (stbl_offset, stbl_size) in zip(trak_boxes, stbl_data_ranges):
+        stbl_data = bytearray(moov_typed_data[stbl_offset : stbl_offset + stbl_size])
+        _shift_co64_offsets(stbl_data, mdat_body_offset)
+        new_moov_typed_data[stbl_offset : stbl_offset + stbl_size] = stbl_data
+        stbl_box = cparser.find_box_at_pathx(box, [b"trak", b"mdia", b"minf", b"stbl"])
+        stbl_box["data"] = bytes(stbl_data)
+
+    return bytes(new_moov_typed_data), mdat_body_size
@@ -97,8 +97,15 @@ def duplication_check(
     *,
     max_duplicate_distance: float,
     max_duplicate_angle: float,
+    check_all_kept: bool = False,
 ) -> tuple[PointSequence, list[types.ErrorMetadata]]:
     """
+    Remove images that duplicate their previous kept image in terms of distance and angle.
+
+    If check_all_kept is set, an image is also compared against all the kept images
+    before it (found with a spatial index), which catches non-adjacent duplicates,
+    e.g. when GPS positions jitter while the camera is stationary.
+
     >>> duplication_check([], max_duplicate_distance=1, max_duplicate_angle=2)
     ([], [])
     """
@@ -106,27 +113,55 @@ def duplication_check(
     dedups: PointSequence = []
     dups: list[types.ErrorMetadata] = []
 
-    it = iter(sequence)
-    prev = next(it, None)
-
-    if prev is None:
+    if not sequence:
         return dedups, dups
 
+    ecefs = geo.ecef_from_latlons(
+        [image.lat for image in sequence], [image.lon for image in sequence]
+    )
+
+    index: geo.ECEFIndex | None = None
+    if check_all_kept:
+        index = geo.ECEFIndex(cell_size=max(max_duplicate_distance, 1.0))
+
+    prev, prev_ecef = sequence[0], ecefs[0]
     dedups.append(prev)
+    if index is not None:
+        index.add(0, prev_ecef)
 
-    for cur in it:
+    for cur, cur_ecef in zip(sequence[1:], ecefs[1:]):
         # invariant: prev is processed
-        distance = geo.gps_distance((prev.lat, prev.lon), (cur.lat, cur.lon))
-
-        if prev.angle is not None and cur.angle is not None:
-            angle_diff = geo.diff_bearing(prev.angle, cur.angle)
+        candidates: list[tuple[geo.Point, float]]
+        if index is None:
+            candidates = [(prev, geo.ecef_distance(prev_ecef, cur_ecef))]
         else:
-            angle_diff = None
+            # Kept images within the distance, the most recent first
+            candidates = [
+                (dedups[key], distance)
+                for key, distance in reversed(
+                    index.query_radius(cur_ecef, max_duplicate_distance)
+                )
+            ]
+
+        duplicate: tuple[float, float | None] | None = None
+        for candidate, distance in candidates:
+            if candidate.angle is not None and cur.angle is not None:
+                angle_diff = geo.diff_bearing(candidate.angle, cur.angle)
+            else:
+                angle_diff = None
+
+            if distance <= max_duplicate_distance and (
+                angle_diff is None or angle_diff <= max_duplicate_angle
+            ):
+                duplicate = (distance, angle_diff)
+                break
 
-        if distance <= max_duplicate_distance and (
-            angle_diff is None or angle_diff <= max_duplicate_angle
-        ):
-            msg = f"Duplicate of its previous image in terms of distance <= {max_duplicate_distance} and angle <= {max_duplicate_angle}"
+        if duplicate is not None:
+            distance, angle_diff = duplicate
+            if index is None:
+                msg = f"Duplicate of its previous image in terms of distance <= {max_duplicate_distance} and angle <= {max_duplicate_angle}"
+            else:
+                msg = f"Duplicate of a previous image in terms of distance <= {max_duplicate_distance} and angle <= {max_duplicate_angle}"
             ex = exceptions.MapillaryDuplicationError(
                 msg,
                 DescriptionJSONSerializer.as_desc(cur),
@@ -139,8 +174,10 @@ def duplication_check(
             dups.append(dup)
             # prev does not change
         else:
+            if index is not None:
+                index.add(len(dedups), cur_ecef)
             dedups.append(cur)
-            prev = cur
+            prev, prev_ecef = cur, cur_ecef
         # invariant: cur is processed
 
     return dedups, dups
@@ -259,9 +296,10 @@ def _is_video_stationary(
     if not sequence:
         return 0.0 <= max_radius_in_meters
 
-    start = (sequence[0].lat, sequence[0].lon)
-    for p in sequence:
-        distance = geo.gps_distance(start, (p.lat, p.lon))
+    ecefs = geo.ecef_from_latlons([p.lat for p in sequence], [p.lon for p in sequence])
+    start = ecefs[0]
+    for ecef in ecefs:
+        distance = geo.ecef_distance(start, ecef)
         if distance > max_radius_in_meters:
             return False
 
@@ -403,6 +441,7 @@ def _check_sequences_duplication(
     input_sequences: T.Sequence[PointSequence],
     duplicate_distance: float,
     duplicate_angle: float,
+    check_all_kept: bool = False,
 ) -> tuple[list[PointSequence], list[types.ErrorMetadata]]:
     output_sequences: list[PointSequence] = []
     output_errors: list[types.ErrorMetadata] = []
@@ -412,6 +451,7 @@ def _check_sequences_duplication(
             sequence,
             max_duplicate_distance=duplicate_distance,
             max_duplicate_angle=duplicate_angle,
+            check_all_kept=check_all_kept,
         )
         assert len(sequence) == len(output_sequence) + len(errors)
         if output_sequence:
@@ -431,12 +471,89 @@ def _check_sequences_duplication(
     return output_sequences, output_errors
 
 
+def _find_zigzag_deviations_by_radius(
+    ecefs: T.Sequence[geo.ECEF],
+    consecutive_distances: T.Sequence[float],
+    global_radius: float,
+    deviation_threshold: float,
+    min_distance: float,
+    global_window_size: int,
+) -> set[int]:
+    """
+    Find zig-zag deviations beyond the look-back window: when the path jumps from prev
+    to curr, the reference is the latest image before prev within global_radius of curr,
+    at most global_window_size images back. Only the images in that window are kept
+    in the spatial index, so each query costs O(global_window_size) at most.
+
+    The images between the reference and curr are deviations only if they form an excursion,
+    i.e. the path leaves the reference in one jump and then returns, unlike a loop route
+    that moves away gradually and comes back to where it started.
+
+    >>> # Moving slowly along the equator, but images 3 to 9 jump 1 km north
+    >>> lats = [0.0] * 3 + [0.01] * 7 + [0.0] * 2
+    >>> ecefs = geo.ecef_from_latlons(lats, [i * 0.00002 for i in range(12)])
+    >>> distances = [geo.ecef_distance(a, b) for a, b in geo.pairwise(ecefs)]
+    >>> sorted(_find_zigzag_deviations_by_radius(ecefs, distances, 50, 0.8, 30, 30))
+    [3, 4, 5, 6, 7, 8, 9]
+    """
+    deviation_indices: set[int] = set()
+
+    # The index holds the images i - 1 - global_window_size to i - 2, i.e. the candidate references of curr
+    index = geo.ECEFIndex(cell_size=global_radius)
+
+    for i in range(2, len(ecefs)):
+        index.add(i - 2, ecefs[i - 2])
+        if 0 <= i - 2 - global_window_size:
+            index.remove(i - 2 - global_window_size, ecefs[i - 2 - global_window_size])
+
+        # Only check if the jump between prev and curr is above min_distance
+        if not (consecutive_distances[i - 1] > min_distance):
+            continue
+
+        found = index.query_radius(ecefs[i], global_radius)
+        if not found:
+            continue
+        # The latest reference, since the found keys are sorted
+        ref, _ = found[-1]
+
+        dist_curr = geo.ecef_distance(ecefs[i], ecefs[ref])
+
+        # Walk backwards from prev to ref+1, with the same check as _check_sequences_zigzag
+        excursion: list[int] = []
+        for j in range(i - 1, ref, -1):
+            if (
+                geo.ecef_distance(ecefs[j], ecefs[i]) > min_distance
+                and dist_curr
+                < geo.ecef_distance(ecefs[j], ecefs[ref]) * deviation_threshold
+            ):
+                excursion.append(j)
+            else:
+                break
+
+        # The path returns to the reference, but never left it in a jump
+        if not excursion or excursion[-1] != ref + 1:
+            continue
+
+        # The jump out must reach (almost) as far as the excursion goes,
+        # otherwise the path moved away gradually, e.g. along a loop
+        leave_distance = consecutive_distances[ref]
+        max_distance = max(geo.ecef_distance(ecefs[j], ecefs[ref]) for j in excursion)
+        if leave_distance < max_distance * deviation_threshold:
+            continue
+
+        deviation_indices.update(excursion)
+
+    return deviation_indices
+
+
 def _check_sequences_zigzag(
     input_sequences: T.Sequence[PointSequence],
     window_size: int = 5,
     deviation_threshold: float = 0.8,
     min_deviations: int = 1,
     min_distance: float = 50.0,
+    global_radius: float | None = None,
+    global_window_size: int = 30,
 ) -> tuple[list[PointSequence], list[types.ErrorMetadata]]:
     """
     Check for zig-zag GPS patterns where images jump back and forth between locations.
@@ -456,12 +573,16 @@ def _check_sequences_zigzag(
         min_distance: Minimum distance (in meters) between consecutive images (prev to curr)
                      to consider for deviation detection. This filters out small-scale
                      movements like U-turns.
+        global_radius: If set, also detect deviations that return (within this radius in meters)
+                       to an earlier image up to global_window_size images back,
+                       not only to the image window_size images back.
+        global_window_size: Number of images to look back at most when global_radius is set.
     """
     output_sequences: list[PointSequence] = []
     output_errors: list[types.ErrorMetadata] = []
 
     for sequence in input_sequences:
-        if len(sequence) < window_size + 1:
+        if len(sequence) < window_size + 1 and global_radius is None:
             # Sequence too short to detect pattern
             output_sequences.append(sequence)
             continue
@@ -469,19 +590,25 @@ def _check_sequences_zigzag(
         # Track which indices are detected as deviations
         deviation_indices: set[int] = set()
 
+        # Convert each image to ECEF once instead of per distance calculation
+        ecefs = geo.ecef_from_latlons(
+            [image.lat for image in sequence], [image.lon for image in sequence]
+        )
+        # Distances between consecutive images, i.e. consecutive_distances[i - 1] is prev to curr
+        consecutive_distances = [
+            geo.ecef_distance(ecefs[i - 1], ecefs[i]) for i in range(1, len(ecefs))
+        ]
+
         for i in range(window_size, len(sequence)):
-            curr = sequence[i]
             prev = sequence[i - 1]
-            ref = sequence[i - window_size]
+            ref_ecef = ecefs[i - window_size]
 
             # Distance between consecutive images (prev to curr)
-            dist_prev_curr = geo.gps_distance(
-                (prev.lat, prev.lon), (curr.lat, curr.lon)
-            )
+            dist_prev_curr = consecutive_distances[i - 1]
             # Distance from current image back to reference
-            dist_curr = geo.gps_distance((curr.lat, curr.lon), (ref.lat, ref.lon))
+            dist_curr = geo.ecef_distance(ecefs[i], ref_ecef)
             # Distance from previous image to reference
-            dist_prev = geo.gps_distance((prev.lat, prev.lon), (ref.lat, ref.lon))
+            dist_prev = geo.ecef_distance(ecefs[i - 1], ref_ecef)
 
             # Deviation: current is closer to reference than previous was
             # Only check if the jump between prev and curr is above min_distance
@@ -505,13 +632,9 @@ def _check_sequences_zigzag(
                     point_j = sequence[j]
 
                     # Distance from j to ref
-                    dist_j_to_ref = geo.gps_distance(
-                        (point_j.lat, point_j.lon), (ref.lat, ref.lon)
-                    )
+                    dist_j_to_ref = geo.ecef_distance(ecefs[j], ref_ecef)
                     # Distance from j to curr
-                    dist_j_to_curr = geo.gps_distance(
-                        (point_j.lat, point_j.lon), (curr.lat, curr.lon)
-                    )
+                    dist_j_to_curr = geo.ecef_distance(ecefs[j], ecefs[i])
 
                     # Same check as original: j is a deviation if it's farther from ref
                     # than curr is, and the jump from j to curr is significant
@@ -527,6 +650,18 @@ def _check_sequences_zigzag(
                         # j is on the normal path, stop walking backwards
                         break
 
+        if global_radius is not None:
+            deviation_indices.update(
+                _find_zigzag_deviations_by_radius(
+                    ecefs,
+                    consecutive_distances,
+                    global_radius=global_radius,
+                    deviation_threshold=deviation_threshold,
+                    min_distance=min_distance,
+                    global_window_size=global_window_size,
+                )
+            )
+
         if len(deviation_indices) >= min_deviations:
             # Create errors only for deviation points
             for idx in sorted(deviation_indices):
@@ -568,6 +703,8 @@ class SplitState(T.TypedDict, total=False):
     sequence_file_size: int
     sequence_pixels: int
     image: types.ImageMetadata
+    # ECEF of the last image, cached for the cutoff distance check
+    image_ecef: geo.ECEF
 
 
 def _should_split_by_max_sequence_images(
@@ -619,12 +756,12 @@ def _should_split_by_cutoff_distance(
     cutoff_distance: float,
     split: bool = False,
 ) -> tuple[SplitState, bool]:
+    [image_ecef] = geo.ecef_from_latlons([image.lat], [image.lon])
+
     if not split:
-        last_image = state.get("image")
-        if last_image is not None:
-            diff = geo.gps_distance(
-                (last_image.lat, last_image.lon), (image.lat, image.lon)
-            )
+        last_image_ecef = state.get("image_ecef")
+        if last_image_ecef is not None:
+            diff = geo.ecef_distance(last_image_ecef, image_ecef)
             split = cutoff_distance < diff
             if split:
                 LOG.info(
@@ -632,6 +769,7 @@ def _should_split_by_cutoff_distance(
                 )
 
     state["image"] = image
+    state["image_ecef"] = image_ecef
 
     return state, split
 
@@ -762,6 +900,129 @@ def _split_sequences_by_limits(
     return output_sequences
 
 
+def _chunk_sequences(
+    sequences: T.Sequence[PointSequence], num_chunks: int
+) -> list[list[PointSequence]]:
+    """
+    Split the sequences into at most num_chunks consecutive chunks of about the same number of images,
+    so that small sequences are sent to worker processes in batches instead of one by one
+
+    >>> [[len(s) for s in chunk] for chunk in _chunk_sequences([[1]] * 5, 2)]
+    [[1, 1, 1], [1, 1]]
+    >>> [[len(s) for s in chunk] for chunk in _chunk_sequences([[1] * 10, [1], [1], [1]], 2)]
+    [[10], [1, 1, 1]]
+    """
+    total = sum(len(sequence) for sequence in sequences)
+    chunk_size = max(math.ceil(total / max(num_chunks, 1)), 1)
+
+    chunks: list[list[PointSequence]] = []
+    chunk: list[PointSequence] = []
+    chunk_total = 0
+    for sequence in sequences:
+        chunk.append(sequence)
+        chunk_total += len(sequence)
+        if chunk_size <= chunk_total:
+            chunks.append(chunk)
+            chunk = []
+            chunk_total = 0
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+def _process_image_sequences(
+    sequences: list[PointSequence],
+    cutoff_distance: float,
+    cutoff_time: float,
+    interpolate_directions: bool,
+    duplicate_distance: float,
+    duplicate_angle: float,
+    max_capture_speed_kmh: float,
+    skip_zigzag_check: bool,
+) -> tuple[list[PointSequence], list[list[types.ErrorMetadata]]]:
+    """
+    Run the sequence steps on the sequences grouped by folder and camera.
+
+    Each input sequence is processed independently of the others,
+    so this can run on any partition of the sequences (e.g. in worker processes).
+
+    Returns:
+        Tuple of (output sequences, errors of each check in the order of the checks)
+    """
+    max_sequence_filesize_in_bytes = constants.MAX_SEQUENCE_FILESIZE
+    max_sequence_pixels = constants.MAX_SEQUENCE_PIXELS
+
+    errors_by_check: list[list[types.ErrorMetadata]] = []
+
+    # Make sure each sequence is sorted (in-place update)
+    for sequence in sequences:
+        sequence.sort(
+            key=lambda metadata: metadata.sort_key(),
+        )
+
+    # Interpolate subseconds for same timestamps (in-place update)
+    for sequence in sequences:
+        _interpolate_subsecs_for_sorting(sequence)
+
+    # Split sequences by max number of images, max filesize, max pixels, and cutoff time
+    # NOTE: Do not split by distance here because it affects the speed limit check
+    sequences = _split_sequences_by_limits(
+        sequences,
+        max_sequence_filesize_in_bytes=max_sequence_filesize_in_bytes,
+        max_sequence_pixels=max_sequence_pixels,
+        max_sequence_images=constants.MAX_SEQUENCE_LENGTH,
+        cutoff_time=cutoff_time,
+    )
+
+    # Null island check
+    sequences, errors = _check_sequences_null_island(sequences)
+    errors_by_check.append(errors)
+
+    # Duplication check
+    sequences, errors = _check_sequences_duplication(
+        sequences,
+        duplicate_distance=duplicate_distance,
+        duplicate_angle=duplicate_angle,
+        check_all_kept=constants.DUPLICATE_CHECK_ALL_KEPT,
+    )
+    errors_by_check.append(errors)
+
+    # Interpolate angles (in-place update)
+    for sequence in sequences:
+        if interpolate_directions:
+            for image in sequence:
+                image.angle = None
+        geo.interpolate_directions_if_none(sequence)
+
+    # Check limits for sequences
+    sequences, errors = _check_sequences_by_limits(
+        sequences,
+        max_capture_speed_kmh=max_capture_speed_kmh,
+    )
+    errors_by_check.append(errors)
+
+    # Check for zig-zag GPS patterns
+    # NOTE: This is done after _check_sequences_null_island to filter zero coordinates
+    if not skip_zigzag_check:
+        sequences, errors = _check_sequences_zigzag(
+            sequences,
+            window_size=constants.ZIGZAG_WINDOW_SIZE,
+            deviation_threshold=constants.ZIGZAG_DEVIATION_THRESHOLD,
+            min_deviations=constants.ZIGZAG_MIN_DEVIATIONS,
+            min_distance=constants.ZIGZAG_MIN_DISTANCE,
+            global_radius=constants.ZIGZAG_GLOBAL_RADIUS,
+            global_window_size=constants.ZIGZAG_GLOBAL_WINDOW_SIZE,
+        )
+        errors_by_check.append(errors)
+
+    # Split sequences by cutoff distance
+    # NOTE: The speed limit check probably rejects most anomalies
+    sequences = _split_sequences_by_limits(sequences, cutoff_distance=cutoff_distance)
+
+    return sequences, errors_by_check
+
+
 def process_sequence_properties(
     metadatas: T.Sequence[types.MetadataOrError],
     cutoff_distance: float = constants.CUTOFF_DISTANCE,
@@ -771,11 +1032,11 @@ def process_sequence_properties(
     duplicate_angle: float = constants.DUPLICATE_ANGLE,
     max_capture_speed_kmh: float = constants.MAX_CAPTURE_SPEED_KMH,
     skip_zigzag_check: bool = False,
+    num_processes: int | None = None,
 ) -> list[types.MetadataOrError]:
     LOG.info("==> Processing sequences...")
 
     max_sequence_filesize_in_bytes = constants.MAX_SEQUENCE_FILESIZE
-    max_sequence_pixels = constants.MAX_SEQUENCE_PIXELS
 
     error_metadatas: list[types.ErrorMetadata] = []
     image_metadatas: list[types.ImageMetadata] = []
@@ -807,69 +1068,46 @@ def process_sequence_properties(
         # Group by folder and camera
         sequences = _group_by_folder_and_camera(image_metadatas)
 
-        # Make sure each sequence is sorted (in-place update)
-        for sequence in sequences:
-            sequence.sort(
-                key=lambda metadata: metadata.sort_key(),
-            )
-
-        # Interpolate subseconds for same timestamps (in-place update)
-        for sequence in sequences:
-            _interpolate_subsecs_for_sorting(sequence)
-
-        # Split sequences by max number of images, max filesize, max pixels, and cutoff time
-        # NOTE: Do not split by distance here because it affects the speed limit check
-        sequences = _split_sequences_by_limits(
-            sequences,
-            max_sequence_filesize_in_bytes=max_sequence_filesize_in_bytes,
-            max_sequence_pixels=max_sequence_pixels,
-            max_sequence_images=constants.MAX_SEQUENCE_LENGTH,
+        process_image_sequences = functools.partial(
+            _process_image_sequences,
+            cutoff_distance=cutoff_distance,
             cutoff_time=cutoff_time,
-        )
-
-        # Null island check
-        sequences, errors = _check_sequences_null_island(sequences)
-        error_metadatas.extend(errors)
-
-        # Duplication check
-        sequences, errors = _check_sequences_duplication(
-            sequences,
+            interpolate_directions=interpolate_directions,
             duplicate_distance=duplicate_distance,
             duplicate_angle=duplicate_angle,
-        )
-        error_metadatas.extend(errors)
-
-        # Interpolate angles (in-place update)
-        for sequence in sequences:
-            if interpolate_directions:
-                for image in sequence:
-                    image.angle = None
-            geo.interpolate_directions_if_none(sequence)
-
-        # Check limits for sequences
-        sequences, errors = _check_sequences_by_limits(
-            sequences,
             max_capture_speed_kmh=max_capture_speed_kmh,
+            skip_zigzag_check=skip_zigzag_check,
         )
-        error_metadatas.extend(errors)
-
-        # Check for zig-zag GPS patterns
-        # NOTE: This is done after _check_sequences_null_island to filter zero coordinates
-        if not skip_zigzag_check:
-            sequences, errors = _check_sequences_zigzag(
-                sequences,
-                window_size=constants.ZIGZAG_WINDOW_SIZE,
-                deviation_threshold=constants.ZIGZAG_DEVIATION_THRESHOLD,
-                min_deviations=constants.ZIGZAG_MIN_DEVIATIONS,
-                min_distance=constants.ZIGZAG_MIN_DISTANCE,
+
+        errors_by_check: list[list[types.ErrorMetadata]]
+        # Sequential unless a positive number of processes is requested
+        if len(sequences) <= 1 or num_processes is None or num_processes <= 0:
+            sequences, errors_by_check = process_image_sequences(sequences)
+        else:
+            # The grouped sequences are independent, so process them in worker processes,
+            # and merge the results in the input order to make the output deterministic.
+            # A few chunks per worker balance the load without one round trip per sequence
+            processed = list(
+                utils.mp_map_maybe(
+                    process_image_sequences,
+                    _chunk_sequences(sequences, num_processes * 4),
+                    num_processes=num_processes,
+                )
             )
-            error_metadatas.extend(errors)
+            sequences = [
+                sequence
+                for output_sequences, _ in processed
+                for sequence in output_sequences
+            ]
+            errors_by_check = [
+                [error for errors in checks for error in errors]
+                for checks in zip(
+                    *(errors_by_check for _, errors_by_check in processed)
+                )
+            ]
 
-        # Split sequences by cutoff distance
-        # NOTE: The speed limit check probably rejects most anomalies
-        sequences = _split_sequences_by_limits(
-            sequences, cutoff_distance=cutoff_distance
-        )
+        for errors in errors_by_check:
+            error_metadatas.extend(errors)
 
         # Assign sequence UUIDs (in-place update)
         sequence_idx = 0
@@ -5,19 +5,37 @@
 
 from __future__ import annotations
 
+import bisect
+import collections
+import concurrent.futures
+import copy
 import datetime
+import hashlib
+import itertools
+import json
 import logging
 import os
 import shutil
+import struct
+import subprocess
+import threading
 import time
 import typing as T
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
 
+import construct as C
+from tqdm import tqdm
+
 from . import constants, exceptions, ffmpeg as ffmpeglib, geo, types, utils
 from .exif_write import ExifEdit
 from .geotag import geotag_videos_from_video
-from .mp4 import mp4_sample_parser
+from .mp4 import (
+    construct_mp4_parser as cparser,
+    moov_cache,
+    mp4_sample_parser,
+    simple_mp4_parser as sparser,
+)
 from .serializer.description import parse_capture_time
 
 LOG = logging.getLogger(__name__)
@@ -44,6 +62,30 @@ def _normalize_path(
     return video_dir, video_list
 
 
+def _video_sample_dir(import_path: Path, video_dir: Path, video_path: Path) -> Path:
+    # Example:
+    # - import_path: mapillary_sampled_video_frames
+    # - video_dir: foo/
+    # - video_path: foo/bar/zzz.mp4
+    # Then:
+    # - sample_dir: mapillary_sampled_video_frames/bar/zzz.mp4/
+    # need to resolve video_path because video_dir might be absolute
+    return Path(import_path).joinpath(video_path.resolve().relative_to(video_dir))
+
+
+def find_video_sample_dirs(
+    video_import_path: Path, import_path: Path, skip_subfolders=False
+) -> list[tuple[Path, Path]]:
+    """
+    Find the videos to sample and return each video path with the directory its samples will be saved in
+    """
+    video_dir, video_list = _normalize_path(video_import_path, skip_subfolders)
+    return [
+        (video_path, _video_sample_dir(import_path, video_dir, video_path))
+        for video_path in video_list
+    ]
+
+
 def xor(a: bool, b: bool):
     # xor https://stackoverflow.com/a/433161
     return bool(a) ^ bool(b)
@@ -60,6 +102,7 @@ def sample_video(
     video_start_time: str | None = None,
     skip_sample_errors: bool = False,
     rerun: bool = False,
+    num_sample_workers: int | None = None,
 ) -> None:
     video_dir, video_list = _normalize_path(video_import_path, skip_subfolders)
 
@@ -68,6 +111,9 @@ def sample_video(
             f"Expect either non-negative video_sample_distance or positive video_sample_interval but got {video_sample_distance} and {video_sample_interval} respectively"
         )
 
+    # Fail early if the profile is invalid
+    _get_sampling_profile()
+
     video_start_time_dt: datetime.datetime | None = None
     if video_start_time is not None:
         try:
@@ -77,26 +123,18 @@ def sample_video(
 
     if rerun:
         for video_path in video_list:
-            # Example:
-            # - import_path: mapillary_sampled_video_frames
-            # - video_dir: foo/
-            # - video_path: foo/bar/zzz.mp4
-            # Then:
-            # - sample_dir: mapillary_sampled_video_frames/bar/zzz.mp4/
-            sample_dir = Path(import_path).joinpath(
-                video_path.resolve().relative_to(video_dir)
-            )
+            sample_dir = _video_sample_dir(import_path, video_dir, video_path)
             LOG.info("Removing the sample directory %s", sample_dir)
             if sample_dir.is_dir():
                 shutil.rmtree(sample_dir)
             elif sample_dir.is_file():
                 os.remove(sample_dir)
+            # Do not resume the interrupted sampling either
+            shutil.rmtree(checkpoint_sample_dir(sample_dir), ignore_errors=True)
 
+    sample_jobs: list[tuple[Path, Path]] = []
     for video_path in video_list:
-        # need to resolve video_path because video_dir might be absolute
-        sample_dir = Path(import_path).joinpath(
-            video_path.resolve().relative_to(video_dir)
-        )
+        sample_dir = _video_sample_dir(import_path, video_dir, video_path)
         if sample_dir.exists():
             LOG.warning(
                 "Skip sampling video %s as it has been sampled in %s. Specify --rerun to resample it",
@@ -104,47 +142,108 @@ def sample_video(
                 sample_dir,
             )
             continue
+        sample_jobs.append((video_path, sample_dir))
+
+    num_workers = _resolve_num_sample_workers(num_sample_workers, len(sample_jobs))
+    # Limit the decoding threads of each ffmpeg process to share the CPUs between jobs
+    ffmpeg_threads = constants.VIDEO_SAMPLE_FFMPEG_THREADS if 1 < num_workers else None
+
+    def _sample_single_video(video_path: Path, sample_dir: Path) -> None:
+        if 0 <= video_sample_distance:
+            _sample_single_video_by_distance(
+                video_path,
+                sample_dir,
+                sample_distance=video_sample_distance,
+                start_time=video_start_time_dt,
+                ffmpeg_threads=ffmpeg_threads,
+            )
+        else:
+            assert 0 < video_sample_interval, (
+                "expect positive video_sample_interval but got {video_sample_interval}"
+            )
+            _sample_single_video_by_interval(
+                video_path,
+                sample_dir,
+                sample_interval=video_sample_interval,
+                duration_ratio=video_duration_ratio,
+                start_time=video_start_time_dt,
+                ffmpeg_threads=ffmpeg_threads,
+            )
+
+    LOG.debug("Sampling %d videos with %d workers", len(sample_jobs), num_workers)
+
+    skipped: list[Path] = []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {
+            executor.submit(_sample_single_video, video_path, sample_dir): video_path
+            for video_path, sample_dir in sample_jobs
+        }
 
         try:
-            if 0 <= video_sample_distance:
-                _sample_single_video_by_distance(
-                    video_path,
-                    sample_dir,
-                    sample_distance=video_sample_distance,
-                    start_time=video_start_time_dt,
-                )
-            else:
-                assert 0 < video_sample_interval, (
-                    "expect positive video_sample_interval but got {video_sample_interval}"
-                )
-                _sample_single_video_by_interval(
-                    video_path,
-                    sample_dir,
-                    sample_interval=video_sample_interval,
-                    duration_ratio=video_duration_ratio,
-                    start_time=video_start_time_dt,
-                )
-        except ffmpeglib.FFmpegNotFoundError as ex:
-            # fatal error
-            raise exceptions.MapillaryFFmpegNotFoundError(str(ex)) from ex
-
-        except Exception as ex:
-            if skip_sample_errors:
-                LOG.warning(
-                    "Skipping the error sampling %s: %s",
-                    video_path,
-                    str(ex),
-                    exc_info=LOG.isEnabledFor(logging.DEBUG),
-                )
-            else:
-                raise
+            for future in tqdm(
+                concurrent.futures.as_completed(futures),
+                desc="Sampling videos",
+                unit="videos",
+                disable=num_workers <= 1 or LOG.isEnabledFor(logging.DEBUG),
+                total=len(futures),
+            ):
+                video_path = futures[future]
+                try:
+                    future.result()
+                except ffmpeglib.FFmpegNotFoundError as ex:
+                    # fatal error
+                    raise exceptions.MapillaryFFmpegNotFoundError(str(ex)) from ex
+
+                except Exception as ex:
+                    if skip_sample_errors:
+                        LOG.warning(
+                            "Skipping the error sampling %s: %s",
+                            video_path,
+                            str(ex),
+                            exc_info=LOG.isEnabledFor(logging.DEBUG),
+                        )
+                        skipped.append(video_path)
+                    else:
+                        raise
+        except BaseException:
+            # Do not start the pending jobs, but wait for the running ones
+            # so their WIP directories are cleaned up
+            for future in futures:
+                future.cancel()
+            raise
+
+    if skipped:
+        LOG.warning(
+            "Skipped %d of %d videos due to sampling errors",
+            len(skipped),
+            len(sample_jobs),
+        )
+
+
+def _resolve_num_sample_workers(num_sample_workers: int | None, num_jobs: int) -> int:
+    """
+    Return the number of videos to sample concurrently.
+    If not specified, each job is assumed to keep VIDEO_SAMPLE_FFMPEG_THREADS CPUs busy.
+    """
+    if num_sample_workers is None:
+        cpu_count = os.cpu_count() or 1
+        num_sample_workers = cpu_count // max(constants.VIDEO_SAMPLE_FFMPEG_THREADS, 1)
+    return max(1, min(num_sample_workers, num_jobs))
 
 
 @contextmanager
-def wip_dir_context(wip_dir: Path, done_dir: Path, rename_timeout_sec: int = 10):
+def wip_dir_context(
+    wip_dir: Path, done_dir: Path, rename_timeout_sec: int = 10, resumable=False
+):
+    """
+    If resumable, the existing WIP dir is reused, and kept if an error occurs,
+    so that the next run can resume from it
+    """
     assert wip_dir != done_dir, "should not be the same dir"
-    shutil.rmtree(wip_dir, ignore_errors=True)
-    os.makedirs(wip_dir)
+    if not resumable:
+        shutil.rmtree(wip_dir, ignore_errors=True)
+    os.makedirs(wip_dir, exist_ok=resumable)
     try:
         yield wip_dir
         shutil.rmtree(done_dir, ignore_errors=True)
@@ -167,7 +266,8 @@ def wip_dir_context(wip_dir: Path, done_dir: Path, rename_timeout_sec: int = 10)
         else:
             wip_dir.rename(done_dir)
     finally:
-        shutil.rmtree(wip_dir, ignore_errors=True)
+        if not resumable:
+            shutil.rmtree(wip_dir, ignore_errors=True)
 
 
 def wip_sample_dir(sample_dir: Path) -> Path:
@@ -179,38 +279,429 @@ def wip_sample_dir(sample_dir: Path) -> Path:
     )
 
 
+def checkpoint_sample_dir(sample_dir: Path) -> Path:
+    # Same name in every run so that interrupted sampling can be resumed
+    return sample_dir.resolve().parent.joinpath(
+        f".mly_ffmpeg_{sample_dir.name}_checkpoint"
+    )
+
+
+class _SampleCheckpoint:
+    """
+    Records the indices of the frames that are sampled (written with EXIF) in the WIP dir,
+    one per line after the header line that identifies the sampling,
+    so that an interrupted sampling can be resumed after the completed frames.
+    """
+
+    FILENAME = ".mly_checkpoint"
+
+    def __init__(self, fp: T.TextIO, completed: list[int]):
+        self._fp = fp
+        self.completed = completed
+
+    @classmethod
+    @contextmanager
+    def open(
+        cls, wip_dir: Path, header: dict[str, T.Any]
+    ) -> T.Generator[_SampleCheckpoint, None, None]:
+        """
+        Load the completed frames if the checkpoint has the same header,
+        or start a new checkpoint in the emptied WIP dir.
+        The checkpoint is removed once the context exits without errors.
+        """
+        path = wip_dir.joinpath(cls.FILENAME)
+        header_line = json.dumps(header, sort_keys=True, separators=(",", ":"))
+
+        completed = cls._load(path, header_line)
+        if completed is None:
+            completed = []
+            # Remove the samples of a different sampling, otherwise they would be
+            # renamed into the sample dir along with the new samples
+            shutil.rmtree(wip_dir, ignore_errors=True)
+            os.makedirs(wip_dir, exist_ok=True)
+            with path.open("w") as fp:
+                fp.write(header_line + "\n")
+
+        with path.open("a") as fp:
+            yield cls(fp, completed)
+
+        path.unlink()
+
+    @classmethod
+    def _load(cls, path: Path, header_line: str) -> list[int] | None:
+        try:
+            with path.open("r") as fp:
+                lines = fp.read().split("\n")
+        except FileNotFoundError:
+            return None
+
+        if lines[0] != header_line:
+            return None
+
+        # The last line is either empty or partially written
+        try:
+            return [int(line) for line in lines[1:-1]]
+        except ValueError:
+            return None
+
+    def count_completed_prefix(self, sorted_frame_indices: T.Sequence[int]) -> int:
+        """
+        Return the number of the leading frames that are completed
+        """
+        count = 0
+        for completed, frame_idx in zip(self.completed, sorted_frame_indices):
+            if completed != frame_idx:
+                break
+            count += 1
+        return count
+
+    def add(self, frame_idx: int) -> None:
+        self.completed.append(frame_idx)
+        self._fp.write(f"{frame_idx}\n")
+        self._fp.flush()
+
+
+def _get_sampling_profile() -> ffmpeglib.SamplingProfile:
+    try:
+        return ffmpeglib.get_sampling_profile(constants.VIDEO_SAMPLE_PROFILE)
+    except ValueError as ex:
+        raise exceptions.MapillaryBadParameterError(str(ex)) from ex
+
+
+def _create_ffmpeg(threads: int | None = None) -> ffmpeglib.FFMPEG:
+    profile = _get_sampling_profile()
+
+    if threads is None:
+        return ffmpeglib.FFMPEG(
+            constants.FFMPEG_PATH, constants.FFPROBE_PATH, profile=profile
+        )
+
+    # Threads are limited only when sampling videos concurrently,
+    # in which case capture stderr to keep the ffmpeg outputs from interleaving
+    # (it is included in FFmpegCalledProcessError if ffmpeg fails)
+    return ffmpeglib.FFMPEG(
+        constants.FFMPEG_PATH,
+        constants.FFPROBE_PATH,
+        stderr=subprocess.PIPE,
+        threads=threads,
+        profile=profile,
+    )
+
+
+# ffmpeg names of the common sample formats in MP4/MOV
+_CODEC_NAMES = {
+    b"avc1": "h264",
+    b"avc3": "h264",
+    b"hvc1": "hevc",
+    b"hev1": "hevc",
+    b"mp4v": "mpeg4",
+    b"jpeg": "mjpeg",
+    b"mjpa": "mjpeg",
+    b"mjpb": "mjpegb",
+    b"mp4a": "aac",
+}
+
+_CODEC_TYPES = {
+    b"vide": "video",
+    b"soun": "audio",
+    b"subt": "subtitle",
+    b"text": "subtitle",
+    b"sbtl": "subtitle",
+}
+
+# Seconds between 1904-01-01 (MP4 epoch) and 1970-01-01 (Unix epoch)
+_MP4_EPOCH_OFFSET = 2082844800
+
+
+def _format_mp4_creation_time(creation_time: int) -> str | None:
+    if not creation_time:
+        return None
+    # Same as ffmpeg: some muxers write Unix timestamps instead of MP4 timestamps
+    if _MP4_EPOCH_OFFSET <= creation_time:
+        creation_time -= _MP4_EPOCH_OFFSET
+    dt = datetime.datetime.fromtimestamp(creation_time, datetime.timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _probe_mp4_track(
+    track: mp4_sample_parser.TrackBoxParser, index: int, movie_timescale: int
+) -> ffmpeglib.Stream:
+    hdlr = cparser.find_box_at_pathx(track.trak_children, [b"mdia", b"hdlr"])
+    handler_type = T.cast(T.Dict[str, T.Any], hdlr["data"])["handler_type"]
+    mdhd = track.extract_mdhd_boxdata()
+    elst = track.extract_elst_boxdata()
+
+    stream: dict[str, T.Any] = {
+        "index": index,
+        "codec_type": _CODEC_TYPES.get(handler_type, "data"),
+        "nb_frames": str(len(track.extract_sample_table())),
+    }
+
+    start_time = 0.0
+    if elst is not None and elst["entries"]:
+        # Empty edits (media_time -1) delay the start of the track
+        duration = 0
+        for entry in elst["entries"]:
+            if entry["media_time"] == -1 and not duration:
+                start_time += entry["segment_duration"] / movie_timescale
+            else:
+                duration += entry["segment_duration"]
+        stream["duration"] = str(duration / movie_timescale)
+    else:
+        stream["duration"] = str(mdhd["duration"] / mdhd["timescale"])
+        # Without an edit list, the track starts at the earliest presentation time,
+        # e.g. after the composition offsets of B-frames
+        start_time = min(
+            (sample.exact_composition_time for sample in track.extract_samples()),
+            default=0.0,
+        )
+    stream["start_time"] = str(start_time)
+
+    creation_time = _format_mp4_creation_time(mdhd["creation_time"])
+    if creation_time is not None:
+        stream["tags"] = {"creation_time": creation_time}
+
+    descriptions = track.extract_sample_descriptions()
+    if descriptions:
+        sample_format = descriptions[0]["format"]
+        stream["codec_tag_string"] = sample_format.decode("latin-1")
+        stream["codec_name"] = _CODEC_NAMES.get(
+            sample_format, stream["codec_tag_string"]
+        )
+        data = descriptions[0]["data"]
+        # VisualSampleEntry: pre_defined (2), reserved (2), pre_defined (12), width (2), height (2)
+        if stream["codec_type"] == "video" and 20 <= len(data):
+            stream["width"], stream["height"] = struct.unpack_from(">HH", data, 16)
+
+    return T.cast(ffmpeglib.Stream, stream)
+
+
+def _parse_mp4(video_path: Path) -> mp4_sample_parser.MovieBoxParser | None:
+    """
+    Parse the moov box of the video (via the moov cache),
+    or return None if the video is not an MP4/MOV
+    """
+    try:
+        return mp4_sample_parser.MovieBoxParser.parse_file(video_path)
+    except (sparser.ParsingError, cparser.BoxNotFoundError, C.ConstructError) as ex:
+        LOG.debug("Unable to parse %s as MP4: %s", video_path, ex)
+        return None
+
+
+def probe_mp4_format_and_streams(
+    moov_parser: mp4_sample_parser.MovieBoxParser,
+) -> ffmpeglib.ProbeOutput | None:
+    """
+    Probe the format and streams of an MP4/MOV video from its moov box without ffprobe.
+
+    Only the fields that sampling depends on are populated, in the same format as ffprobe.
+    Streams are indexed in the order of their tracks, same as ffmpeg stream specifiers.
+
+    Args:
+        moov_parser: The parsed moov box of the video
+
+    Returns:
+        ffprobe-like output, or None if the video is fragmented or no tracks can be parsed
+        (e.g. the moov box is truncated), and has to be probed with ffprobe
+    """
+    try:
+        # The durations of fragmented MP4s are only known after reading all fragments
+        if cparser.find_box_at_path(moov_parser.moov_children, [b"mvex"]):
+            return None
+        mvhd = moov_parser.extract_mvhd_boxdata()
+        streams = [
+            _probe_mp4_track(track, index, mvhd["timescale"])
+            for index, track in enumerate(moov_parser.extract_tracks())
+        ]
+    except (sparser.ParsingError, cparser.BoxNotFoundError, C.ConstructError) as ex:
+        LOG.debug("Unable to probe the moov box: %s", ex)
+        return None
+
+    if not streams:
+        LOG.debug("No tracks found in the moov box")
+        return None
+
+    return {
+        "streams": streams,
+        "format": {
+            "duration": str(mvhd["duration"] / mvhd["timescale"]),
+            "start_time": str(
+                min((float(s["start_time"]) for s in streams), default=0.0)
+            ),
+        },
+    }
+
+
+class ProbeCache:
+    """
+    An in-memory LRU cache of probe outputs, keyed by the same file key as the moov cache,
+    so a modified file is probed again
+    """
+
+    _entries: collections.OrderedDict[moov_cache.FileKey, ffmpeglib.ProbeOutput]
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_key(video_path: Path) -> moov_cache.FileKey | None:
+        try:
+            with video_path.open("rb") as fp:
+                return moov_cache.stream_file_key(fp)
+        except OSError:
+            return None
+
+    def probe(
+        self, video_path: Path, probe_func: T.Callable[[Path], ffmpeglib.ProbeOutput]
+    ) -> ffmpeglib.ProbeOutput:
+        """
+        Return a copy of the cached probe output of the video, or probe it with probe_func and cache it
+        """
+        key = self._file_key(video_path)
+        if key is None or self.maxsize <= 0:
+            return probe_func(video_path)
+
+        with self._lock:
+            probe_output = self._entries.get(key)
+            if probe_output is not None:
+                self._entries.move_to_end(key)
+
+        if probe_output is None:
+            probe_output = probe_func(video_path)
+            with self._lock:
+                self._entries[key] = probe_output
+                while self.maxsize < len(self._entries):
+                    self._entries.popitem(last=False)
+
+        # Callers may modify the output
+        return copy.deepcopy(probe_output)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Shared by all samplers in the process
+PROBE_CACHE = ProbeCache(maxsize=1024)
+
+
+def _probe_video(
+    ffmpeg: ffmpeglib.FFMPEG,
+    video_path: Path,
+    moov_parser: mp4_sample_parser.MovieBoxParser | None = None,
+) -> ffmpeglib.Probe:
+    """
+    Probe the video natively if it is an MP4/MOV, otherwise with ffprobe.
+    Pass moov_parser if the moov box of the video is already parsed
+    """
+
+    def _probe_format_and_streams(video_path: Path) -> ffmpeglib.ProbeOutput:
+        if constants.VIDEO_NATIVE_PROBE:
+            parser = moov_parser if moov_parser is not None else _parse_mp4(video_path)
+            if parser is not None:
+                probe_output = probe_mp4_format_and_streams(parser)
+                if probe_output is not None:
+                    return probe_output
+        return ffmpeg.probe_format_and_streams(video_path)
+
+    return ffmpeglib.Probe(PROBE_CACHE.probe(video_path, _probe_format_and_streams))
+
+
 def _sample_single_video_by_interval(
     video_path: Path,
     sample_dir: Path,
     sample_interval: float,
     duration_ratio: float,
     start_time: datetime.datetime | None = None,
+    ffmpeg_threads: int | None = None,
 ) -> None:
-    ffmpeg = ffmpeglib.FFMPEG(constants.FFMPEG_PATH, constants.FFPROBE_PATH)
+    ffmpeg = _create_ffmpeg(ffmpeg_threads)
 
-    if start_time is None:
-        start_time = ffmpeglib.Probe(
-            ffmpeg.probe_format_and_streams(video_path)
-        ).probe_video_start_time()
+    stream_specifiers: list[str] | None = None
+    if start_time is None or constants.VIDEO_SAMPLE_ALL_STREAMS:
+        probe = _probe_video(ffmpeg, video_path)
         if start_time is None:
-            raise exceptions.MapillaryVideoError(
-                f"Unable to extract video start time from {video_path}"
-            )
+            start_time = probe.probe_video_start_time()
+            if start_time is None:
+                raise exceptions.MapillaryVideoError(
+                    f"Unable to extract video start time from {video_path}"
+                )
+        if constants.VIDEO_SAMPLE_ALL_STREAMS:
+            video_streams = probe.probe_video_streams()
+            if 1 < len(video_streams):
+                stream_specifiers = [str(stream["index"]) for stream in video_streams]
 
     with wip_dir_context(wip_sample_dir(sample_dir), sample_dir) as wip_dir:
-        ffmpeg.extract_frames_by_interval(video_path, wip_dir, sample_interval)
-        frame_samples = ffmpeglib.FFMPEG.sort_selected_samples(wip_dir, video_path)
-        for frame_idx_1based, sample_paths in frame_samples:
-            assert len(sample_paths) == 1
-            if sample_paths[0] is None:
-                continue
+        for frame_idx_1based, exif_edit, sample_path in _iterate_interval_samples(
+            ffmpeg, video_path, wip_dir, sample_interval, stream_specifiers
+        ):
             # extract_frames() produces 1-based frame indices so we need to subtract 1 here
             seconds = (frame_idx_1based - 1) * sample_interval * duration_ratio
             timestamp = start_time + datetime.timedelta(seconds=seconds)
-            exif_edit = ExifEdit(sample_paths[0])
             exif_edit.add_date_time_original(timestamp)
             exif_edit.add_gps_datetime(timestamp)
-            exif_edit.write()
+            exif_edit.write(sample_path)
+
+
+def _pipe_sample_path(
+    sample_dir: Path, video_path: Path, stream_specifier: str, frame_idx_1based: int
+) -> Path:
+    # Same as the files extracted by ffmpeg
+    return sample_dir.joinpath(
+        f"{video_path.stem}_{stream_specifier}_{frame_idx_1based:06d}{ffmpeglib.FFMPEG.FRAME_EXT}"
+    )
+
+
+def _iterate_interval_samples(
+    ffmpeg: ffmpeglib.FFMPEG,
+    video_path: Path,
+    sample_dir: Path,
+    sample_interval: float,
+    stream_specifiers: list[str] | None = None,
+) -> T.Generator[tuple[int, ExifEdit, Path], None, None]:
+    """
+    Yield the 1-based frame index, the image to write EXIF to, and the path to write the image to.
+    If stream_specifiers are specified, the frames of all these streams are extracted in one ffmpeg run
+    """
+    if stream_specifiers is not None:
+        ffmpeg.extract_frames_by_interval_from_streams(
+            video_path, sample_dir, sample_interval, stream_specifiers
+        )
+        frame_samples = ffmpeglib.FFMPEG.sort_selected_samples(
+            sample_dir,
+            video_path,
+            selected_stream_specifiers=list(stream_specifiers),
+        )
+        for frame_idx_1based, sample_paths in frame_samples:
+            for stream_specifier, sample_path in zip(stream_specifiers, sample_paths):
+                if sample_path is None:
+                    continue
+                exif_edit = ExifEdit(sample_path)
+                _add_stream_lens(exif_edit, stream_specifier)
+                yield frame_idx_1based, exif_edit, sample_path
+        return
+
+    if constants.VIDEO_SAMPLE_PIPE:
+        frames = ffmpeg.iterate_frames_by_interval(video_path, sample_interval)
+        for frame_idx_1based, image in enumerate(frames, 1):
+            sample_path = _pipe_sample_path(
+                sample_dir, video_path, "v", frame_idx_1based
+            )
+            yield frame_idx_1based, ExifEdit(image), sample_path
+        return
+
+    ffmpeg.extract_frames_by_interval(video_path, sample_dir, sample_interval)
+    frame_samples = ffmpeglib.FFMPEG.sort_selected_samples(sample_dir, video_path)
+    for frame_idx_1based, sample_paths in frame_samples:
+        assert len(sample_paths) == 1
+        if sample_paths[0] is None:
+            continue
+        yield frame_idx_1based, ExifEdit(sample_paths[0]), sample_paths[0]
 
 
 def _within_track_time_range_buffered(points, t: float) -> bool:
@@ -220,71 +711,543 @@ def _within_track_time_range_buffered(points, t: float) -> bool:
     return start_point_time <= t <= end_point_time
 
 
+def _select_frames_by_distance(
+    points: T.Sequence[geo.Point],
+    frame_times: T.Sequence[float],
+    sample_distance: float,
+) -> list[tuple[int, geo.Point]]:
+    """
+    Select the frames (indices of the sorted frame times) within the track time range,
+    each farther than sample_distance from the previously selected frame, i.e.
+    the same frames as geo.sample_points_by_distance over all interpolated frames.
+
+    Instead of interpolating every frame, compute the cumulative along-track distances
+    of the points once, and bisect for the next frame that can be farther than
+    the remaining distance (the straight-line distance between two frames never exceeds
+    their along-track distance). Only these candidate frames are interpolated.
+    """
+    # the first frame within the time range, see _within_track_time_range_buffered
+    start = bisect.bisect_left(frame_times, points[0].time - 0.001)
+
+    track_times = [p.time for p in points]
+    track_distances = list(
+        itertools.accumulate(
+            geo.gps_distances([p.lat for p in points], [p.lon for p in points]),
+            initial=0.0,
+        )
+    )
+
+    def _distance_at(t: float) -> float:
+        # the along-track distance at time t
+        idx = bisect.bisect_right(track_times, t)
+        if idx <= 0:
+            return 0.0
+        if len(track_times) <= idx:
+            return track_distances[-1]
+        t0, t1 = track_times[idx - 1], track_times[idx]
+        d0, d1 = track_distances[idx - 1], track_distances[idx]
+        return d0 + (d1 - d0) * (t - t0) / (t1 - t0)
+
+    def _time_at(distance: float) -> float | None:
+        # the last time the along-track distance is at most the distance,
+        # or None if the track ends before exceeding it
+        idx = bisect.bisect_right(track_distances, distance)
+        if idx <= 0:
+            return track_times[0]
+        if len(track_distances) <= idx:
+            return None
+        t0, t1 = track_times[idx - 1], track_times[idx]
+        d0, d1 = track_distances[idx - 1], track_distances[idx]
+        return t0 + (t1 - t0) * (distance - d0) / (d1 - d0)
+
+    interpolator = geo.Interpolator([points])
+    selected: list[tuple[int, geo.Point]] = []
+    prev_ecef: geo.ECEF | None = None
+
+    idx = start
+    while idx < len(frame_times) and _within_track_time_range_buffered(
+        points, frame_times[idx]
+    ):
+        frame_time = frame_times[idx]
+        interp = interpolator.interpolate_at(frame_time)
+        [ecef] = geo.ecef_from_latlons([interp.lat], [interp.lon])
+
+        if prev_ecef is None:
+            remaining = 0.0
+        else:
+            remaining = sample_distance - geo.ecef_distance(prev_ecef, ecef)
+
+        if prev_ecef is None or remaining < 0:
+            selected.append((idx, interp))
+            prev_ecef = ecef
+            remaining = sample_distance
+
+        # No frame is farther than sample_distance from the selected frame
+        # until the along-track distance exceeds the remaining distance
+        next_time = _time_at(_distance_at(frame_time) + remaining)
+        if next_time is None:
+            break
+        idx = max(idx + 1, bisect.bisect_right(frame_times, next_time, lo=idx))
+
+    return selected
+
+
+class _VideoFrames:
+    """
+    The frames of a video track in composition order (CT), i.e. the order ffmpeg outputs them,
+    not the decoding order (DT) of the samples.
+
+    Only the composition times and the sync samples are read from the lazy sample table,
+    and the samples of the frames are built on demand
+    """
+
+    def __init__(
+        self,
+        composition_times: list[float],
+        sync_indices: list[int],
+        sample_at: T.Callable[[int], mp4_sample_parser.Sample],
+    ):
+        # Sorted composition times in seconds
+        self.composition_times = composition_times
+        # Sorted frame indices of the sync samples (keyframes)
+        self.sync_indices = sync_indices
+        self._sample_at = sample_at
+
+    @classmethod
+    def from_track(
+        cls, video_track_parser: mp4_sample_parser.TrackBoxParser
+    ) -> _VideoFrames:
+        if video_track_parser.is_fragmented():
+            # The samples in movie fragments are not in the sample table
+            return cls.from_samples(video_track_parser.extract_samples())
+
+        table = video_track_parser.extract_sample_table()
+        timescale = video_track_parser.extract_mdhd_boxdata()["timescale"]
+
+        composition_times = table.composition_times()
+        # Stable sort, so frames with the same composition time keep the decoding order
+        sample_indices = sorted(
+            range(len(composition_times)), key=composition_times.__getitem__
+        )
+
+        syncs = table.syncs
+        if syncs is None:
+            sync_indices = list(range(len(sample_indices)))
+        else:
+            sync_indices = [
+                frame_idx
+                for frame_idx, sample_idx in enumerate(sample_indices)
+                if sample_idx + 1 in syncs
+            ]
+
+        return cls(
+            [composition_times[idx] / timescale for idx in sample_indices],
+            sync_indices,
+            lambda frame_idx: table.sample_at(sample_indices[frame_idx], timescale),
+        )
+
+    @classmethod
+    def from_samples(
+        cls, samples: T.Iterable[mp4_sample_parser.Sample]
+    ) -> _VideoFrames:
+        sorted_samples = sorted(
+            samples, key=lambda sample: sample.exact_composition_time
+        )
+        return cls(
+            [sample.exact_composition_time for sample in sorted_samples],
+            [
+                frame_idx
+                for frame_idx, sample in enumerate(sorted_samples)
+                if sample.raw_sample.is_sync
+            ],
+            sorted_samples.__getitem__,
+        )
+
+    def __len__(self) -> int:
+        return len(self.composition_times)
+
+    def sample_at(self, frame_idx: int) -> mp4_sample_parser.Sample:
+        return self._sample_at(frame_idx)
+
+
 def _sample_video_stream_by_distance(
     points: T.Sequence[geo.Point],
-    video_track_parser: mp4_sample_parser.TrackBoxParser,
+    frames: _VideoFrames,
     sample_distance: float,
 ) -> dict[int, tuple[mp4_sample_parser.Sample, geo.Point]]:
     """
     Locate video frames along the track (points), then resample them by the minimal sample_distance, and return the sparse frames.
     """
 
-    LOG.info("Extracting video samples")
-    sorted_samples = list(video_track_parser.extract_samples())
-    # we need sort sampels by composition time (CT) not the decoding offset (DT)
-    # CT is the oder of videos streaming to audiences, as well as the order ffmpeg sampling
-    sorted_samples.sort(key=lambda sample: sample.exact_composition_time)
-    LOG.info("Found total %d video samples", len(sorted_samples))
+    LOG.info("Found total %d video samples", len(frames))
 
-    # interpolate sample points between the GPS track range (with 1ms buffer)
+    # select the samples in the GPS track range (with 1ms buffer) by sample distance
     LOG.info(
-        "Interpolating video samples in the time range from %s to %s",
+        "Selecting video samples in the time range from %s to %s",
         points[0].time,
         points[-1].time,
     )
-    interpolator = geo.Interpolator([points])
-    interp_sample_points = [
-        (
-            frame_idx_0based,
-            video_sample,
-            interpolator.interpolate(video_sample.exact_composition_time),
-        )
-        for frame_idx_0based, video_sample in enumerate(sorted_samples)
-        if _within_track_time_range_buffered(
-            points, video_sample.exact_composition_time
-        )
-    ]
-    LOG.info("Found total %d interpolated video samples", len(interp_sample_points))
-
-    # select sample points by sample distance
-    selected_interp_sample_points = list(
-        geo.sample_points_by_distance(
-            interp_sample_points,
-            sample_distance,
-            point_func=lambda x: x[2],
-        )
+    selected = _select_frames_by_distance(
+        points, frames.composition_times, sample_distance
     )
     LOG.info(
         "Selected %d video samples by the minimal sample distance %s",
-        len(selected_interp_sample_points),
+        len(selected),
         sample_distance,
     )
 
+    # Only the samples of the selected frames are built
     return {
-        frame_idx_0based: (video_sample, interp)
-        for frame_idx_0based, video_sample, interp in selected_interp_sample_points
+        frame_idx_0based: (frames.sample_at(frame_idx_0based), interp)
+        for frame_idx_0based, interp in selected
     }
 
 
+class _FrameSeekGroup(T.NamedTuple):
+    # Index (in composition order) of the sync sample (keyframe) to seek to
+    sync_idx: int
+    # Indices (in composition order) of the frames to extract after seeking
+    frame_indices: list[int]
+
+
+# Starting an ffmpeg process and seeking costs roughly as much as decoding this many frames
+_SEEK_OVERHEAD_FRAMES = 60
+
+
+def _plan_seek_groups(
+    frames: _VideoFrames,
+    sorted_frame_indices: T.Sequence[int],
+) -> list[_FrameSeekGroup]:
+    """
+    Group the frames by the sync sample they are decoded from. Adjacent groups are merged
+    if decoding the frames between them is cheaper than seeking again.
+    """
+    sync_indices = frames.sync_indices
+
+    groups: list[_FrameSeekGroup] = []
+    for frame_idx in sorted_frame_indices:
+        pos = bisect.bisect_right(sync_indices, frame_idx)
+        sync_idx = sync_indices[pos - 1] if pos else 0
+        if groups and sync_idx - groups[-1].frame_indices[-1] <= _SEEK_OVERHEAD_FRAMES:
+            groups[-1].frame_indices.append(frame_idx)
+        else:
+            groups.append(_FrameSeekGroup(sync_idx, [frame_idx]))
+
+    return groups
+
+
+def _should_seek(groups: T.Sequence[_FrameSeekGroup], total_frames: int) -> bool:
+    mode = constants.VIDEO_FRAME_EXTRACTION_MODE
+
+    if mode == "decode":
+        return False
+
+    if mode == "seek":
+        return True
+
+    if mode != "auto":
+        raise exceptions.MapillaryBadParameterError(
+            f'Expect the video frame extraction mode to be "auto", "decode" or "seek" but got "{mode}"'
+        )
+
+    decoded_frames = sum(
+        group.frame_indices[-1] - group.sync_idx + 1 + _SEEK_OVERHEAD_FRAMES
+        for group in groups
+    )
+    return decoded_frames < total_frames
+
+
+class _FrameExtractionJob(T.NamedTuple):
+    # Seek the input to this position (in seconds) before decoding, or decode from the beginning
+    seek_time: float | None
+    # Frame indices relative to the seek position
+    frame_indices: set[int]
+    # Number of the first extracted frame (1-based)
+    start_number: int
+
+
+def _plan_frame_extraction(
+    sorted_frame_indices: T.Sequence[int],
+    frames: _VideoFrames,
+    stream_start_offset: float,
+    start_number: int = 1,
+) -> list[_FrameExtractionJob]:
+    """
+    Plan to extract the frames either by decoding the whole video stream,
+    or by seeking to the keyframe before each group of frames when they are sparse,
+    e.g. one frame every few meters on a highway.
+    The extracted frames are numbered from start_number in the order of the frame indices either way.
+    When resuming (start_number > 1), decoding starts from the keyframe before the first frame.
+    """
+    groups = _plan_seek_groups(frames, sorted_frame_indices)
+
+    if not len(frames) or not _should_seek(groups, len(frames)):
+        if start_number == 1 or not len(frames):
+            return [_FrameExtractionJob(None, set(sorted_frame_indices), start_number)]
+        groups = [_FrameSeekGroup(groups[0].sync_idx, list(sorted_frame_indices))]
+
+    LOG.info(
+        "Extracting %d frames by seeking %d times",
+        len(sorted_frame_indices),
+        len(groups),
+    )
+
+    # Timestamps in ffmpeg start from the first presented frame (after applying edit lists)
+    start_composition_time = frames.composition_times[0]
+
+    jobs: list[_FrameExtractionJob] = []
+    for group in groups:
+        if group.sync_idx == 0:
+            seek_time = None
+        else:
+            sync_sample = frames.sample_at(group.sync_idx)
+            # Seek half a frame earlier so that rounding errors never drop the keyframe itself
+            seek_time = max(
+                0.0,
+                sync_sample.exact_composition_time
+                - start_composition_time
+                + stream_start_offset
+                - sync_sample.exact_timedelta / 2,
+            )
+        jobs.append(
+            _FrameExtractionJob(
+                seek_time,
+                {idx - group.sync_idx for idx in group.frame_indices},
+                start_number,
+            )
+        )
+        start_number += len(group.frame_indices)
+
+    return jobs
+
+
+def _extract_specified_frames(
+    ffmpeg: ffmpeglib.FFMPEG,
+    video_path: Path,
+    sample_dir: Path,
+    jobs: T.Sequence[_FrameExtractionJob],
+    stream_specifier: str,
+) -> None:
+    for job in jobs:
+        ffmpeg.extract_specified_frames(
+            video_path,
+            sample_dir,
+            frame_indices=job.frame_indices,
+            stream_specifier=stream_specifier,
+            seek_time=job.seek_time,
+            start_number=job.start_number,
+        )
+
+
+def _iterate_specified_frames(
+    ffmpeg: ffmpeglib.FFMPEG,
+    video_path: Path,
+    jobs: T.Sequence[_FrameExtractionJob],
+    stream_specifier: str,
+) -> T.Generator[bytes, None, None]:
+    for job in jobs:
+        yield from ffmpeg.iterate_specified_frames(
+            video_path,
+            frame_indices=job.frame_indices,
+            stream_specifier=stream_specifier,
+            seek_time=job.seek_time,
+        )
+
+
+def _iterate_distance_samples(
+    ffmpeg: ffmpeglib.FFMPEG,
+    video_path: Path,
+    sample_dir: Path,
+    jobs: T.Sequence[_FrameExtractionJob],
+    stream_specifier: str,
+    expected_count: int,
+    pipe: bool = False,
+) -> T.Generator[tuple[ExifEdit, Path] | None, None, None]:
+    """
+    Yield the image to write EXIF to and the path to write the image to, in the order of the frame indices,
+    or None if the frame is missing
+    """
+    # Frames before it were sampled in a previous run
+    first_number = jobs[0].start_number if jobs else 1
+
+    if pipe:
+        count = 0
+        frames = _iterate_specified_frames(ffmpeg, video_path, jobs, stream_specifier)
+        for count, image in enumerate(frames, 1):
+            if expected_count < count:
+                continue
+            sample_path = _pipe_sample_path(
+                sample_dir, video_path, stream_specifier, first_number + count - 1
+            )
+            yield ExifEdit(image), sample_path
+        if count != expected_count:
+            raise exceptions.MapillaryVideoError(
+                f"Expect {expected_count} samples but extracted {count} samples"
+            )
+        return
+
+    _extract_specified_frames(ffmpeg, video_path, sample_dir, jobs, stream_specifier)
+
+    frame_samples = [
+        (frame_idx_1based, sample_paths)
+        for frame_idx_1based, sample_paths in ffmpeglib.FFMPEG.sort_selected_samples(
+            sample_dir, video_path, selected_stream_specifiers=[stream_specifier]
+        )
+        if first_number <= frame_idx_1based
+    ]
+    if len(frame_samples) != expected_count:
+        raise exceptions.MapillaryVideoError(
+            f"Expect {expected_count} samples but extracted {len(frame_samples)} samples"
+        )
+    for idx, (frame_idx_1based, sample_paths) in enumerate(frame_samples):
+        assert len(sample_paths) == 1, (
+            "Expect 1 sample path at {frame_idx_1based} but got {sample_paths}"
+        )
+        if idx + first_number != frame_idx_1based:
+            raise exceptions.MapillaryVideoError(
+                f"Expect {sample_paths[0]} to be {idx + first_number}th sample but got {frame_idx_1based}"
+            )
+
+    for _, sample_paths in frame_samples:
+        if sample_paths[0] is None:
+            yield None
+        else:
+            yield ExifEdit(sample_paths[0]), sample_paths[0]
+
+
+def _should_copy_jpeg_samples(
+    video_path: Path,
+    video_stream: ffmpeglib.Stream,
+    video_samples: T.Sequence[mp4_sample_parser.Sample],
+) -> bool:
+    """
+    Return True if the samples of the video stream are JPEG images that can be copied
+    from the video file as they are, instead of decoding and re-encoding them with ffmpeg
+    """
+    if not constants.VIDEO_SAMPLE_STREAM_COPY:
+        return False
+
+    if not ffmpeglib.Probe.is_jpeg_stream(video_stream):
+        return False
+
+    # Motion JPEG format A samples may hold the two fields of an interlaced frame
+    if video_stream.get("codec_tag_string") == "mjpa":
+        return False
+
+    # Scaling the frames requires re-encoding them
+    if _get_sampling_profile().max_size is not None:
+        return False
+
+    if not video_samples:
+        return False
+
+    # Some MJPEG streams omit the Huffman tables, hence their samples are not valid JPEG images
+    [first_image] = list(_iterate_copied_frames(video_path, video_samples[:1]))
+    return _is_complete_jpeg(first_image)
+
+
+def _iterate_copied_frames(
+    video_path: Path, video_samples: T.Sequence[mp4_sample_parser.Sample]
+) -> T.Generator[bytes, None, None]:
+    with video_path.open("rb") as fp:
+        for _, data in mp4_sample_parser.iterate_read_sample_data(fp, video_samples):
+            yield data
+
+
+def _iterate_copied_samples(
+    video_path: Path,
+    sample_dir: Path,
+    video_samples: T.Sequence[mp4_sample_parser.Sample],
+    stream_specifier: str,
+    start_number: int = 1,
+) -> T.Generator[tuple[ExifEdit, Path], None, int]:
+    """
+    Same as _iterate_distance_samples, but read the JPEG samples from the video file
+    as they are, without decoding or encoding them.
+
+    Stop at the first sample that is not a complete JPEG image,
+    and return the number of the samples copied
+    """
+    copied_count = 0
+    frames = _iterate_copied_frames(video_path, video_samples)
+    for frame_idx_1based, image in enumerate(frames, start_number):
+        if not _is_complete_jpeg(image):
+            LOG.warning(
+                "The sample %d is not a complete JPEG image in %s",
+                frame_idx_1based,
+                video_path,
+            )
+            break
+        sample_path = _pipe_sample_path(
+            sample_dir, video_path, stream_specifier, frame_idx_1based
+        )
+        yield ExifEdit(image), sample_path
+        copied_count += 1
+
+    return copied_count
+
+
+def _is_complete_jpeg(data: bytes) -> bool:
+    """
+    Return True if the data is a single JPEG image that defines its Huffman tables,
+    i.e. neither an MJPEG frame without them nor the two fields of an interlaced frame
+
+    >>> _is_complete_jpeg(b"\\xff\\xd8\\xff\\xc4\\x00\\x02\\xff\\xda\\x00\\x02\\x00\\xff\\xd9")
+    True
+    >>> _is_complete_jpeg(b"\\xff\\xd8\\xff\\xe0\\x00\\x02\\xff\\xda\\x00\\x02\\x00\\xff\\xd9")
+    False
+    >>> _is_complete_jpeg(b"\\xff\\xd8\\xff\\xc4\\x00\\x02\\xff\\xda\\x00\\x02\\x00")
+    False
+    >>> field = b"\\xff\\xd8\\xff\\xc4\\x00\\x02\\xff\\xda\\x00\\x02\\x00\\xff\\xd9"
+    >>> _is_complete_jpeg(field + field)
+    False
+    >>> _is_complete_jpeg(b"\\x00\\x00\\x00\\x00")
+    False
+    """
+    # SOI
+    if not data.startswith(b"\xff\xd8"):
+        return False
+
+    # Walk the marker segments until the scan data (SOS),
+    # so that the markers in the segments (e.g. EXIF thumbnails) are skipped
+    offset = 2
+    has_huffman_tables = False
+    while True:
+        if len(data) < offset + 4 or data[offset] != 0xFF:
+            return False
+        marker = data[offset + 1]
+        # DHT
+        if marker == 0xC4:
+            has_huffman_tables = True
+        # SOS
+        if marker == 0xDA:
+            break
+        offset += 2 + int.from_bytes(data[offset + 2 : offset + 4], "big")
+
+    if not has_huffman_tables:
+        return False
+
+    # 0xFF bytes are stuffed in the scan data, so the first EOI after it ends the image
+    eoi = data.find(b"\xff\xd9", offset)
+    if eoi < 0:
+        return False
+
+    # The second field of an interlaced frame follows the first one
+    return data.find(b"\xff\xd8", eoi + 2) < 0
+
+
 def _sample_single_video_by_distance(
     video_path: Path,
     sample_dir: Path,
     sample_distance: float,
     start_time: datetime.datetime | None = None,
+    ffmpeg_threads: int | None = None,
 ) -> None:
-    ffmpeg = ffmpeglib.FFMPEG(constants.FFMPEG_PATH, constants.FFPROBE_PATH)
+    ffmpeg = _create_ffmpeg(ffmpeg_threads)
 
-    probe = ffmpeglib.Probe(ffmpeg.probe_format_and_streams(video_path))
+    # The moov box is parsed once for both probing and sampling
+    moov_parser = _parse_mp4(video_path)
+    probe = _probe_video(ffmpeg, video_path, moov_parser)
 
     if start_time is None:
         start_time = probe.probe_video_start_time()
@@ -306,72 +1269,289 @@ def _sample_single_video_by_distance(
     assert video_metadata.points, "expect non-empty points"
     LOG.info("Found total %d GPS points", len(video_metadata.points))
 
-    # find the video stream with maximum resolution
-    video_stream = probe.probe_video_with_max_resolution()
-    if not video_stream:
+    video_streams = _video_streams_to_sample(probe)
+    if not video_streams:
         LOG.warning("no video streams found from ffprobe")
         return
 
+    if moov_parser is None:
+        # Raise the parsing error
+        moov_parser = mp4_sample_parser.MovieBoxParser.parse_file(video_path)
+
+    if 1 < len(video_streams):
+        _sample_video_streams_by_distance(
+            ffmpeg,
+            video_path,
+            sample_dir,
+            moov_parser,
+            video_streams,
+            video_metadata,
+            sample_distance=sample_distance,
+            start_time=start_time,
+        )
+        return
+
+    [video_stream] = video_streams
+
     LOG.info("Extracting video samples")
     video_stream_idx = video_stream["index"]
-    moov_parser = mp4_sample_parser.MovieBoxParser.parse_file(video_path)
-    video_track_parser = moov_parser.extract_track_at(video_stream_idx)
+    video_frames = _VideoFrames.from_track(
+        moov_parser.extract_track_at(video_stream_idx)
+    )
     sample_points_by_frame_idx = _sample_video_stream_by_distance(
-        video_metadata.points, video_track_parser, sample_distance
+        video_metadata.points, video_frames, sample_distance
     )
     sorted_sample_indices = sorted(sample_points_by_frame_idx.keys())
 
+    checkpointing = constants.VIDEO_SAMPLE_CHECKPOINT
+    checkpoint_context: T.ContextManager[_SampleCheckpoint | None]
+    if checkpointing:
+        wip_dir = checkpoint_sample_dir(sample_dir)
+        checkpoint_context = _SampleCheckpoint.open(
+            wip_dir,
+            _checkpoint_header(
+                video_path, str(video_stream_idx), sorted_sample_indices, start_time
+            ),
+        )
+    else:
+        wip_dir = wip_sample_dir(sample_dir)
+        checkpoint_context = nullcontext()
+
+    # The checkpoint is opened in the WIP dir, and removed before renaming the WIP dir
+    with wip_dir_context(wip_dir, sample_dir, resumable=checkpointing):
+        with checkpoint_context as checkpoint:
+            completed_count = 0
+            if checkpoint is not None:
+                completed_count = checkpoint.count_completed_prefix(
+                    sorted_sample_indices
+                )
+                if completed_count:
+                    LOG.info(
+                        "Resuming sampling %s after %d of %d samples",
+                        video_path.name,
+                        completed_count,
+                        len(sorted_sample_indices),
+                    )
+            remaining_sample_indices = sorted_sample_indices[completed_count:]
+
+            remaining_video_samples = [
+                sample_points_by_frame_idx[sample_idx][0]
+                for sample_idx in remaining_sample_indices
+            ]
+
+            def _iterate_decoded_samples(
+                sorted_frame_indices: T.Sequence[int], start_number: int
+            ) -> T.Generator[tuple[ExifEdit, Path] | None, None, None]:
+                jobs = _plan_frame_extraction(
+                    sorted_frame_indices,
+                    video_frames,
+                    stream_start_offset=probe.probe_stream_start_offset(video_stream),
+                    start_number=start_number,
+                )
+                yield from _iterate_distance_samples(
+                    ffmpeg,
+                    video_path,
+                    wip_dir,
+                    jobs,
+                    stream_specifier=str(video_stream_idx),
+                    expected_count=len(sorted_frame_indices),
+                    # Each frame is written (and checkpointed) as soon as it is decoded
+                    pipe=constants.VIDEO_SAMPLE_PIPE or checkpoint is not None,
+                )
+
+            def _iterate_copied_or_decoded_samples() -> T.Generator[
+                tuple[ExifEdit, Path] | None, None, None
+            ]:
+                LOG.info(
+                    "Copying %d JPEG samples from %s without re-encoding",
+                    len(remaining_video_samples),
+                    video_path.name,
+                )
+                copied_count = yield from _iterate_copied_samples(
+                    video_path,
+                    wip_dir,
+                    remaining_video_samples,
+                    stream_specifier=str(video_stream_idx),
+                    start_number=completed_count + 1,
+                )
+                if copied_count < len(remaining_sample_indices):
+                    # Fall back to ffmpeg for the rest of the video
+                    LOG.warning(
+                        "Extracting the remaining %d samples from %s with ffmpeg",
+                        len(remaining_sample_indices) - copied_count,
+                        video_path.name,
+                    )
+                    yield from _iterate_decoded_samples(
+                        remaining_sample_indices[copied_count:],
+                        start_number=completed_count + copied_count + 1,
+                    )
+
+            samples: T.Iterable[tuple[ExifEdit, Path] | None]
+            if _should_copy_jpeg_samples(
+                video_path, video_stream, remaining_video_samples
+            ):
+                samples = _iterate_copied_or_decoded_samples()
+            else:
+                samples = _iterate_decoded_samples(
+                    remaining_sample_indices, start_number=completed_count + 1
+                )
+
+            for sample, sample_idx in zip(samples, remaining_sample_indices):
+                if sample is None:
+                    if checkpoint is not None:
+                        checkpoint.add(sample_idx)
+                    continue
+                exif_edit, sample_path = sample
+
+                _add_distance_sample_exif(
+                    exif_edit,
+                    *sample_points_by_frame_idx[sample_idx],
+                    start_time=start_time,
+                    video_metadata=video_metadata,
+                )
+                exif_edit.write(sample_path)
+                if checkpoint is not None:
+                    checkpoint.add(sample_idx)
+
+
+def _sample_video_streams_by_distance(
+    ffmpeg: ffmpeglib.FFMPEG,
+    video_path: Path,
+    sample_dir: Path,
+    moov_parser: mp4_sample_parser.MovieBoxParser,
+    video_streams: T.Sequence[ffmpeglib.Stream],
+    video_metadata: types.VideoMetadata,
+    sample_distance: float,
+    start_time: datetime.datetime,
+) -> None:
+    """
+    Sample the frames of each video stream by distance along the same GPS track,
+    and extract the frames of all streams in one ffmpeg run
+    """
+    sample_points_by_stream: dict[
+        str, dict[int, tuple[mp4_sample_parser.Sample, geo.Point]]
+    ] = {}
+    for video_stream in video_streams:
+        LOG.info("Sampling video stream %s", video_stream["index"])
+        sample_points_by_stream[str(video_stream["index"])] = (
+            _sample_video_stream_by_distance(
+                video_metadata.points,
+                _VideoFrames.from_track(
+                    moov_parser.extract_track_at(video_stream["index"])
+                ),
+                sample_distance,
+            )
+        )
+
     with wip_dir_context(wip_sample_dir(sample_dir), sample_dir) as wip_dir:
-        ffmpeg.extract_specified_frames(
+        ffmpeg.extract_specified_frames_from_streams(
             video_path,
             wip_dir,
-            frame_indices=set(sorted_sample_indices),
-            stream_specifier=str(video_stream_idx),
+            {
+                stream_specifier: set(sample_points_by_frame_idx.keys())
+                for stream_specifier, sample_points_by_frame_idx in sample_points_by_stream.items()
+            },
         )
 
-        frame_samples = ffmpeglib.FFMPEG.sort_selected_samples(
-            wip_dir, video_path, selected_stream_specifiers=[str(video_stream_idx)]
-        )
-        if len(frame_samples) != len(sorted_sample_indices):
-            raise exceptions.MapillaryVideoError(
-                f"Expect {len(sorted_sample_indices)} samples but extracted {len(frame_samples)} samples"
-            )
-        for idx, (frame_idx_1based, sample_paths) in enumerate(frame_samples):
-            assert len(sample_paths) == 1, (
-                "Expect 1 sample path at {frame_idx_1based} but got {sample_paths}"
-            )
-            if idx + 1 != frame_idx_1based:
+        for (
+            stream_specifier,
+            sample_points_by_frame_idx,
+        ) in sample_points_by_stream.items():
+            sorted_sample_indices = sorted(sample_points_by_frame_idx.keys())
+            # Frames of the other streams are listed as None
+            sample_paths = [
+                sample_paths[0]
+                for _, sample_paths in ffmpeglib.FFMPEG.sort_selected_samples(
+                    wip_dir, video_path, selected_stream_specifiers=[stream_specifier]
+                )
+                if sample_paths[0] is not None
+            ]
+            if len(sample_paths) != len(sorted_sample_indices):
                 raise exceptions.MapillaryVideoError(
-                    f"Expect {sample_paths[0]} to be {idx + 1}th sample but got {frame_idx_1based}"
+                    f"Expect {len(sorted_sample_indices)} samples from stream {stream_specifier} but extracted {len(sample_paths)} samples"
                 )
 
-        for (_, sample_paths), sample_idx in zip(frame_samples, sorted_sample_indices):
-            if sample_paths[0] is None:
-                continue
+            for sample_path, sample_idx in zip(sample_paths, sorted_sample_indices):
+                exif_edit = ExifEdit(sample_path)
+                _add_distance_sample_exif(
+                    exif_edit,
+                    *sample_points_by_frame_idx[sample_idx],
+                    start_time=start_time,
+                    video_metadata=video_metadata,
+                )
+                _add_stream_lens(exif_edit, stream_specifier)
+                exif_edit.write(sample_path)
 
-            video_sample, interp = sample_points_by_frame_idx[sample_idx]
-            assert interp.time == video_sample.exact_composition_time, (
-                f"interpolated time {interp.time} should match the video sample time {video_sample.exact_composition_time}"
-            )
 
-            # Try to use GPS epoch time if available (for timelapse videos)
-            gps_epoch_time = interp.get_gps_epoch_time()
-            if gps_epoch_time is not None:
-                timestamp = datetime.datetime.fromtimestamp(
-                    gps_epoch_time, tz=datetime.timezone.utc
-                )
-            else:
-                timestamp = start_time + datetime.timedelta(seconds=interp.time)
-            exif_edit = ExifEdit(sample_paths[0])
-            exif_edit.add_date_time_original(timestamp)
-            exif_edit.add_gps_datetime(timestamp)
-            exif_edit.add_lat_lon(interp.lat, interp.lon)
-            if interp.alt is not None:
-                exif_edit.add_altitude(interp.alt)
-            if interp.angle is not None:
-                exif_edit.add_direction(interp.angle)
-            if video_metadata.make:
-                exif_edit.add_make(video_metadata.make)
-            if video_metadata.model:
-                exif_edit.add_model(video_metadata.model)
-            exif_edit.write()
+def _video_streams_to_sample(probe: ffmpeglib.Probe) -> list[ffmpeglib.Stream]:
+    """
+    Return all video streams if VIDEO_SAMPLE_ALL_STREAMS is enabled,
+    otherwise the video stream with the maximum resolution
+    """
+    if constants.VIDEO_SAMPLE_ALL_STREAMS:
+        return probe.probe_video_streams()
+
+    video_stream = probe.probe_video_with_max_resolution()
+    if video_stream is None:
+        return []
+    return [video_stream]
+
+
+def _add_stream_lens(exif_edit: ExifEdit, stream_specifier: str) -> None:
+    # The samples of different streams (e.g. front and rear cameras) differ in the camera UUID,
+    # so that they are grouped into different sequences
+    exif_edit.add_lens_serial_number(f"stream{stream_specifier}")
+
+
+def _add_distance_sample_exif(
+    exif_edit: ExifEdit,
+    video_sample: mp4_sample_parser.Sample,
+    interp: geo.Point,
+    start_time: datetime.datetime,
+    video_metadata: types.VideoMetadata,
+) -> None:
+    assert interp.time == video_sample.exact_composition_time, (
+        f"interpolated time {interp.time} should match the video sample time {video_sample.exact_composition_time}"
+    )
+
+    # Try to use GPS epoch time if available (for timelapse videos)
+    gps_epoch_time = interp.get_gps_epoch_time()
+    if gps_epoch_time is not None:
+        timestamp = datetime.datetime.fromtimestamp(
+            gps_epoch_time, tz=datetime.timezone.utc
+        )
+    else:
+        timestamp = start_time + datetime.timedelta(seconds=interp.time)
+    exif_edit.add_date_time_original(timestamp)
+    exif_edit.add_gps_datetime(timestamp)
+    exif_edit.add_lat_lon(interp.lat, interp.lon)
+    if interp.alt is not None:
+        exif_edit.add_altitude(interp.alt)
+    if interp.angle is not None:
+        exif_edit.add_direction(interp.angle)
+    if video_metadata.make:
+        exif_edit.add_make(video_metadata.make)
+    if video_metadata.model:
+        exif_edit.add_model(video_metadata.model)
+
+
+def _checkpoint_header(
+    video_path: Path,
+    stream_specifier: str,
+    sorted_sample_indices: T.Sequence[int],
+    start_time: datetime.datetime,
+) -> dict[str, T.Any]:
+    """
+    The checkpoint is resumed only if the video and what to sample from it are the same
+    """
+    stat = video_path.stat()
+    return {
+        "video_size": stat.st_size,
+        "video_mtime_ns": stat.st_mtime_ns,
+        "stream_specifier": stream_specifier,
+        "sample_indices_md5": hashlib.md5(
+            ",".join(map(str, sorted_sample_indices)).encode("utf-8")
+        ).hexdigest(),
+        "start_time": start_time.isoformat(),
+        "profile": constants.VIDEO_SAMPLE_PROFILE,
+    }
@@ -28,11 +28,21 @@ class TimestampedMeasurement:
     Instead use the concrete subclasses: AccelerationData, GyroscopeData, etc.
     """
 
+    # Empty slots so that subclasses can be slotted and combined with geo.Point
+    # (two bases with non-empty slots would conflict in multiple inheritance)
+    __slots__ = ()
+
     time: float
 
 
 @dataclasses.dataclass
 class GPSPoint(TimestampedMeasurement, Point):
+    __slots__ = (
+        "epoch_time",
+        "fix",
+        "precision",
+        "ground_speed",
+    )
     epoch_time: float | None
     fix: GPSFix | None
     precision: float | None
@@ -92,6 +102,16 @@ class GPSPoint(TimestampedMeasurement, Point):
 
 @dataclasses.dataclass
 class CAMMGPSPoint(TimestampedMeasurement, Point):
+    __slots__ = (
+        "time_gps_epoch",
+        "gps_fix_type",
+        "horizontal_accuracy",
+        "vertical_accuracy",
+        "velocity_east",
+        "velocity_north",
+        "velocity_up",
+        "speed_accuracy",
+    )
     time_gps_epoch: float
     gps_fix_type: int
     horizontal_accuracy: float
@@ -158,6 +178,8 @@ class CAMMGPSPoint(TimestampedMeasurement, Point):
 class GyroscopeData(TimestampedMeasurement):
     """Gyroscope signal in radians/seconds around XYZ axes of the camera."""
 
+    __slots__ = ("time", "x", "y", "z")
+
     x: float
     y: float
     z: float
@@ -167,6 +189,8 @@ class GyroscopeData(TimestampedMeasurement):
 class AccelerationData(TimestampedMeasurement):
     """Accelerometer reading in meters/second^2 along XYZ axes of the camera."""
 
+    __slots__ = ("time", "x", "y", "z")
+
     x: float
     y: float
     z: float
@@ -176,6 +200,8 @@ class AccelerationData(TimestampedMeasurement):
 class MagnetometerData(TimestampedMeasurement):
     """Ambient magnetic field."""
 
+    __slots__ = ("time", "x", "y", "z")
+
     x: float
     y: float
     z: float
@@ -9,6 +9,7 @@ import abc
 import dataclasses
 import enum
 import hashlib
+import sys
 import typing as T
 import uuid
 from pathlib import Path
@@ -34,7 +35,18 @@ NATIVE_VIDEO_FILETYPES = {
 }
 
 
-@dataclasses.dataclass
+if sys.version_info >= (3, 10):
+    # Slotted dataclasses drop the per-instance __dict__, which adds up
+    # (in memory and in pickling to worker processes) with millions of images.
+    # Unlike geo.Point, __slots__ can't be declared manually here because
+    # the fields have default values
+    _SLOTTED_DATACLASS_KWARGS: dict[str, T.Any] = {"slots": True}
+else:
+    # dataclass(slots=True) not available until 3.10
+    _SLOTTED_DATACLASS_KWARGS: dict[str, T.Any] = {}
+
+
+@dataclasses.dataclass(**_SLOTTED_DATACLASS_KWARGS)
 class ImageMetadata(geo.Point):
     filename: Path
     # filetype should be always FileType.IMAGE
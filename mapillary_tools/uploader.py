@@ -281,7 +281,10 @@ class VideoUploader:
         camm_info = cls.prepare_camm_info(video_metadata)
 
         # Create the CAMM sample generator
-        camm_sample_generator = camm_builder.camm_sample_generator2(camm_info)
+        camm_sample_generator = camm_builder.camm_sample_generator2(
+            camm_info,
+            telemetry_stream=cls._prepare_imu_telemetry_stream(video_metadata),
+        )
 
         with video_metadata.filename.open("rb") as src_fp:
             # Build the mp4 stream with the CAMM samples
@@ -337,17 +340,28 @@ class VideoUploader:
             else:
                 raise ValueError(f"Unknown point type: {point}")
 
-        if constants.MAPILLARY__EXPERIMENTAL_ENABLE_IMU:
-            if video_metadata.filetype is types.FileType.GOPRO:
-                with video_metadata.filename.open("rb") as fp:
-                    gopro_info = gpmf_parser.extract_gopro_info(fp, telemetry_only=True)
-                if gopro_info is not None:
-                    camm_info.accl = gopro_info.accl or []
-                    camm_info.gyro = gopro_info.gyro or []
-                    camm_info.magn = gopro_info.magn or []
-
         return camm_info
 
+    @classmethod
+    def _prepare_imu_telemetry_stream(
+        cls, video_metadata: types.VideoMetadata
+    ) -> T.Callable[[], T.Iterable[telemetry.TimestampedMeasurement]] | None:
+        """
+        Return a function that streams the IMU telemetry from the video file,
+        or None if IMU telemetry is not enabled or not supported for the file type.
+        """
+        if not constants.MAPILLARY__EXPERIMENTAL_ENABLE_IMU:
+            return None
+
+        if video_metadata.filetype is not types.FileType.GOPRO:
+            return None
+
+        def _stream() -> T.Generator[telemetry.TimestampedMeasurement, None, None]:
+            with video_metadata.filename.open("rb") as fp:
+                yield from gpmf_parser.iterate_gopro_imu_telemetry(fp)
+
+        return _stream
+
 
 class ZipUploader:
     @classmethod
@@ -0,0 +1,114 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the BSD license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+import argparse
+import io
+import time
+import typing as T
+
+from mapillary_tools import geo, telemetry
+from mapillary_tools.camm import camm_builder, camm_parser
+from mapillary_tools.mp4 import (
+    construct_mp4_parser as cparser,
+    mp4_sample_parser as sample_parser,
+    simple_mp4_builder,
+)
+
+
+def _synthetic_camm_mp4(count: int) -> bytes:
+    """
+    A CAMM video with 1 Hz GPS and 200 Hz accelerometer and gyroscope samples
+    """
+    duration = count / 400
+    movie_timescale = 1_000_000
+    mvhd: cparser.BoxDict = {
+        "type": b"mvhd",
+        "data": {
+            "creation_time": 0,
+            "modification_time": 0,
+            "timescale": movie_timescale,
+            "duration": int(duration * movie_timescale),
+        },
+    }
+    src = cparser.MP4WithoutSTBLBuilderConstruct.build_boxlist(
+        [
+            {"type": b"ftyp", "data": b"test"},
+            {"type": b"moov", "data": [mvhd]},
+        ]
+    )
+
+    camm_info = camm_parser.CAMMInfo(
+        mini_gps=[
+            geo.Point(time=float(t), lat=37.0, lon=-122.0, alt=10.0, angle=None)
+            for t in range(int(duration))
+        ],
+        accl=[
+            telemetry.AccelerationData(time=idx / 200, x=0.1, y=0.2, z=9.8)
+            for idx in range(count // 2)
+        ],
+        gyro=[
+            telemetry.GyroscopeData(time=idx / 200, x=0.01, y=0.02, z=0.03)
+            for idx in range(count // 2)
+        ],
+    )
+    return simple_mp4_builder.transform_mp4(
+        io.BytesIO(src), camm_builder.camm_sample_generator2(camm_info)
+    ).read()
+
+
+def _decode_with_construct(data: bytes) -> int:
+    moov = sample_parser.MovieBoxParser.parse_stream(
+        io.BytesIO(data), sample_formats={b"camm"}
+    )
+    count = 0
+    for track in moov.extract_tracks():
+        for sample in track.extract_samples():
+            raw_sample = sample.raw_sample
+            box = camm_parser.CAMMSampleData.parse(
+                data[raw_sample.offset : raw_sample.offset + raw_sample.size]
+            )
+            if box.data is not None:
+                count += 1
+    return count
+
+
+def _timeit(name: str, func: T.Callable[[], T.Any]) -> None:
+    start = time.perf_counter()
+    func()
+    print(f"{name:>48}: {time.perf_counter() - start:8.3f} s")
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the CAMM sample decoders on a synthetic CAMM video"
+    )
+    parser.add_argument("--count", type=int, default=200_000)
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = _parse_args()
+
+    data = _synthetic_camm_mp4(parsed_args.count)
+    print(f"Synthetic CAMM video: {len(data)} bytes")
+
+    _timeit(
+        "construct parsing per sample",
+        lambda: _decode_with_construct(data),
+    )
+    _timeit(
+        "camm_parser.extract_camm_info",
+        lambda: camm_parser.extract_camm_info(io.BytesIO(data)),
+    )
+    _timeit(
+        "camm_parser.extract_camm_info(telemetry_only)",
+        lambda: camm_parser.extract_camm_info(io.BytesIO(data), telemetry_only=True),
+    )
+
+
+if __name__ == "__main__":
+    main()
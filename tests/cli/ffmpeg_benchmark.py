@@ -0,0 +1,124 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the BSD license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+import typing as T
+from pathlib import Path
+
+from mapillary_tools import constants, ffmpeg as ffmpeglib
+
+
+def _timeit(
+    name: str, sample_dir: Path, func: T.Callable[[], T.Any], frame_count: int = 0
+) -> None:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    frames = list(sample_dir.iterdir())
+    total_size = sum(frame.stat().st_size for frame in frames)
+    for frame in frames:
+        frame.unlink()
+    frame_count = len(frames) or frame_count
+    print(
+        f"{name:>40}: {elapsed:8.3f} s {frame_count / elapsed:8.1f} frames/s {total_size / max(frame_count, 1) / 1024:8.1f} KiB/frame"
+    )
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the ffmpeg sampling profiles on a local video"
+    )
+    parser.add_argument(
+        "video_path",
+        type=Path,
+        nargs="?",
+        default=Path("tests/data/videos/sample-5s.mp4"),
+    )
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=list(ffmpeglib.SAMPLING_PROFILES),
+        choices=list(ffmpeglib.SAMPLING_PROFILES),
+    )
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument(
+        "--every",
+        type=int,
+        default=10,
+        help="Extract every Nth frame when extracting specified frames",
+    )
+    parser.add_argument("--threads", type=int, default=None)
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = _parse_args()
+    video_path: Path = parsed_args.video_path
+
+    try:
+        probe = ffmpeglib.Probe(
+            ffmpeglib.FFMPEG(
+                constants.FFMPEG_PATH, constants.FFPROBE_PATH
+            ).probe_format_and_streams(video_path)
+        )
+    except ffmpeglib.FFmpegNotFoundError as ex:
+        raise SystemExit(f"Benchmark requires ffmpeg and ffprobe: {ex}")
+    video_stream = probe.probe_video_with_max_resolution()
+    if video_stream is None:
+        raise SystemExit(f"No video streams found in {video_path}")
+    stream_specifier = str(video_stream["index"])
+    nb_frames = int(video_stream.get("nb_frames") or 0)
+    print(
+        f"{video_path}: {video_stream.get('codec_name')} {video_stream.get('width')}x{video_stream.get('height')}, {nb_frames} frames"
+    )
+
+    frame_indices = set(range(0, nb_frames, parsed_args.every))
+
+    for name in parsed_args.profiles:
+        ff = ffmpeglib.FFMPEG(
+            constants.FFMPEG_PATH,
+            constants.FFPROBE_PATH,
+            threads=parsed_args.threads,
+            profile=ffmpeglib.get_sampling_profile(name),
+        )
+        with tempfile.TemporaryDirectory() as sample_dir:
+            _timeit(
+                f"{name}: extract_frames_by_interval",
+                Path(sample_dir),
+                lambda: ff.extract_frames_by_interval(
+                    video_path,
+                    Path(sample_dir),
+                    parsed_args.interval,
+                    stream_specifier=stream_specifier,
+                ),
+            )
+            _timeit(
+                f"{name}: extract_specified_frames",
+                Path(sample_dir),
+                lambda: ff.extract_specified_frames(
+                    video_path,
+                    Path(sample_dir),
+                    frame_indices,
+                    stream_specifier=stream_specifier,
+                ),
+            )
+            _timeit(
+                f"{name}: iterate_specified_frames",
+                Path(sample_dir),
+                lambda: list(
+                    ff.iterate_specified_frames(
+                        video_path, frame_indices, stream_specifier=stream_specifier
+                    )
+                ),
+                frame_count=len(frame_indices),
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the BSD license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+import typing as T
+from pathlib import Path
+
+from mapillary_tools import geo, process_sequence_properties as psp, types
+
+
+def _synthetic_sequence(count: int) -> list[types.ImageMetadata]:
+    """
+    A random walk that starts in San Francisco, roughly one image every 3 meters
+    """
+    random.seed(0)
+    lat, lon = 37.7749, -122.4194
+    sequence = []
+    for idx in range(count):
+        lat += random.uniform(-2e-5, 3e-5)
+        lon += random.uniform(-2e-5, 3e-5)
+        sequence.append(
+            types.ImageMetadata(
+                time=float(idx),
+                lat=lat,
+                lon=lon,
+                alt=None,
+                angle=None,
+                filename=Path(f"IMG_{idx}.jpg"),
+            )
+        )
+    return sequence
+
+
+def _timeit(name: str, func: T.Callable[[], T.Any]) -> None:
+    start = time.perf_counter()
+    func()
+    print(f"{name:>48}: {time.perf_counter() - start:8.3f} s")
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the distance and bearing kernels on a synthetic sequence"
+    )
+    parser.add_argument("--count", type=int, default=1_000_000)
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = _parse_args()
+
+    sequence = _synthetic_sequence(parsed_args.count)
+    lats = [image.lat for image in sequence]
+    lons = [image.lon for image in sequence]
+    latlons = list(zip(lats, lons))
+
+    _timeit(
+        "pairwise geo.gps_distance",
+        lambda: [geo.gps_distance(a, b) for a, b in geo.pairwise(latlons)],
+    )
+    _timeit("geo.gps_distances", lambda: geo.gps_distances(lats, lons))
+    _timeit(
+        "pairwise geo.compute_bearing",
+        lambda: [geo.compute_bearing(a, b) for a, b in geo.pairwise(latlons)],
+    )
+    _timeit("geo.bearings", lambda: geo.bearings(lats, lons))
+    _timeit("geo.avg_speed", lambda: geo.avg_speed(sequence))
+    _timeit(
+        "duplication_check",
+        lambda: psp.duplication_check(
+            sequence, max_duplicate_distance=0.1, max_duplicate_angle=5
+        ),
+    )
+    _timeit(
+        "duplication_check(check_all_kept=True)",
+        lambda: psp.duplication_check(
+            sequence,
+            max_duplicate_distance=0.1,
+            max_duplicate_angle=5,
+            check_all_kept=True,
+        ),
+    )
+    _timeit("_check_sequences_zigzag", lambda: psp._check_sequences_zigzag([sequence]))
+    _timeit(
+        "_check_sequences_zigzag(global_radius=...)",
+        lambda: psp._check_sequences_zigzag([sequence], global_radius=20),
+    )
+    _timeit(
+        "_split_sequences_by_limits(cutoff_distance=...)",
+        lambda: psp._split_sequences_by_limits([sequence], cutoff_distance=100),
+    )
+
+    # A 24-hour GPX track at 1 Hz, interpolated at each image time
+    gpx_points = [
+        geo.Point(time=float(t), lat=37.0 + t * 1e-5, lon=-122.0, alt=None, angle=None)
+        for t in range(24 * 3600)
+    ]
+    image_times = [idx * 24 * 3600 / len(sequence) for idx in range(len(sequence))]
+    _timeit(
+        "geo.interpolate per image (first 10k images)",
+        lambda: [geo.interpolate(gpx_points, t) for t in image_times[:10_000]],
+    )
+    _timeit(
+        "geo.Interpolator.interpolate_many (sorted)",
+        lambda: geo.Interpolator([gpx_points]).interpolate_many(image_times),
+    )
+    shuffled_times = image_times[:]
+    random.shuffle(shuffled_times)
+    _timeit(
+        "geo.Interpolator.interpolate_many (unsorted)",
+        lambda: geo.Interpolator([gpx_points]).interpolate_many(shuffled_times),
+    )
+
+
+if __name__ == "__main__":
+    main()
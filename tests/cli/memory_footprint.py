@@ -0,0 +1,87 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the BSD license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import gc
+import pickle
+import tracemalloc
+import typing as T
+from pathlib import Path
+
+from mapillary_tools import telemetry, types
+
+
+def _unslotted(cls: type) -> type:
+    """
+    Create a regular (__dict__-backed) dataclass with the same fields as cls
+    """
+    name = f"Unslotted{cls.__name__}"
+    unslotted = dataclasses.make_dataclass(
+        name, [(f.name, f.type, f) for f in dataclasses.fields(cls)]
+    )
+    # Make it picklable by reference
+    unslotted.__module__ = __name__
+    globals()[name] = unslotted
+    return unslotted
+
+
+def _make_image(cls: T.Callable, idx: int):
+    return cls(
+        time=float(idx),
+        lat=1.0 + idx * 1e-6,
+        lon=2.0 + idx * 1e-6,
+        alt=None,
+        angle=None,
+        filename=Path(f"IMG_{idx}.jpg"),
+    )
+
+
+def _make_gyro(cls: T.Callable, idx: int):
+    return cls(time=idx / 200, x=0.1, y=0.2, z=0.3)
+
+
+def _measure(factory: T.Callable[[int], T.Any], count: int) -> tuple[int, int]:
+    gc.collect()
+    tracemalloc.start()
+    instances = [factory(idx) for idx in range(count)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pickled_size = len(pickle.dumps(instances[: min(count, 10_000)]))
+    del instances
+    return current, pickled_size
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare memory footprints of slotted and unslotted metadata classes"
+    )
+    parser.add_argument("--count", type=int, default=1_000_000)
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = _parse_args()
+
+    cases = [
+        (types.ImageMetadata, _make_image),
+        (telemetry.GyroscopeData, _make_gyro),
+    ]
+
+    for cls, make in cases:
+        for target in [cls, _unslotted(cls)]:
+            current, pickled_size = _measure(
+                lambda idx: make(target, idx), parsed_args.count
+            )
+            print(
+                f"{target.__name__:>28}: {current / 1024 / 1024:8.1f} MiB for {parsed_args.count} instances, "
+                f"{pickled_size / 1024:8.1f} KiB pickled per 10k instances"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the BSD license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+import argparse
+import subprocess
+import tempfile
+import time
+import typing as T
+from pathlib import Path
+
+from mapillary_tools import constants, ffmpeg as ffmpeglib, sample_video
+from mapillary_tools.mp4 import mp4_sample_parser
+
+
+def _timeit(name: str, func: T.Callable[[], T.Sequence[bytes]]) -> None:
+    start = time.perf_counter()
+    frames = func()
+    elapsed = time.perf_counter() - start
+    total_size = sum(len(frame) for frame in frames)
+    print(
+        f"{name:>10}: {elapsed:8.3f} s {len(frames) / elapsed:8.1f} frames/s {total_size / max(len(frames), 1) / 1024:8.1f} KiB/frame"
+    )
+
+
+def _generate_mjpeg_video(
+    ff: ffmpeglib.FFMPEG, video_path: Path, size: str, rate: int, duration: float
+) -> None:
+    ff.run_ffmpeg_non_interactive(
+        [
+            *["-hide_banner", "-loglevel", "error"],
+            *["-f", "lavfi", "-i", f"testsrc2=size={size}:rate={rate}"],
+            *["-t", str(duration)],
+            *["-c:v", "mjpeg", "-qscale:v", "3"],
+            str(video_path),
+        ]
+    )
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark copying the JPEG samples of an MJPEG video against decoding and re-encoding them with ffmpeg"
+    )
+    parser.add_argument(
+        "video_path",
+        type=Path,
+        nargs="?",
+        help="MJPEG video (MOV) to benchmark. Generate one with ffmpeg if not specified",
+    )
+    parser.add_argument("--size", default="1920x1080")
+    parser.add_argument("--rate", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument(
+        "--every",
+        type=int,
+        default=10,
+        help="Extract every Nth frame",
+    )
+    return parser.parse_args()
+
+
+def main():
+    parsed_args = _parse_args()
+
+    ff = ffmpeglib.FFMPEG(
+        constants.FFMPEG_PATH, constants.FFPROBE_PATH, stderr=subprocess.PIPE
+    )
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        video_path: Path | None = parsed_args.video_path
+        if video_path is None:
+            video_path = Path(tmpdir, "mjpeg.mov")
+            try:
+                _generate_mjpeg_video(
+                    ff,
+                    video_path,
+                    parsed_args.size,
+                    parsed_args.rate,
+                    parsed_args.duration,
+                )
+            except ffmpeglib.FFmpegNotFoundError as ex:
+                raise SystemExit(f"Benchmark requires ffmpeg: {ex}")
+
+        probe = ffmpeglib.Probe(ff.probe_format_and_streams(video_path))
+        video_stream = probe.probe_video_with_max_resolution()
+        if video_stream is None or not ffmpeglib.Probe.is_jpeg_stream(video_stream):
+            raise SystemExit(f"No MJPEG video streams found in {video_path}")
+        stream_idx = video_stream["index"]
+
+        moov_parser = mp4_sample_parser.MovieBoxParser.parse_file(video_path)
+        samples = sorted(
+            moov_parser.extract_track_at(stream_idx).extract_samples(),
+            key=lambda sample: sample.exact_composition_time,
+        )
+        frame_indices = list(range(0, len(samples), parsed_args.every))
+        print(
+            f"{video_path}: {video_stream.get('width')}x{video_stream.get('height')}, {len(samples)} frames, extracting {len(frame_indices)} frames"
+        )
+
+        selected_samples = [samples[idx] for idx in frame_indices]
+        if not sample_video._should_copy_jpeg_samples(
+            video_path, video_stream, selected_samples
+        ):
+            raise SystemExit(f"Unable to copy the JPEG samples from {video_path}")
+
+        _timeit(
+            "re-encode",
+            lambda: list(
+                ff.iterate_specified_frames(
+                    video_path, set(frame_indices), stream_specifier=str(stream_idx)
+                )
+            ),
+        )
+        _timeit(
+            "copy",
+            lambda: list(
+                sample_video._iterate_copied_frames(video_path, selected_samples)
+            ),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -285,6 +285,41 @@ def test_video_process_and_upload(
     assert_same_image_descs(uploaded_descs, list(expected.values()))
 
 
+@pytest.mark.usefixtures("setup_config")
+def test_video_process_and_upload_streaming(
+    setup_upload: py.path.local, setup_data: py.path.local
+):
+    pytest_skip_if_not_ffmpeg_installed()
+
+    video_dir = setup_data.join("videos")
+    gpx_start_time = "2025_03_14_07_00_00_000"
+    gpx_file = setup_data.join("gpx").join("sf_30km_h.gpx")
+
+    run_process_and_upload_for_descs(
+        [
+            "--stream_video_samples",
+            "--video_sample_interval=2",
+            "--video_sample_distance=-1",
+            *["--video_start_time", gpx_start_time],
+            *["--geotag_source", "gpx"],
+            *["--geotag_source_path", str(gpx_file)],
+            str(video_dir),
+            str(video_dir.join("my_samples")),
+        ],
+        command="video_process_and_upload",
+    )
+
+    uploaded_descs = sum(extract_all_uploaded_descs(Path(setup_upload)), [])
+    assert {
+        "sample-5s_v_000001.jpg",
+        "sample-5s_v_000002.jpg",
+        "sample-5s_v_000003.jpg",
+    } <= {desc["MAPFilename"] for desc in uploaded_descs}
+
+    # The samples are removed once uploaded
+    assert not video_dir.join("my_samples").join("sample-5s.mp4").exists()
+
+
 @pytest.mark.usefixtures("setup_config")
 def test_video_process_and_upload_after_gpx(
     setup_upload: py.path.local, setup_data: py.path.local
@@ -5,9 +5,11 @@
 
 import dataclasses
 import io
+import struct
 import typing as T
 from pathlib import Path
 
+import pytest
 from mapillary_tools import geo, telemetry, types, uploader
 from mapillary_tools.camm import camm_builder, camm_parser
 from mapillary_tools.mp4 import (
@@ -721,3 +723,268 @@ def test_prepare_camm_info_gpspoint_roundtrip():
         assert abs(original.epoch_time - decoded_camm.time_gps_epoch) < 10e-6
         assert abs(original.lat - decoded_camm.lat) < 10e-6
         assert abs(original.lon - decoded_camm.lon) < 10e-6
+
+
+def test_build_camm_with_telemetry_stream():
+    movie_timescale = 1_000_000
+    mvhd: cparser.BoxDict = {
+        "type": b"mvhd",
+        "data": {
+            "creation_time": 1,
+            "modification_time": 2,
+            "timescale": movie_timescale,
+            "duration": int(36000 * movie_timescale),
+        },
+    }
+    src = cparser.MP4WithoutSTBLBuilderConstruct.build_boxlist(
+        [
+            {"type": b"ftyp", "data": b"test"},
+            {"type": b"moov", "data": [mvhd]},
+        ]
+    )
+
+    points = [
+        geo.Point(time=-0.1, lat=0.01, lon=0.2, alt=None, angle=None),
+        geo.Point(time=0.1, lat=0.01, lon=0.2, alt=None, angle=None),
+        geo.Point(time=0.3, lat=0.02, lon=0.3, alt=None, angle=None),
+    ]
+    accl = [
+        telemetry.AccelerationData(time=idx * 0.05, x=1.0, y=2.0, z=float(idx))
+        for idx in range(10)
+    ]
+    gyro = [
+        telemetry.GyroscopeData(time=idx * 0.1, x=3.0, y=4.0, z=float(idx))
+        for idx in range(5)
+    ]
+
+    camm_info = camm_parser.CAMMInfo(mini_gps=points, accl=accl, gyro=gyro)
+    expected = simple_mp4_builder.transform_mp4(
+        io.BytesIO(src), camm_builder.camm_sample_generator2(camm_info)
+    ).read()
+
+    stream_calls = 0
+
+    def _telemetry_stream():
+        nonlocal stream_calls
+        stream_calls += 1
+        yield from sorted([*accl, *gyro], key=lambda m: m.time)
+
+    camm_info = camm_parser.CAMMInfo(mini_gps=points)
+    actual = simple_mp4_builder.transform_mp4(
+        io.BytesIO(src),
+        camm_builder.camm_sample_generator2(
+            camm_info, telemetry_stream=_telemetry_stream
+        ),
+    ).read()
+
+    assert expected == actual
+    # Streamed twice: once for the sample table and once for the samples
+    assert 2 == stream_calls
+
+    parsed = camm_parser.extract_camm_info(io.BytesIO(actual), telemetry_only=True)
+    assert parsed is not None
+    assert 10 == len(parsed.accl or [])
+    assert 5 == len(parsed.gyro or [])
+
+
+def _build_camm_samples(
+    sample_datas: T.Sequence[bytes], gaps: T.Sequence[int] | None = None
+) -> tuple[bytes, list[sample_parser.Sample]]:
+    buf = io.BytesIO()
+    samples = []
+    for idx, data in enumerate(sample_datas):
+        if gaps is not None:
+            buf.write(b"\x00" * gaps[idx])
+        raw_sample = sample_parser.RawSample(
+            description_idx=1,
+            offset=buf.tell(),
+            size=len(data),
+            timedelta=1,
+            composition_offset=0,
+            is_sync=True,
+        )
+        samples.append(
+            sample_parser.Sample(
+                raw_sample=raw_sample,
+                exact_time=float(idx),
+                exact_composition_time=float(idx),
+                exact_timedelta=1.0,
+                description={"format": b"camm"},
+            )
+        )
+        buf.write(data)
+    return buf.getvalue(), samples
+
+
+def test_decode_camm_samples_in_bulk():
+    measurements: list[camm_parser.TelemetryMeasurement] = []
+    for idx in range(6):
+        measurements.append(
+            telemetry.AccelerationData(time=idx, x=0.5, y=-1.5, z=float(idx))
+        )
+    measurements.append(telemetry.GyroscopeData(time=6, x=1.0, y=2.0, z=3.0))
+    measurements.append(telemetry.MagnetometerData(time=7, x=4.0, y=5.0, z=6.0))
+    measurements.append(geo.Point(time=8, lat=1.25, lon=2.5, alt=3.0, angle=None))
+    measurements.append(
+        telemetry.CAMMGPSPoint(
+            time=9,
+            lat=1.25,
+            lon=2.5,
+            alt=3.0,
+            angle=None,
+            time_gps_epoch=1700000000.5,
+            gps_fix_type=3,
+            horizontal_accuracy=0.5,
+            vertical_accuracy=1.0,
+            velocity_east=1.5,
+            velocity_north=2.0,
+            velocity_up=2.5,
+            speed_accuracy=3.0,
+        )
+    )
+    measurements.append(telemetry.GyroscopeData(time=10, x=1.0, y=2.0, z=3.0))
+
+    sample_datas = [
+        camm_parser.SAMPLE_ENTRY_CLS_BY_CAMM_TYPE[
+            {
+                telemetry.AccelerationData: camm_parser.CAMMType.ACCELERATION,
+                telemetry.GyroscopeData: camm_parser.CAMMType.GYRO,
+                telemetry.MagnetometerData: camm_parser.CAMMType.MAGNETIC_FIELD,
+                geo.Point: camm_parser.CAMMType.MIN_GPS,
+                telemetry.CAMMGPSPoint: camm_parser.CAMMType.GPS,
+            }[type(m)]
+        ].serialize(m)
+        for m in measurements
+    ]
+
+    for gaps in [None, [idx % 2 for idx in range(len(sample_datas))]]:
+        data, samples = _build_camm_samples(sample_datas, gaps=gaps)
+        decoded = list(
+            camm_parser._iterate_telemetry_from_samples(io.BytesIO(data), samples)
+        )
+        assert measurements == decoded
+
+        gps_only = list(
+            camm_parser._iterate_telemetry_from_samples(
+                io.BytesIO(data),
+                samples,
+                [camm_parser.CAMMType.MIN_GPS, camm_parser.CAMMType.GPS],
+            )
+        )
+        assert measurements[8:10] == gps_only
+
+
+def test_decode_camm_samples_skip_unsupported_types():
+    accl = telemetry.AccelerationData(time=0, x=1.0, y=2.0, z=3.0)
+    sample_datas = [
+        camm_parser.AccelerationSampleEntry.serialize(accl),
+        # ANGLE_AXIS is parsed but not supported
+        camm_parser.CAMMSampleData.build(
+            {"type": camm_parser.CAMMType.ANGLE_AXIS.value, "data": [1, 2, 3]}
+        ),
+        # Unknown CAMM type
+        b"\x00\x00\x63\x00" + b"\x00" * 12,
+        # Trailing bytes are ignored
+        camm_parser.AccelerationSampleEntry.serialize(accl) + b"\xff" * 4,
+    ]
+    data, samples = _build_camm_samples(sample_datas)
+    decoded = list(
+        camm_parser._iterate_telemetry_from_samples(io.BytesIO(data), samples)
+    )
+    assert [accl, dataclasses.replace(accl, time=3.0)] == decoded
+
+
+def test_decode_camm_samples_too_small():
+    gyro = telemetry.GyroscopeData(time=0, x=1.0, y=2.0, z=3.0)
+    accl = telemetry.AccelerationData(time=0, x=1.0, y=2.0, z=3.0)
+    # Gyroscope samples require 16 bytes, so each one misses its last float
+    truncated_gyro = camm_parser.GyroscopeSampleEntry.serialize(gyro)[:12]
+
+    for sample_datas in [
+        [truncated_gyro] * 3,
+        [truncated_gyro, camm_parser.AccelerationSampleEntry.serialize(accl)[:12]],
+    ]:
+        data, samples = _build_camm_samples(sample_datas)
+        decoded = camm_parser._iterate_telemetry_from_samples(io.BytesIO(data), samples)
+        with pytest.raises(struct.error):
+            next(decoded)
+
+    # Samples of unselected types are not decoded
+    data, samples = _build_camm_samples([truncated_gyro] * 3)
+    assert [] == list(
+        camm_parser._iterate_telemetry_from_samples(
+            io.BytesIO(data), samples, [camm_parser.CAMMType.ACCELERATION]
+        )
+    )
+
+
+def test_encode_camm_samples_matches_construct():
+    measurements: list[camm_parser.TelemetryMeasurement] = [
+        geo.Point(time=0, lat=1.1, lon=2.2, alt=None, angle=None),
+        telemetry.GPSPoint(
+            time=0.5,
+            lat=1.1,
+            lon=2.2,
+            alt=3.3,
+            angle=None,
+            epoch_time=None,
+            fix=None,
+            precision=None,
+            ground_speed=None,
+        ),
+        telemetry.CAMMGPSPoint(
+            time=1,
+            lat=1.1,
+            lon=2.2,
+            alt=None,
+            angle=None,
+            time_gps_epoch=1700000000.1,
+            gps_fix_type=3,
+            horizontal_accuracy=0.1,
+            vertical_accuracy=0.2,
+            velocity_east=0.3,
+            velocity_north=0.4,
+            velocity_up=0.5,
+            speed_accuracy=0.6,
+        ),
+        telemetry.AccelerationData(time=1.5, x=0.1, y=0.2, z=9.8),
+        telemetry.GyroscopeData(time=2, x=0.1, y=0.2, z=0.3),
+        telemetry.MagnetometerData(time=2.5, x=1.0, y=2.0, z=3.0),
+    ]
+
+    expected = [
+        camm_parser.CAMMSampleData.build(
+            {"type": 5, "data": [1.1, 2.2, -1.0]},
+        ),
+        camm_parser.CAMMSampleData.build(
+            {"type": 5, "data": [1.1, 2.2, 3.3]},
+        ),
+        camm_parser.CAMMSampleData.build(
+            {
+                "type": 6,
+                "data": {
+                    "time_gps_epoch": 1700000000.1,
+                    "gps_fix_type": 3,
+                    "latitude": 1.1,
+                    "longitude": 2.2,
+                    "altitude": -1.0,
+                    "horizontal_accuracy": 0.1,
+                    "vertical_accuracy": 0.2,
+                    "velocity_east": 0.3,
+                    "velocity_north": 0.4,
+                    "velocity_up": 0.5,
+                    "speed_accuracy": 0.6,
+                },
+            }
+        ),
+        camm_parser.CAMMSampleData.build({"type": 3, "data": [0.1, 0.2, 9.8]}),
+        camm_parser.CAMMSampleData.build({"type": 2, "data": [0.1, 0.2, 0.3]}),
+        camm_parser.CAMMSampleData.build({"type": 7, "data": [1.0, 2.0, 3.0]}),
+    ]
+
+    payload, sizes = camm_builder.encode_camm_samples(measurements)
+    assert [len(data) for data in expected] == sizes
+    assert b"".join(expected) == bytes(payload)
+    assert expected == [
+        camm_builder._sample_entry_cls(m).serialize(m) for m in measurements
+    ]
@@ -245,6 +245,14 @@ class ExifEditTests(unittest.TestCase):
         with self.assertRaises(ValueError):
             empty_exifedit.add_model("")
 
+    def test_add_lens_serial_number(self):
+        empty_exifedit = ExifEdit(EMPTY_EXIF_FILE_TEST)
+        empty_exifedit.add_lens_serial_number("stream1")
+        empty_exifedit.write(EMPTY_EXIF_FILE_TEST)
+
+        exif_data = ExifRead(EMPTY_EXIF_FILE_TEST)
+        self.assertEqual("stream1", exif_data.extract_camera_uuid())
+
     def test_add_orientation_invalid_raises(self):
         empty_exifedit = ExifEdit(EMPTY_EXIF_FILE_TEST)
         with self.assertRaises(ValueError):
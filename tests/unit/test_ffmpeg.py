@@ -114,6 +114,38 @@ def test_ffmpeg_extract_specified_frames_ok(setup_data: py.path.local):
         assert frame_paths[0].exists()
 
 
+def test_ffmpeg_extract_specified_frames_seek_ok(setup_data: py.path.local):
+    pytest_skip_if_not_ffmpeg_installed()
+
+    ff = ffmpeg.FFMPEG()
+
+    video_path = Path(setup_data.join("videos/sample-5s.mp4"))
+
+    sample_dir = Path(setup_data.join("videos/samples"))
+    sample_dir.mkdir()
+
+    ff.extract_specified_frames(
+        video_path, sample_dir, frame_indices={0, 3}, seek_time=1.0, start_number=5
+    )
+
+    results = list(ff.sort_selected_samples(sample_dir, video_path))
+    assert [5, 6] == [file_idx for file_idx, _ in results]
+
+
+def test_ffmpeg_iterate_specified_frames_ok(setup_data: py.path.local):
+    pytest_skip_if_not_ffmpeg_installed()
+
+    ff = ffmpeg.FFMPEG()
+
+    video_path = Path(setup_data.join("videos/sample-5s.mp4"))
+
+    images = list(ff.iterate_specified_frames(video_path, frame_indices={2, 9}))
+    assert len(images) == 2
+    for image in images:
+        assert image.startswith(b"\xff\xd8")
+        assert image.endswith(b"\xff\xd9")
+
+
 def test_ffmpeg_extract_specified_frames_empty_ok(setup_data: py.path.local):
     pytest_skip_if_not_ffmpeg_installed()
 
@@ -263,3 +295,133 @@ def test_probe():
         "2023-03-07 01:35:34",
         "4.933333",
     )
+
+
+def test_jpeg_stream_splitter():
+    # test_exif.jpg embeds a JPEG thumbnail in its EXIF segment,
+    # whose EOI marker must not end the image
+    images = [
+        Path("tests/unit/data/test_exif.jpg").read_bytes(),
+        Path("tests/unit/data/test_exif.jpg").read_bytes()[:2] + b"\xff\xd9",
+    ]
+    images.append(images[0])
+    data = b"".join(images)
+
+    for chunk_size in [1, 3, 1000, len(data)]:
+        splitter = ffmpeg.JPEGStreamSplitter()
+        split = []
+        for offset in range(0, len(data), chunk_size):
+            split.extend(splitter.feed(data[offset : offset + chunk_size]))
+        assert images == split
+        assert 0 == splitter.pending()
+
+    splitter = ffmpeg.JPEGStreamSplitter()
+    assert [] == splitter.feed(images[0][:-1])
+    assert len(images[0]) - 1 == splitter.pending()
+
+    with pytest.raises(RuntimeError):
+        ffmpeg.JPEGStreamSplitter().feed(b"not a jpeg")
+
+
+def _capture_ffmpeg_commands(ff: ffmpeg.FFMPEG) -> list[list[str]]:
+    """
+    Replace running ffmpeg with capturing the command lines and their filter scripts
+    """
+    cmds: list[list[str]] = []
+
+    def _run(cmd: list[str]) -> None:
+        cmd = list(cmd)
+        for option in ["-filter_script:v", "-filter_complex_script"]:
+            if option in cmd:
+                idx = cmd.index(option) + 1
+                cmd[idx] = Path(cmd[idx]).read_text()
+        cmds.append(cmd)
+
+    ff.run_ffmpeg_non_interactive = _run  # type: ignore[method-assign]
+    return cmds
+
+
+def test_sampling_profiles():
+    video_path, sample_dir = Path("video.mp4"), Path("samples")
+
+    ff = ffmpeg.FFMPEG()
+    cmds = _capture_ffmpeg_commands(ff)
+    ff.extract_frames_by_interval(video_path, sample_dir, 2)
+    ff.extract_specified_frames(video_path, sample_dir, {1, 3})
+    assert "balanced" == ff.profile.name
+    for cmd in cmds:
+        assert "-skip_frame" not in cmd
+        assert "-qmin" not in cmd
+        assert "2" == cmd[cmd.index("-qscale:v") + 1]
+    assert "fps=1/2" == cmds[0][cmds[0].index("-vf") + 1]
+    assert "scale" not in cmds[1][cmds[1].index("-filter_script:v") + 1]
+
+    ff = ffmpeg.FFMPEG(profile=ffmpeg.get_sampling_profile("fast"))
+    cmds = _capture_ffmpeg_commands(ff)
+    ff.extract_frames_by_interval(video_path, sample_dir, 2)
+    ff.extract_specified_frames(video_path, sample_dir, {1, 3})
+    interval_cmd, specified_cmd = cmds
+    # Interval sampling decodes every frame, so the frames keep their timestamps
+    assert "-skip_frame" not in interval_cmd
+    assert "-skip_frame" not in specified_cmd
+    assert interval_cmd[interval_cmd.index("-vf") + 1].startswith("fps=1/2,scale=")
+    assert specified_cmd[specified_cmd.index("-filter_script:v") + 1].startswith(
+        "select="
+    )
+    assert "scale=" in specified_cmd[specified_cmd.index("-filter_script:v") + 1]
+    assert "5" == interval_cmd[interval_cmd.index("-qscale:v") + 1]
+
+    ff = ffmpeg.FFMPEG(profile=ffmpeg.get_sampling_profile("Archival"))
+    cmds = _capture_ffmpeg_commands(ff)
+    ff.extract_frames_by_interval(video_path, sample_dir, 2)
+    assert "1" == cmds[0][cmds[0].index("-qscale:v") + 1]
+    assert "1" == cmds[0][cmds[0].index("-qmin") + 1]
+
+    with pytest.raises(ValueError):
+        ffmpeg.get_sampling_profile("unknown")
+
+
+def test_extract_frames_from_streams():
+    video_path, sample_dir = Path("video.mp4"), Path("samples")
+
+    ff = ffmpeg.FFMPEG()
+    cmds = _capture_ffmpeg_commands(ff)
+    ff.extract_specified_frames_from_streams(
+        video_path, sample_dir, {0: {1, 3}, 2: set(), "3": {5}}
+    )
+    ff.extract_frames_by_interval_from_streams(video_path, sample_dir, 2, [0, 3])
+    ff.extract_specified_frames_from_streams(video_path, sample_dir, {0: set()})
+    specified_cmd, interval_cmd = cmds
+
+    # One input decoded once, with an output for each stream
+    assert 1 == specified_cmd.count("-i")
+    assert (
+        "[0:0]select=if(lt(n\\,3)\\,eq(n\\,1)\\,eq(n\\,3))[s0];[0:3]select=eq(n\\,5)[s3]"
+        == specified_cmd[specified_cmd.index("-filter_complex_script") + 1]
+    )
+    assert [
+        "-map",
+        "[s0]",
+        "-frames:v",
+        "2",
+        "-qscale:v",
+        "2",
+        str(sample_dir.joinpath("video_0_%06d.jpg")),
+        "-map",
+        "[s3]",
+        "-frames:v",
+        "1",
+        "-qscale:v",
+        "2",
+        str(sample_dir.joinpath("video_3_%06d.jpg")),
+    ] == specified_cmd[specified_cmd.index("-map") :]
+
+    assert (
+        "[0:0]fps=1/2[s0];[0:3]fps=1/2[s3]"
+        == interval_cmd[interval_cmd.index("-filter_complex_script") + 1]
+    )
+    assert "-frames:v" not in interval_cmd
+    assert str(sample_dir.joinpath("video_3_%06d.jpg")) == interval_cmd[-1]
+
+    with pytest.raises(ValueError):
+        ff.extract_frames_by_interval_from_streams(video_path, sample_dir, 2, ["v"])
@@ -288,6 +288,26 @@ def test_compute_bearing():
     assert 270 == geo.compute_bearing((0, 0), (0, -1))
 
 
+def test_batch_distances_and_bearings():
+    random.seed(42)
+    lats = [random.uniform(-90, 90) for _ in range(100)]
+    lons = [random.uniform(-180, 180) for _ in range(100)]
+    # Include identical points and antimeridian crossings
+    lats.extend([lats[-1], 0, 0])
+    lons.extend([lons[-1], 179.5, -179.5])
+
+    latlons = list(zip(lats, lons))
+    assert geo.gps_distances(lats, lons) == [
+        geo.gps_distance(cur, nxt) for cur, nxt in geo.pairwise(latlons)
+    ]
+    assert geo.bearings(lats, lons) == [
+        geo.compute_bearing(cur, nxt) for cur, nxt in geo.pairwise(latlons)
+    ]
+
+    assert [] == geo.gps_distances([], [])
+    assert [] == geo.bearings([1], [2])
+
+
 def test_interpolate_directions_if_none():
     points = [
         Point(time=1, lat=0, lon=0, alt=1, angle=None),
@@ -719,6 +739,57 @@ class TestInterpolator(unittest.TestCase):
         self.assertEqual(point.time, 13300.0)
         self.assertAlmostEqual(point.lat, 11.15)  # From track_overlap_2
 
+    def test_random_access(self):
+        """Test that interpolate_at() and interpolate_many() agree with interpolate()."""
+        tracks = [
+            self.track_3,
+            self.identical_timestamps_track,
+            self.track_1,
+            self.regular_track,
+            self.track_2,
+            self.large_gaps_track,
+        ]
+        times = [
+            500.0,
+            1000.0,
+            1050.0,
+            3000.0,
+            3050.0,
+            7000.0,
+            7250.0,
+            7700.0,
+            8150.0,
+            20000.0,
+            30000.0,
+        ]
+
+        interpolator = geo.Interpolator(tracks)
+        expected = [interpolator.interpolate(t) for t in times]
+
+        interpolator = geo.Interpolator(tracks)
+        self.assertEqual(expected, interpolator.interpolate_many(times))
+
+        random.seed(7)
+        shuffled = list(range(len(times)))
+        random.shuffle(shuffled)
+        self.assertEqual(
+            [expected[idx] for idx in shuffled],
+            interpolator.interpolate_many([times[idx] for idx in shuffled]),
+        )
+        self.assertEqual(
+            [expected[idx] for idx in shuffled],
+            [interpolator.interpolate_at(times[idx]) for idx in shuffled],
+        )
+
+        # Random access does not affect the incremental state
+        interpolator.interpolate(8000.0)
+        interpolator.interpolate_at(1000.0)
+        interpolator.interpolate_many([2000.0, 1000.0])
+        self.assertEqual(
+            geo.Interpolator(tracks).interpolate(8100.0),
+            interpolator.interpolate(8100.0),
+        )
+
     def test_extreme_value_tracks(self):
         """Test with extreme timestamp values."""
         # Create track with very large timestamps
@@ -4,13 +4,21 @@
 # LICENSE file in the root directory of this source tree.
 
 import datetime
+import io
 import os
 import struct
+import typing as T
 from pathlib import Path
 
 import pytest
 from mapillary_tools import telemetry
+from mapillary_tools.camm import camm_builder
 from mapillary_tools.gpmf import gpmf_parser
+from mapillary_tools.mp4 import (
+    construct_mp4_parser as cparser,
+    mp4_sample_parser as sample_parser,
+    simple_mp4_builder,
+)
 
 
 # ---------------------------------------------------------------------------
@@ -962,6 +970,260 @@ class TestKLVParsing:
         assert x[1]["key"] == b"DEM2"
 
 
+class TestFastKLVParsing:
+    @staticmethod
+    def _klv(key: bytes, type_char: bytes, structure_size: int, repeat: int, payload):
+        assert len(payload) == structure_size * repeat
+        padding = b"\x00" * (-len(payload) % 4)
+        return (
+            key
+            + type_char
+            + struct.pack(">BH", structure_size, repeat)
+            + payload
+            + padding
+        )
+
+    def _build_sample_data(self) -> bytes:
+        klv = self._klv
+        gps5 = klv(
+            b"SCAL", b"l", 4, 5, struct.pack(">5i", 10000000, 10000000, 1000, 1000, 100)
+        )
+        gps5 += klv(b"GPSF", b"L", 4, 1, struct.pack(">I", 3))
+        gps5 += klv(b"GPSU", b"U", 16, 1, b"220731002523.200")
+        gps5 += klv(b"GPSP", b"S", 2, 1, struct.pack(">H", 342))
+        gps5 += klv(b"UNIT", b"c", 3, 5, b"degdegm\x00\x00m/sm/s")
+        gps5 += klv(b"GPSA", b"F", 4, 1, b"MSLV")
+        gps5 += klv(b"STMP", b"J", 8, 1, struct.pack(">Q", 60315))
+        gps5 += klv(
+            b"GPS5",
+            b"l",
+            20,
+            2,
+            struct.pack(">5i", 378081666, -1224280064, 9621, 1492, 138)
+            + struct.pack(">5i", 378081662, -1224280049, 9592, 1476, 150),
+        )
+
+        gps9 = klv(b"TYPE", b"c", 9, 1, b"lllllllSS")
+        gps9 += klv(
+            b"SCAL",
+            b"l",
+            4,
+            9,
+            struct.pack(">9i", 10000000, 10000000, 1000, 1000, 100, 1, 1000, 100, 1),
+        )
+        gps9 += klv(
+            b"GPS9",
+            b"?",
+            32,
+            1,
+            bytes.fromhex(
+                "1e71d2c703b6242500014dce000001270000002a000024f702ad0f0000b90003"
+            ),
+        )
+
+        accl = klv(b"SCAL", b"s", 2, 1, struct.pack(">h", 418))
+        accl += klv(b"ORIN", b"c", 1, 3, b"ZXY")
+        accl += klv(b"ORIO", b"c", 1, 3, b"zxY")
+        accl += klv(
+            b"MTRX", b"f", 36, 1, struct.pack(">9f", 0, 1, 0, 1, 0, 0, 0, 0, -1)
+        )
+        accl += klv(
+            b"ACCL",
+            b"s",
+            6,
+            3,
+            struct.pack(">9h", 4000, 700, -2100, 4010, 710, -2090, -1, 0, 32767),
+        )
+
+        # A stream not in use
+        shut = klv(b"SHUT", b"f", 4, 2, struct.pack(">2f", 0.5, 0.25))
+
+        devc = klv(b"DVID", b"L", 4, 1, struct.pack(">I", 1))
+        devc += klv(b"DVNM", b"c", 11, 1, b"Hero8 Black")
+        for stream in [shut, gps9, gps5, accl]:
+            devc += klv(b"STRM", b"\x00", 1, len(stream), stream)
+
+        return klv(b"DEVC", b"\x00", 4, len(devc) // 4, devc)
+
+    @classmethod
+    def _normalize(cls, parsed):
+        if isinstance(parsed, (list, tuple)):
+            return [cls._normalize(v) for v in parsed]
+        if isinstance(parsed, dict):
+            return {
+                k: cls._normalize(parsed[k])
+                for k in ["key", "type", "structure_size", "repeat", "data"]
+            }
+        return parsed
+
+    def test_same_as_construct(self):
+        data = self._build_sample_data()
+        expected = gpmf_parser.GPMFSampleData.parse(data)
+        actual = gpmf_parser._parse_gpmf_sample_data(data)
+        assert self._normalize(expected) == self._normalize(actual)
+
+        # truncated data
+        for size in [0, 7, 8, 100, len(data) - 1]:
+            expected = gpmf_parser.GPMFSampleData.parse(data[:size])
+            actual = gpmf_parser._parse_gpmf_sample_data(data[:size])
+            assert self._normalize(expected) == self._normalize(actual)
+
+    def test_zero_sizes_as_construct(self):
+        klv = self._klv
+        for data in [
+            b"ABCDl\x00\x00\x01",
+            b"ABCDl\x00\x00\x00",
+            klv(b"ABCD", b"l", 2, 2, b"\x00" * 4),
+            klv(b"ABCD", b"s", 4, 0, b""),
+        ]:
+            expected = gpmf_parser.GPMFSampleData.parse(data)
+            actual = gpmf_parser._parse_gpmf_sample_data(data)
+            assert self._normalize(expected) == self._normalize(actual)
+
+    def test_same_telemetry_as_construct(self):
+        data = self._build_sample_data()
+        expected = gpmf_parser.GPMFSampleData.parse(data)[0]["data"]
+        actual = gpmf_parser._parse_gpmf_sample_data(data)[0]["data"]
+
+        assert gpmf_parser._find_first_device_id(
+            expected
+        ) == gpmf_parser._find_first_device_id(actual)
+        points = gpmf_parser._find_first_gps_stream(actual)
+        assert 1 == len(points)
+        assert gpmf_parser._find_first_gps_stream(expected) == points
+        accls = gpmf_parser._find_first_telemetry_stream(actual, b"ACCL")
+        assert 3 == len(accls)
+        assert gpmf_parser._find_first_telemetry_stream(expected, b"ACCL") == accls
+
+    def test_skip_streams(self):
+        data = self._build_sample_data()
+        devc = gpmf_parser._parse_gpmf_sample_data(data, stream_keys={b"ACCL"})[0]
+        streams = [klv["data"] for klv in devc["data"] if klv["key"] == b"STRM"]
+        assert [0, 0, 0, 5] == [len(stream) for stream in streams]
+        assert [b"DVID", b"DVNM", b"STRM", b"STRM", b"STRM", b"STRM"] == [
+            klv["key"] for klv in devc["data"]
+        ]
+
+
+def _build_gpmd_mp4(sample_datas: T.Sequence[bytes], timedelta: int) -> T.BinaryIO:
+    """Build an MP4 with a gpmd track that contains the GPMF samples."""
+    raw_samples = [
+        sample_parser.RawSample(
+            description_idx=1,
+            offset=0,
+            size=len(data),
+            timedelta=timedelta,
+            composition_offset=0,
+            is_sync=True,
+        )
+        for data in sample_datas
+    ]
+
+    def _add_gpmd_trak(fp, moov_children):
+        trak = camm_builder.create_camm_trak(raw_samples, 1000)
+        stbl = cparser.find_box_at_pathx(trak, [b"trak", b"mdia", b"minf", b"stbl"])
+        stbl["data"] = cparser.Box32ConstructBuilder(
+            T.cast(cparser.SwitchMapType, cparser.CMAP[b"stbl"])
+        ).build_boxlist(
+            simple_mp4_builder.build_stbl_from_raw_samples(
+                [{"format": b"gpmd", "data_reference_index": 1, "data": b""}],
+                raw_samples,
+            )
+        )
+        moov_children.append(trak)
+        return (io.BytesIO(data) for data in sample_datas)
+
+    mvhd = {
+        "type": b"mvhd",
+        "data": {
+            "creation_time": 0,
+            "modification_time": 0,
+            "timescale": 1000,
+            "duration": 10_000,
+        },
+    }
+    src = cparser.MP4WithoutSTBLBuilderConstruct.build_boxlist(
+        [{"type": b"ftyp", "data": b"test"}, {"type": b"moov", "data": [mvhd]}]
+    )
+    return T.cast(
+        T.BinaryIO, simple_mp4_builder.transform_mp4(io.BytesIO(src), _add_gpmd_trak)
+    )
+
+
+class TestIterateGoProIMUTelemetry:
+    @staticmethod
+    def _build_device(device_id: int, stream_data: T.Dict[bytes, T.List[int]]):
+        klv = TestFastKLVParsing._klv
+        devc = klv(b"DVID", b"L", 4, 1, struct.pack(">I", device_id))
+        for key, values in stream_data.items():
+            stream = klv(b"SCAL", b"s", 2, 1, struct.pack(">h", 10))
+            stream += klv(
+                key,
+                b"s",
+                6,
+                len(values) // 3,
+                struct.pack(f">{len(values)}h", *values),
+            )
+            devc += klv(b"STRM", b"\x00", 1, len(stream), stream)
+        return klv(b"DEVC", b"\x00", 4, len(devc) // 4, devc)
+
+    def test_same_as_extract_gopro_info(self):
+        sample_datas = []
+        for idx in range(4):
+            data = self._build_device(
+                7,
+                {
+                    b"ACCL": [idx, 1, 2, idx, 3, 4, idx, 5, 6],
+                    b"GYRO": [idx, 10, 20, idx, 30, 40],
+                },
+            )
+            # the second device is ignored since ACCL is found in the first device
+            data += self._build_device(
+                8, {b"ACCL": [idx, 0, 0], b"MAGN": [idx, 7, 7, idx, 8, 8]}
+            )
+            sample_datas.append(data)
+
+        fp = _build_gpmd_mp4(sample_datas, timedelta=1000)
+        info = gpmf_parser.extract_gopro_info(fp, telemetry_only=True)
+        assert info is not None
+        assert 12 == len(info.accl)
+        assert 8 == len(info.gyro)
+        assert 8 == len(info.magn)
+        expected = sorted([*info.accl, *info.gyro, *info.magn], key=lambda m: m.time)
+
+        fp.seek(0)
+        actual = list(gpmf_parser.iterate_gopro_imu_telemetry(fp))
+        assert expected == actual
+
+    def test_skip_malformed_samples(self, monkeypatch):
+        sample_datas = [
+            self._build_device(7, {b"ACCL": [idx, 1, 2, idx, 3, 4]}) for idx in range(3)
+        ]
+        parse = gpmf_parser._parse_gpmf_sample_data
+
+        def _parse_malformed_second(data, stream_keys=None):
+            if bytes(data) == sample_datas[1]:
+                raise struct.error("malformed")
+            return parse(data, stream_keys)
+
+        monkeypatch.setattr(
+            gpmf_parser, "_parse_gpmf_sample_data", _parse_malformed_second
+        )
+
+        fp = _build_gpmd_mp4(sample_datas, timedelta=1000)
+        info = gpmf_parser.extract_gopro_info(fp, telemetry_only=True)
+        assert info is not None
+        assert [0, 0, 2, 2] == [int(accl.time) for accl in info.accl]
+
+        fp.seek(0)
+        accls = list(gpmf_parser.iterate_gopro_imu_telemetry(fp))
+        assert [0, 0, 2, 2] == [int(accl.time) for accl in accls]
+
+    def test_no_gpmd_track(self):
+        fp = _build_gpmd_mp4([], timedelta=1000)
+        assert [] == list(gpmf_parser.iterate_gopro_imu_telemetry(fp))
+
+
 # ---------------------------------------------------------------------------
 # 13. GoProInfo dataclass defaults
 # ---------------------------------------------------------------------------
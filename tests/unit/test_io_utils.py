@@ -6,7 +6,12 @@
 import io
 import random
 
-from mapillary_tools.mp4.io_utils import ChainedIO, SlicedIO
+from mapillary_tools.mp4.io_utils import (
+    ChainedIO,
+    plan_coalesced_reads,
+    read_ranges,
+    SlicedIO,
+)
 
 
 def test_chained():
@@ -126,3 +131,49 @@ def test_truncate():
     s = SlicedIO(c, 1, 5)
     assert s.read() == b"el"
     assert s.read() == b""
+
+
+def test_read_ranges_coalesced():
+    data = bytes(random.randint(0, 255) for _ in range(10_000))
+    ranges = [
+        (random.randint(0, len(data) + 10), random.randint(0, 100)) for _ in range(500)
+    ]
+    expected = [data[offset : offset + size] for offset, size in ranges]
+
+    for max_gap in [0, 10, 1000, None]:
+        for max_read_size in [1, 100, 10_000]:
+            actual = list(
+                read_ranges(
+                    io.BytesIO(data),
+                    ranges,
+                    max_gap=max_gap,
+                    max_read_size=max_read_size,
+                )
+            )
+            assert expected == actual
+
+
+def test_plan_coalesced_reads():
+    ranges = [(0, 4), (4, 4), (20, 4), (22, 1), (100, 50)]
+    reads = plan_coalesced_reads(ranges, max_gap=0)
+    assert [(0, 8), (20, 4), (100, 50)] == [(r.offset, r.size) for r in reads]
+    assert [[0, 1], [2, 3], [4]] == [r.range_indices for r in reads]
+
+    reads = plan_coalesced_reads(ranges, max_gap=12, max_read_size=30)
+    assert [(0, 24), (100, 50)] == [(r.offset, r.size) for r in reads]
+
+
+def test_read_ranges_mmap(tmp_path):
+    data = b"helloworld"
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    ranges = [(5, 5), (0, 5), (8, 10), (20, 1)]
+    with path.open("rb") as fp:
+        assert [b"world", b"hello", b"ld", b""] == list(
+            read_ranges(fp, ranges, use_mmap=True)
+        )
+
+    # empty files can not be mapped
+    path.write_bytes(b"")
+    with path.open("rb") as fp:
+        assert [b"", b"", b"", b""] == list(read_ranges(fp, ranges, use_mmap=True))
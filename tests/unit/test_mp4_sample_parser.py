@@ -3,9 +3,20 @@
 # This source code is licensed under the BSD license found in the
 # LICENSE file in the root directory of this source tree.
 
+import io
+import struct
+import typing as T
 from pathlib import Path
 
-from mapillary_tools.mp4 import mp4_sample_parser
+import pytest
+
+from mapillary_tools import telemetry
+from mapillary_tools.camm import camm_builder, camm_parser
+from mapillary_tools.mp4 import (
+    construct_mp4_parser as cparser,
+    moov_cache,
+    mp4_sample_parser,
+)
 
 
 def test_movie_box_parser():
@@ -70,3 +81,331 @@ def test_movie_box_parser_negative_composition_offset():
     assert 146 == len(raw_samples)
     # Make sure the parser can parse negative composition offsets
     assert 0 < len([s for s in raw_samples if s.composition_offset < 0])
+
+
+def test_sample_table_random_access():
+    for video_path in [
+        Path("tests/data/videos/sample-5s.mp4"),
+        Path("tests/data/videos/sample-5s_h265.mp4"),
+    ]:
+        moov_parser = mp4_sample_parser.MovieBoxParser.parse_file(video_path)
+        for track in moov_parser.extract_tracks():
+            table = track.extract_sample_table()
+            raw_samples = list(table)
+            assert 0 < len(raw_samples)
+            assert len(raw_samples) == len(table) == track.count_samples()
+            assert raw_samples == [table[idx] for idx in range(len(table))]
+            assert raw_samples[-1] == table[-1]
+
+            samples = list(track.extract_samples())
+            for idx in [0, 1, len(samples) // 2, len(samples) - 1]:
+                assert samples[idx] == track.extract_sample_at(idx)
+            assert samples[-1] == track.extract_sample_at(-1)
+
+            timescale = track.extract_mdhd_boxdata()["timescale"]
+            assert [
+                composition_time / timescale
+                for composition_time in table.composition_times()
+            ] == [sample.exact_composition_time for sample in samples]
+
+            with pytest.raises(IndexError):
+                table[len(table)]
+
+
+def test_sample_table_matches_construct_parser():
+    moov_parser = mp4_sample_parser.MovieBoxParser.parse_file(
+        Path("tests/data/videos/sample-5s_h265.mp4")
+    )
+    track = moov_parser.extract_track_at(0)
+    boxes = mp4_sample_parser.STBLBoxlistConstruct.parse(track.stbl_data)
+    stsz = cparser.find_box_at_pathx(boxes, [b"stsz"])["data"]
+    stss = cparser.find_box_at_pathx(boxes, [b"stss"])["data"]
+
+    raw_samples = list(track.extract_raw_samples())
+    assert list(stsz["entries"]) == [s.size for s in raw_samples]
+    assert set(stss["entries"]) == {
+        idx + 1 for idx, s in enumerate(raw_samples) if s.is_sync
+    }
+
+
+def test_movie_box_parser_selected_sample_formats():
+    video_path = Path("tests/data/videos/sample-5s.mp4")
+    full_parser = mp4_sample_parser.MovieBoxParser.parse_file(video_path)
+
+    aac_parser = mp4_sample_parser.MovieBoxParser.parse_file(
+        video_path, sample_formats={b"mp4a"}
+    )
+    tracks = list(aac_parser.extract_tracks())
+    assert 1 == len(tracks)
+    assert not tracks[0].is_video_track()
+    assert list(full_parser.extract_track_at(1).extract_samples()) == list(
+        tracks[0].extract_samples()
+    )
+    assert full_parser.extract_mvhd_boxdata() == aac_parser.extract_mvhd_boxdata()
+
+    with video_path.open("rb") as fp:
+        no_track_parser = mp4_sample_parser.MovieBoxParser.parse_stream(
+            fp, sample_formats={b"gpmd"}
+        )
+    assert [] == list(no_track_parser.extract_tracks())
+    assert full_parser.extract_mvhd_boxdata() == no_track_parser.extract_mvhd_boxdata()
+
+
+def test_movie_box_parser_selected_sample_formats_from_cache(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    video_path = tmp_path / "video.mp4"
+    video_path.write_bytes(Path("tests/data/videos/sample-5s.mp4").read_bytes())
+
+    # BytesIO is never cached, so the moov box is read selectively from the stream
+    uncached = mp4_sample_parser.MovieBoxParser.parse_stream(
+        io.BytesIO(video_path.read_bytes()), sample_formats={b"mp4a"}
+    )
+
+    cache = moov_cache.MoovCache(maxsize=64 * 1024 * 1024)
+    monkeypatch.setattr(moov_cache, "MOOV_CACHE", cache)
+    with video_path.open("rb") as fp:
+        # The selective read fills the cache with the whole moov box
+        cached = mp4_sample_parser.MovieBoxParser.parse_stream(
+            fp, sample_formats={b"mp4a"}
+        )
+        assert 1 == len(cache)
+        fp.seek(0)
+        full_parser = mp4_sample_parser.MovieBoxParser.parse_stream(fp)
+        assert 1 == len(cache)
+    assert uncached.moov_children == cached.moov_children
+    assert 2 == len(list(full_parser.extract_tracks()))
+
+    # The moov box is larger than the cache, so it is read selectively and not cached
+    monkeypatch.setattr(moov_cache, "MOOV_CACHE", moov_cache.MoovCache(maxsize=1024))
+    with video_path.open("rb") as fp:
+        selected = mp4_sample_parser.MovieBoxParser.parse_stream(
+            fp, sample_formats={b"mp4a"}
+        )
+    assert 0 == len(moov_cache.MOOV_CACHE)
+    assert uncached.moov_children == selected.moov_children
+
+
+def test_moov_cache(tmp_path: Path):
+    data = Path("tests/data/videos/sample-5s.mp4").read_bytes()
+    other = Path("tests/data/videos/sample-5s_h265.mp4").read_bytes()
+    expected = mp4_sample_parser.MovieBoxParser._parse_moov_data(io.BytesIO(data))
+    expected_other = mp4_sample_parser.MovieBoxParser._parse_moov_data(
+        io.BytesIO(other)
+    )
+    assert len(expected) < len(expected_other)
+
+    video_path = tmp_path / "video.mp4"
+    video_path.write_bytes(data)
+
+    cache = moov_cache.MoovCache(maxsize=len(expected_other))
+    for _ in range(2):
+        with video_path.open("rb") as fp:
+            moov = cache.read_moov(fp)
+            assert moov is not None
+            assert expected == moov.data
+    assert 1 == len(cache)
+
+    # The children boxes are indexed with the sample formats of the tracks
+    assert [b"mvhd", b"trak", b"trak", b"udta"] == [
+        child.type for child in moov.children
+    ]
+    assert [(b"avc1",), (b"mp4a",)] == [
+        child.sample_formats for child in moov.children if child.type == b"trak"
+    ]
+    assert mp4_sample_parser._select_moov_children_data(
+        io.BytesIO(expected), len(expected), {b"mp4a"}
+    ) == moov.select_data({b"mp4a"})
+
+    assert cache.read_moov(io.BytesIO(data)) is None
+    assert 1 == len(cache)
+
+    # A modified file is read again, and the stale entry is evicted to fit the new one
+    video_path.write_bytes(other)
+    with video_path.open("rb") as fp:
+        moov = cache.read_moov(fp)
+        assert moov is not None
+        assert expected_other == moov.data
+    assert 1 == len(cache)
+
+    with video_path.open("rb") as fp:
+        assert moov_cache.MoovCache(maxsize=0).read_moov(fp) is None
+
+    # The moov box is larger than the cache, so the stream is rewound for the caller
+    with video_path.open("rb") as fp:
+        assert moov_cache.MoovCache(maxsize=1024).read_moov(fp) is None
+        assert 0 == fp.tell()
+
+
+def _box(box_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(data), box_type) + data
+
+
+def _full_box(box_type: bytes, version: int, flags: int, data: bytes) -> bytes:
+    return _box(box_type, struct.pack(">I", (version << 24) | flags) + data)
+
+
+def _accl(time: float, x: float) -> telemetry.AccelerationData:
+    return telemetry.AccelerationData(time=time, x=x, y=0.0, z=0.0)
+
+
+def _build_fragmented_camm_mp4() -> T.Tuple[bytes, T.List[float]]:
+    """
+    Build a fragmented MP4 with a CAMM track (track_ID=1) and another track (track_ID=2)
+    """
+    trak = camm_builder.create_camm_trak([], 1000)
+    tkhd = cparser.find_box_at_pathx(trak, [b"trak", b"tkhd"])
+    T.cast(T.Dict, tkhd["data"])["track_ID"] = 1
+    trex = b"".join(
+        # default sample size 16 for CAMM accelerometer samples
+        _full_box(b"trex", 0, 0, struct.pack(">IIIII", track_ID, 1, 100, size, 0))
+        for track_ID, size in [(1, 16), (2, 4)]
+    )
+    mvhd = {
+        "type": b"mvhd",
+        "data": {
+            "creation_time": 0,
+            "modification_time": 0,
+            "timescale": 1000,
+            "duration": 0,
+        },
+    }
+    data = cparser.MP4WithoutSTBLBuilderConstruct.build_boxlist(
+        [
+            {"type": b"ftyp", "data": b"test"},
+            {"type": b"moov", "data": [mvhd, trak, {"type": b"mvex", "data": trex}]},
+        ]
+    )
+
+    def _camm_data(xs: T.Sequence[float]) -> bytes:
+        return b"".join(
+            camm_parser.AccelerationSampleEntry.serialize(_accl(0, x)) for x in xs
+        )
+
+    # Fragment 1: default-base-is-moof, tfdt (v1) at 1s, sample durations in trun
+    # and the sample data placed in mdat right after moof
+    def _moof1(data_offset: int) -> bytes:
+        traf = _full_box(b"tfhd", 0, 0x020000, struct.pack(">I", 1))
+        traf += _full_box(b"tfdt", 1, 0, struct.pack(">Q", 1000))
+        traf += _full_box(
+            b"trun",
+            0,
+            0x000001 | 0x000100,
+            struct.pack(">Ii3I", 3, data_offset, 10, 20, 30),
+        )
+        return _box(
+            b"moof",
+            _full_box(b"mfhd", 0, 0, struct.pack(">I", 1)) + _box(b"traf", traf),
+        )
+
+    moof = _moof1(len(_moof1(0)) + 8)
+    data += moof + _box(b"mdat", _camm_data([1, 2, 3]))
+
+    # Fragment 2: no tfdt (decode time continues), base data offset is the moof,
+    # the first run sets the data offset (with first sample flags: non-sync) and
+    # the second run continues from the first run. The traf of track 2 follows,
+    # whose data continues from the end of the data of track 1
+    def _moof2(data_offset: int) -> bytes:
+        traf1 = _full_box(b"tfhd", 0, 0x000008, struct.pack(">II", 1, 50))
+        traf1 += _full_box(
+            b"trun",
+            0,
+            0x000001 | 0x000004,
+            struct.pack(">IiI", 2, data_offset, 0x010000),
+        )
+        traf1 += _full_box(b"trun", 0, 0, struct.pack(">I", 1))
+        traf2 = _full_box(b"tfhd", 0, 0, struct.pack(">I", 2))
+        traf2 += _full_box(b"trun", 0, 0x000200, struct.pack(">II", 1, 4))
+        return _box(
+            b"moof",
+            _full_box(b"mfhd", 0, 0, struct.pack(">I", 2))
+            + _box(b"traf", traf1)
+            + _box(b"traf", traf2),
+        )
+
+    moof = _moof2(len(_moof2(0)) + 8)
+    data += moof + _box(b"mdat", _camm_data([4, 5, 6]) + b"TRK2")
+
+    # An incomplete moof at the end, e.g. the file is still being written
+    data += struct.pack(">I4s", 1000, b"moof") + b"\x00" * 10
+
+    return data, [1.0, 1.01, 1.03, 1.06, 1.11, 1.16]
+
+
+def test_fragmented_mp4_samples():
+    data, expected_times = _build_fragmented_camm_mp4()
+    moov = mp4_sample_parser.MovieBoxParser.parse_stream(io.BytesIO(data))
+    tracks = list(moov.extract_tracks())
+    assert 1 == len(tracks)
+    track = tracks[0]
+    assert track.is_fragmented()
+    assert 0 == len(track.extract_sample_table())
+    assert 6 == track.count_samples()
+
+    samples = list(track.extract_samples())
+    assert expected_times == pytest.approx([s.exact_time for s in samples])
+    assert [10, 20, 30, 50, 50, 50] == [s.raw_sample.timedelta for s in samples]
+    assert [True, True, True, False, True, True] == [
+        s.raw_sample.is_sync for s in samples
+    ]
+    assert [16] * 6 == [s.raw_sample.size for s in samples]
+    for sample in samples:
+        assert b"camm" == sample.description["format"]
+
+    assert samples[4] == track.extract_sample_at(4)
+    assert samples[-1] == track.extract_sample_at(-1)
+    with pytest.raises(IndexError):
+        track.extract_sample_at(6)
+
+    # track 2 is not in moov, and its data follows the data of track 1
+    trex_defaults = {
+        1: mp4_sample_parser.TrackFragmentDefaults(1, 100, 16, 0),
+        2: mp4_sample_parser.TrackFragmentDefaults(1, 100, 4, 0),
+    }
+    fragments = list(
+        mp4_sample_parser.iterate_track_fragments(io.BytesIO(data), 2, trex_defaults)
+    )
+    assert 1 == len(fragments)
+    (raw_sample,) = fragments[0].raw_samples
+    assert b"TRK2" == data[raw_sample.offset : raw_sample.offset + raw_sample.size]
+
+
+def test_fragmented_mp4_multiple_truns():
+    traf = _full_box(b"tfhd", 0, 0x000001, struct.pack(">IQ", 1, 1000))
+    # Both data offsets are relative to the base data offset of the track fragment
+    traf += _full_box(b"trun", 0, 0x000001, struct.pack(">Ii", 2, 100))
+    traf += _full_box(b"trun", 0, 0x000001, struct.pack(">Ii", 1, 300))
+    # Continues from the previous run
+    traf += _full_box(b"trun", 0, 0, struct.pack(">I", 1))
+
+    track_ID, fragment, end = mp4_sample_parser._parse_traf(
+        traf,
+        base_data_offset=0,
+        moof_offset=0,
+        trex_defaults={1: mp4_sample_parser.TrackFragmentDefaults(1, 100, 10, 0)},
+    )
+    assert 1 == track_ID
+    assert [1100, 1110, 1300, 1310] == [
+        raw_sample.offset for raw_sample in fragment.raw_samples
+    ]
+    assert 1320 == end
+
+
+def test_fragmented_mp4_camm_telemetry():
+    data, expected_times = _build_fragmented_camm_mp4()
+    camm_info = camm_parser.extract_camm_info(io.BytesIO(data), telemetry_only=True)
+    assert camm_info is not None
+    assert [
+        _accl(time, float(x)) for x, time in enumerate(expected_times, 1)
+    ] == pytest.approx(camm_info.accl)
+
+
+def test_fragmented_mp4_parse_file(tmp_path: Path):
+    data, expected_times = _build_fragmented_camm_mp4()
+    path = tmp_path / "fragmented.mp4"
+    path.write_bytes(data)
+    moov = mp4_sample_parser.MovieBoxParser.parse_file(path)
+    track = moov.extract_track_at(0)
+    assert expected_times == pytest.approx(
+        [s.exact_time for s in track.extract_samples()]
+    )
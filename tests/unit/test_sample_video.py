@@ -6,8 +6,10 @@
 from __future__ import annotations
 
 import datetime
+import itertools
 import json
 import os
+import random
 import shutil
 import typing as T
 from pathlib import Path
@@ -22,10 +24,12 @@ from mapillary_tools import (
     geo,
     sample_video,
 )
-from mapillary_tools.mp4 import mp4_sample_parser
+from mapillary_tools.mp4 import mp4_sample_parser, simple_mp4_builder
 from mapillary_tools.serializer import description
 from mapillary_tools.types import FileType, VideoMetadata
 
+from ..integration.fixtures import pytest_skip_if_not_ffmpeg_installed, setup_data
+
 _PWD = Path(os.path.dirname(os.path.abspath(__file__)))
 
 
@@ -54,6 +58,21 @@ class MOCK_FFMPEG(ffmpeglib.FFMPEG):
             sample = f"{frame_path_prefix}_{stream_specifier}_{idx + 1:06d}.jpg"
             shutil.copyfile(src, sample)
 
+    def iterate_frames_by_interval(
+        self,
+        video_path: Path,
+        video_sample_interval: float,
+        stream_specifier: int | str = "v",
+    ):
+        probe = self.probe_format_and_streams(video_path)
+        video_streams = [
+            s for s in probe.get("streams", []) if s.get("codec_type") == "video"
+        ]
+        duration = float(video_streams[0]["duration"])
+        image = _PWD.joinpath("data/test_exif.jpg").read_bytes()
+        for _ in range(0, int(duration / video_sample_interval)):
+            yield image
+
     def probe_format_and_streams(self, video_path: Path) -> ffmpeglib.ProbeOutput:
         with open(video_path) as fp:
             return json.load(fp)
@@ -89,6 +108,23 @@ def test_sample_video(tmpdir: py.path.local, setup_mock):
     _validate_interval([Path(s) for s in samples], video_start_time)
 
 
+def test_sample_video_pipe(tmpdir: py.path.local, setup_mock, monkeypatch):
+    monkeypatch.setattr(sample_video.constants, "VIDEO_SAMPLE_PIPE", True)
+    root = _PWD.joinpath("data/mock_sample_video")
+    video_dir = root.joinpath("videos")
+    sample_dir = tmpdir.mkdir("sampled_video_frames")
+    sample_video.sample_video(
+        video_dir,
+        Path(sample_dir),
+        video_sample_distance=-1,
+        video_sample_interval=2,
+        rerun=True,
+    )
+    samples = sample_dir.join("hello.mp4").listdir()
+    video_start_time = description.parse_capture_time("2021_08_10_14_37_05_023")
+    _validate_interval([Path(s) for s in samples], video_start_time)
+
+
 def test_sample_single_video(tmpdir: py.path.local, setup_mock):
     root = _PWD.joinpath("data/mock_sample_video")
     video_path = root.joinpath("videos", "hello.mp4")
@@ -166,6 +202,7 @@ def _make_gps_points(
 def _make_sample(
     composition_time: float,
     timedelta: float = 0.033,
+    is_sync: bool = True,
 ) -> mp4_sample_parser.Sample:
     """Create a synthetic mp4 Sample at the given composition time."""
     raw = mp4_sample_parser.RawSample(
@@ -174,7 +211,7 @@ def _make_sample(
         size=1000,
         timedelta=int(timedelta * 1000),
         composition_offset=0,
-        is_sync=True,
+        is_sync=is_sync,
     )
     return mp4_sample_parser.Sample(
         raw_sample=raw,
@@ -185,16 +222,48 @@ def _make_sample(
     )
 
 
+def _mock_track_parser(
+    samples: T.Sequence[mp4_sample_parser.Sample], timescale: int = 1000
+) -> mock.MagicMock:
+    """Mock a track parser with a sample table of the samples (in decoding order)."""
+    raw_samples: list[mp4_sample_parser.RawSample] = []
+    decode_time = 0
+    for sample in samples:
+        raw_sample = sample.raw_sample._replace(
+            timedelta=round(sample.exact_timedelta * timescale),
+            composition_offset=round(sample.exact_composition_time * timescale)
+            - decode_time,
+        )
+        raw_samples.append(raw_sample)
+        decode_time += raw_sample.timedelta
+
+    stbl = simple_mp4_builder.build_stbl_data_from_raw_samples(
+        [{"format": b"avc1", "data": b""}], raw_samples
+    )
+    mock_parser = mock.MagicMock(spec=mp4_sample_parser.TrackBoxParser)
+    mock_parser.is_fragmented.return_value = False
+    mock_parser.extract_sample_table.return_value = mp4_sample_parser.SampleTable(stbl)
+    mock_parser.extract_mdhd_boxdata.return_value = {"timescale": timescale}
+    return mock_parser
+
+
+def _video_frames(
+    samples: T.Sequence[mp4_sample_parser.Sample],
+) -> sample_video._VideoFrames:
+    return sample_video._VideoFrames.from_track(_mock_track_parser(samples))
+
+
 def _create_fake_frames(
     sample_dir: Path,
     video_stem: str,
     stream_specifier: str,
     num_frames: int,
+    start_number: int = 1,
 ) -> list[Path]:
     """Create fake JPEG frame files in sample_dir mimicking ffmpeg output."""
     os.makedirs(sample_dir, exist_ok=True)
     paths: list[Path] = []
-    for i in range(1, num_frames + 1):
+    for i in range(start_number, start_number + num_frames):
         name = f"{video_stem}_{stream_specifier}_{i:06d}.jpg"
         frame_path = sample_dir / name
         shutil.copy(str(TEST_EXIF_JPG), str(frame_path))
@@ -257,11 +326,8 @@ class TestSampleVideoStreamByDistance:
         points = _make_gps_points(10, lat_step=0.001, time_step=1.0)
         samples = [_make_sample(float(i)) for i in range(10)]
 
-        mock_parser = mock.MagicMock(spec=mp4_sample_parser.TrackBoxParser)
-        mock_parser.extract_samples.return_value = iter(samples)
-
         result = sample_video._sample_video_stream_by_distance(
-            points, mock_parser, sample_distance=50.0
+            points, _video_frames(samples), sample_distance=50.0
         )
 
         # Each point is ~111m apart in lat, so all 10 should be selected
@@ -274,11 +340,8 @@ class TestSampleVideoStreamByDistance:
         points = _make_gps_points(10, lat_step=0.0001, lon_step=0.0001, time_step=1.0)
         samples = [_make_sample(float(i)) for i in range(10)]
 
-        mock_parser = mock.MagicMock(spec=mp4_sample_parser.TrackBoxParser)
-        mock_parser.extract_samples.return_value = iter(samples)
-
         result = sample_video._sample_video_stream_by_distance(
-            points, mock_parser, sample_distance=50.0
+            points, _video_frames(samples), sample_distance=50.0
         )
 
         assert len(result) < 10
@@ -289,11 +352,8 @@ class TestSampleVideoStreamByDistance:
         points = _make_gps_points(5, time_step=1.0)
         samples = [_make_sample(float(i)) for i in range(5)]
 
-        mock_parser = mock.MagicMock(spec=mp4_sample_parser.TrackBoxParser)
-        mock_parser.extract_samples.return_value = iter(samples)
-
         result = sample_video._sample_video_stream_by_distance(
-            points, mock_parser, sample_distance=0.0
+            points, _video_frames(samples), sample_distance=0.0
         )
 
         assert len(result) == 5
@@ -309,26 +369,101 @@ class TestSampleVideoStreamByDistance:
         # Samples at t=0..9 — only t=2..6 should be interpolated
         samples = [_make_sample(float(i)) for i in range(10)]
 
-        mock_parser = mock.MagicMock(spec=mp4_sample_parser.TrackBoxParser)
-        mock_parser.extract_samples.return_value = iter(samples)
-
         result = sample_video._sample_video_stream_by_distance(
-            points, mock_parser, sample_distance=0.0
+            points, _video_frames(samples), sample_distance=0.0
         )
 
         for idx in result:
             sample_time = samples[idx].exact_composition_time
             assert 1.999 <= sample_time <= 6.001
 
+    @pytest.mark.parametrize("sample_distance", [0.0, 0.5, 3.0, 20.0])
+    def test_same_as_sampling_every_frame(self, sample_distance: float) -> None:
+        """Selecting by along-track distance should match interpolating every frame."""
+        random.seed(sample_distance)
+        points = []
+        lat, lon = 40.0, -74.0
+        for i in range(200):
+            # Drive, stop with GPS jitter, and turn around
+            if i < 80:
+                lat += 2e-5
+            elif i < 120:
+                lat += random.uniform(-5e-6, 5e-6)
+                lon += random.uniform(-5e-6, 5e-6)
+            else:
+                lat -= random.uniform(0, 3e-5)
+                lon += random.uniform(-3e-5, 3e-5)
+            points.append(
+                geo.Point(time=i * 0.5 + 1.0, lat=lat, lon=lon, alt=None, angle=None)
+            )
+        frame_times = [i / 30 for i in range(30 * 110)]
+
+        interpolator = geo.Interpolator([points])
+        expected = list(
+            geo.sample_points_by_distance(
+                [
+                    (idx, interpolator.interpolate(t))
+                    for idx, t in enumerate(frame_times)
+                    if sample_video._within_track_time_range_buffered(points, t)
+                ],
+                sample_distance,
+                point_func=lambda x: x[1],
+            )
+        )
+
+        selected = sample_video._select_frames_by_distance(
+            points, frame_times, sample_distance
+        )
+        assert [idx for idx, _ in selected] == [idx for idx, _ in expected]
+        assert [p for _, p in selected] == [p for _, p in expected]
+
+    def test_builds_selected_samples_only(self) -> None:
+        points = _make_gps_points(5, lat_step=0.001, time_step=1.0)
+        samples = [_make_sample(i / 30) for i in range(30 * 5)]
+        frames = _video_frames(samples)
+
+        with mock.patch.object(
+            frames, "_sample_at", side_effect=frames._sample_at
+        ) as mock_sample_at:
+            result = sample_video._sample_video_stream_by_distance(
+                points, frames, sample_distance=50.0
+            )
+
+        assert 0 < len(result) < len(samples)
+        assert mock_sample_at.call_count == len(result)
+        for idx, (sample, _) in result.items():
+            # Rounded to the timescale (1000) of the sample table
+            assert sample.exact_composition_time == pytest.approx(
+                samples[idx].exact_composition_time, abs=1e-3
+            )
+
+    @pytest.mark.parametrize("video_name", ["sample-5s.mp4", "sample-5s_h265.mp4"])
+    def test_video_frames_in_composition_order(self, video_name: str) -> None:
+        track_parser = mp4_sample_parser.MovieBoxParser.parse_file(
+            _PWD.parent / "data/videos" / video_name
+        ).extract_track_at(0)
+        samples = sorted(
+            track_parser.extract_samples(),
+            key=lambda sample: sample.exact_composition_time,
+        )
+        # B-frames are decoded before they are presented
+        assert samples != list(track_parser.extract_samples())
+
+        frames = sample_video._VideoFrames.from_track(track_parser)
+        assert frames.composition_times == [
+            sample.exact_composition_time for sample in samples
+        ]
+        assert frames.sync_indices == [
+            idx for idx, sample in enumerate(samples) if sample.raw_sample.is_sync
+        ]
+        assert [frames.sample_at(idx) for idx in range(len(frames))] == samples
+
     def test_empty_samples(self) -> None:
         """Empty video track should produce no selected frames."""
         points = _make_gps_points(5, time_step=1.0)
 
-        mock_parser = mock.MagicMock(spec=mp4_sample_parser.TrackBoxParser)
-        mock_parser.extract_samples.return_value = iter([])
-
         result = sample_video._sample_video_stream_by_distance(
-            points, mock_parser, sample_distance=3.0
+            points, _video_frames([]), sample_distance=3.0
         )
 
         assert len(result) == 0
@@ -404,6 +539,59 @@ class TestSampleVideoRerun:
             mock_sample.assert_called_once()
 
 
+def test_sample_checkpoint(tmp_path: Path) -> None:
+    header = {"video_size": 1}
+
+    with sample_video._SampleCheckpoint.open(tmp_path, header) as checkpoint:
+        assert checkpoint.completed == []
+        checkpoint.add(3)
+        checkpoint.add(7)
+    # Removed once completed
+    assert list(tmp_path.iterdir()) == []
+
+    with pytest.raises(KeyboardInterrupt):
+        with sample_video._SampleCheckpoint.open(tmp_path, header) as checkpoint:
+            checkpoint.add(3)
+            checkpoint.add(7)
+            raise KeyboardInterrupt()
+
+    # Ignore the partially written line
+    with tmp_path.joinpath(sample_video._SampleCheckpoint.FILENAME).open("a") as fp:
+        fp.write("1")
+
+    with pytest.raises(KeyboardInterrupt):
+        with sample_video._SampleCheckpoint.open(tmp_path, header) as checkpoint:
+            assert checkpoint.completed == [3, 7]
+            assert checkpoint.count_completed_prefix([3, 7, 9]) == 2
+            assert checkpoint.count_completed_prefix([3, 8, 9]) == 1
+            raise KeyboardInterrupt()
+
+    # Start over if the sampling is different
+    with sample_video._SampleCheckpoint.open(tmp_path, {"video_size": 2}) as checkpoint:
+        assert checkpoint.completed == []
+
+
+def test_find_video_sample_dirs(tmp_path: Path) -> None:
+    video_dir = tmp_path / "videos"
+    video_dir.joinpath("sub").mkdir(parents=True)
+    (video_dir / "a.mp4").touch()
+    (video_dir / "sub" / "b.mp4").touch()
+    output_dir = tmp_path / "output"
+
+    sample_dirs = sample_video.find_video_sample_dirs(video_dir, output_dir)
+    assert sorted(
+        (video_path.name, sample_dir) for video_path, sample_dir in sample_dirs
+    ) == [
+        ("a.mp4", output_dir / "a.mp4"),
+        ("b.mp4", output_dir / "sub" / "b.mp4"),
+    ]
+
+    sample_dirs = sample_video.find_video_sample_dirs(
+        video_dir, output_dir, skip_subfolders=True
+    )
+    assert [sample_dir for _, sample_dir in sample_dirs] == [output_dir / "a.mp4"]
+
+
 # ---------------------------------------------------------------------------
 # Distance-based sampling: integration tests with mocked ffmpeg and geotag
 # ---------------------------------------------------------------------------
@@ -432,11 +620,13 @@ class TestSampleVideoDistanceIntegration:
 
         video_samples = [_make_sample(float(i)) for i in range(num_gps_points)]
 
-        mock_track_parser = mock.MagicMock(spec=mp4_sample_parser.TrackBoxParser)
-        mock_track_parser.extract_samples.return_value = iter(video_samples)
+        mock_track_parser = _mock_track_parser(video_samples)
 
         mock_moov_parser = mock.MagicMock(spec=mp4_sample_parser.MovieBoxParser)
         mock_moov_parser.extract_track_at.return_value = mock_track_parser
+        # No tracks to probe natively, so the video is probed with the mocked ffprobe
+        mock_moov_parser.moov_children = []
+        mock_moov_parser.extract_tracks.side_effect = lambda: iter([])
 
         patches = {}
 
@@ -446,17 +636,30 @@ class TestSampleVideoDistanceIntegration:
             sample_dir: Path,
             frame_indices: set[int],
             stream_specifier: str = "v",
+            seek_time: float | None = None,
+            start_number: int = 1,
         ) -> None:
             _create_fake_frames(
                 sample_dir,
                 video_path.stem,
                 stream_specifier,
                 len(frame_indices),
+                start_number=start_number,
             )
 
+        def fake_iterate_frames(
+            video_path: Path,
+            frame_indices: set[int],
+            stream_specifier: str = "v",
+            seek_time: float | None = None,
+        ) -> T.Iterator[bytes]:
+            image = TEST_EXIF_JPG.read_bytes()
+            return iter([image] * len(frame_indices))
+
         mock_ffmpeg_instance = mock.MagicMock(spec=ffmpeglib.FFMPEG)
         mock_ffmpeg_instance.probe_format_and_streams.return_value = probe_output
         mock_ffmpeg_instance.extract_specified_frames.side_effect = fake_extract_frames
+        mock_ffmpeg_instance.iterate_specified_frames.side_effect = fake_iterate_frames
 
         mock_ffmpeg_class = mock.MagicMock()
         mock_ffmpeg_class.return_value = mock_ffmpeg_instance
@@ -492,6 +695,7 @@ class TestSampleVideoDistanceIntegration:
             "patches": patches,
             "gps_points": gps_points,
             "video_metadata": video_metadata,
+            "video_samples": video_samples,
         }
 
     def test_single_video_file(self, tmp_path: Path) -> None:
@@ -525,6 +729,360 @@ class TestSampleVideoDistanceIntegration:
         assert exif.extract_lon_lat() is not None
         assert exif.extract_capture_time() is not None
 
+    def test_single_video_file_pipe(self, tmp_path: Path, monkeypatch) -> None:
+        """Frames piped from ffmpeg are written once with EXIF."""
+        monkeypatch.setattr(sample_video.constants, "VIDEO_SAMPLE_PIPE", True)
+        video_dir = tmp_path / "videos"
+        video_dir.mkdir()
+        video_file = video_dir / "test.mp4"
+        video_file.touch()
+        output_dir = tmp_path / "output"
+
+        mocks = self._setup_mocks(tmp_path, video_file)
+
+        with (
+            mocks["patches"]["ffmpeg_cls"],
+            mocks["patches"]["geotag_cls"],
+            mocks["patches"]["moov_parse"],
+        ):
+            sample_video.sample_video(
+                video_import_path=video_file,
+                import_path=output_dir,
+                video_sample_distance=0.0,
+            )
+
+        frames = sorted((output_dir / "test.mp4").glob("*.jpg"))
+        assert [frame.name for frame in frames] == [
+            f"test_0_{idx:06d}.jpg" for idx in range(1, 11)
+        ]
+
+        for frame, point in zip(frames, mocks["gps_points"]):
+            lon_lat = exif_read.ExifRead(frame).extract_lon_lat()
+            assert lon_lat == pytest.approx((point.lon, point.lat))
+
+    def test_single_video_file_checkpoint(self, tmp_path: Path, monkeypatch) -> None:
+        """Interrupted sampling is resumed after the checkpointed frames."""
+        monkeypatch.setattr(sample_video.constants, "VIDEO_SAMPLE_CHECKPOINT", True)
+        video_dir = tmp_path / "videos"
+        video_dir.mkdir()
+        video_file = video_dir / "test.mp4"
+        video_file.touch()
+        output_dir = tmp_path / "output"
+        sample_dir = output_dir / "test.mp4"
+        image = TEST_EXIF_JPG.read_bytes()
+
+        def interrupted_iterate_frames(
+            video_path: Path, frame_indices: set[int], **kwargs
+        ) -> T.Iterator[bytes]:
+            yield from [image] * 4
+            raise KeyboardInterrupt()
+
+        mocks = self._setup_mocks(tmp_path, video_file)
+        mock_ffmpeg = mocks["patches"]["ffmpeg_cls"].new.return_value
+        mock_ffmpeg.iterate_specified_frames.side_effect = interrupted_iterate_frames
+        with (
+            mocks["patches"]["ffmpeg_cls"],
+            mocks["patches"]["geotag_cls"],
+            mocks["patches"]["moov_parse"],
+            pytest.raises(KeyboardInterrupt),
+        ):
+            sample_video.sample_video(
+                video_import_path=video_file,
+                import_path=output_dir,
+                video_sample_distance=0.0,
+            )
+
+        assert not sample_dir.exists()
+        wip_dir = sample_video.checkpoint_sample_dir(sample_dir)
+        assert len(list(wip_dir.glob("*.jpg"))) == 4
+
+        mocks = self._setup_mocks(tmp_path, video_file)
+        mock_ffmpeg = mocks["patches"]["ffmpeg_cls"].new.return_value
+        with (
+            mocks["patches"]["ffmpeg_cls"],
+            mocks["patches"]["geotag_cls"],
+            mocks["patches"]["moov_parse"],
+        ):
+            sample_video.sample_video(
+                video_import_path=video_file,
+                import_path=output_dir,
+                video_sample_distance=0.0,
+            )
+
+        # Only the remaining frames are extracted, decoded from the keyframe
+        # of the first remaining frame (every frame is a keyframe here)
+        [call] = mock_ffmpeg.iterate_specified_frames.call_args_list
+        assert call.kwargs["seek_time"] is not None
+        assert call.kwargs["frame_indices"] == set(range(0, 6))
+
+        assert not wip_dir.exists()
+        assert sorted(path.name for path in sample_dir.iterdir()) == [
+            f"test_0_{idx:06d}.jpg" for idx in range(1, 11)
+        ]
+        for frame, point in zip(sorted(sample_dir.iterdir()), mocks["gps_points"]):
+            lon_lat = exif_read.ExifRead(frame).extract_lon_lat()
+            assert lon_lat == pytest.approx((point.lon, point.lat))
+
+    def test_single_video_file_checkpoint_changed(
+        self, tmp_path: Path, monkeypatch
+    ) -> None:
+        """The samples of an interrupted sampling are discarded if the sample set changes."""
+        monkeypatch.setattr(sample_video.constants, "VIDEO_SAMPLE_CHECKPOINT", True)
+        video_dir = tmp_path / "videos"
+        video_dir.mkdir()
+        video_file = video_dir / "test.mp4"
+        video_file.touch()
+        output_dir = tmp_path / "output"
+        sample_dir = output_dir / "test.mp4"
+        image = TEST_EXIF_JPG.read_bytes()
+
+        def interrupted_iterate_frames(
+            video_path: Path, frame_indices: set[int], **kwargs
+        ) -> T.Iterator[bytes]:
+            yield from [image] * 8
+            raise KeyboardInterrupt()
+
+        mocks = self._setup_mocks(tmp_path, video_file)
+        mock_ffmpeg = mocks["patches"]["ffmpeg_cls"].new.return_value
+        mock_ffmpeg.iterate_specified_frames.side_effect = interrupted_iterate_frames
+        with (
+            mocks["patches"]["ffmpeg_cls"],
+            mocks["patches"]["geotag_cls"],
+            mocks["patches"]["moov_parse"],
+            pytest.raises(KeyboardInterrupt),
+        ):
+            sample_video.sample_video(
+                video_import_path=video_file,
+                import_path=output_dir,
+                video_sample_distance=0.0,
+            )
+
+        wip_dir = sample_video.checkpoint_sample_dir(sample_dir)
+        assert len(list(wip_dir.glob("*.jpg"))) == 8
+
+        # Sample every other GPS point (about 157 meters apart) instead
+        mocks = self._setup_mocks(tmp_path, video_file)
+        mock_ffmpeg = mocks["patches"]["ffmpeg_cls"].new.return_value
+        with (
+            mocks["patches"]["ffmpeg_cls"],
+            mocks["patches"]["geotag_cls"],
+            mocks["patches"]["moov_parse"],
+        ):
+            sample_video.sample_video(
+                video_import_path=video_file,
+                import_path=output_dir,
+                video_sample_distance=200.0,
+            )
+
+        [call] = mock_ffmpeg.iterate_specified_frames.call_args_list
+        assert call.kwargs["frame_indices"] == {0, 2, 4, 6, 8}
+
+        assert not wip_dir.exists()
+        assert sorted(path.name for path in sample_dir.iterdir()) == [
+            f"test_0_{idx:06d}.jpg" for idx in range(1, 6)
+        ]
+        for frame, point in zip(sorted(sample_dir.iterdir()), mocks["gps_points"][::2]):
+            lon_lat = exif_read.ExifRead(frame).extract_lon_lat()
+            assert lon_lat == pytest.approx((point.lon, point.lat))
+
+    def test_single_video_file_all_streams(self, tmp_path: Path, monkeypatch) -> None:
+        """All video streams are extracted in one ffmpeg run and tagged per stream."""
+        monkeypatch.setattr(sample_video.constants, "VIDEO_SAMPLE_ALL_STREAMS", True)
+        video_dir = tmp_path / "videos"
+        video_dir.mkdir()
+        video_file = video_dir / "test.mp4"
+        video_file.touch()
+        output_dir = tmp_path / "output"
+
+        mocks = self._setup_mocks(tmp_path, video_file)
+        mock_ffmpeg = mocks["patches"]["ffmpeg_cls"].new.return_value
+        probe_output = mock_ffmpeg.probe_format_and_streams.return_value
+        probe_output["streams"].append(
+            {**probe_output["streams"][0], "index": 2, "width": 1920}
+        )
+
+        def fake_extract_frames_from_streams(
+            video_path: Path,
+            sample_dir: Path,
+            frame_indices_by_stream: dict[str, set[int]],
+        ) -> None:
+            for stream_specifier, frame_indices in frame_indices_by_stream.items():
+                _create_fake_frames(
+                    sample_dir, video_path.stem, stream_specifier, len(frame_indices)
+                )
+
+        mock_ffmpeg.extract_specified_frames_from_streams.side_effect = (
+            fake_extract_frames_from_streams
+        )
+
+        with (
+            mocks["patches"]["ffmpeg_cls"],
+            mocks["patches"]["geotag_cls"],
+            mocks["patches"]["moov_parse"],
+        ):
+            sample_video.sample_video(
+                video_import_path=video_file,
+                import_path=output_dir,
+                video_sample_distance=0.0,
+            )
+
+        mock_ffmpeg.extract_specified_frames_from_streams.assert_called_once()
+        mock_ffmpeg.extract_specified_frames.assert_not_called()
+        mock_ffmpeg.iterate_specified_frames.assert_not_called()
+
+        sample_dir = output_dir / "test.mp4"
+        for stream_specifier in ["0", "2"]:
+            frames = sorted(sample_dir.glob(f"test_{stream_specifier}_*.jpg"))
+            assert len(frames) == 10
+            for frame, point in zip(frames, mocks["gps_points"]):
+                exif = exif_read.ExifRead(frame)
+                assert exif.extract_lon_lat() == pytest.approx((point.lon, point.lat))
+                assert exif.extract_camera_uuid() == f"stream{stream_specifier}"
+
+    def test_single_video_file_stream_copy(self, tmp_path: Path) -> None:
+        """JPEG samples of MJPEG videos are copied from the video file without ffmpeg."""
+        video_dir = tmp_path / "videos"
+        video_dir.mkdir()
+        video_file = video_dir / "test.mov"
+        image = TEST_EXIF_JPG.read_bytes()
+        video_file.write_bytes(image * 10)
+        output_dir = tmp_path / "output"
+
+        mocks = self._setup_mocks(tmp_path, video_file)
+        mock_ffmpeg = mocks["patches"]["ffmpeg_cls"].new.return_value
+        probe_output = mock_ffmpeg.probe_format_and_streams.return_value
+        probe_output["streams"][0]["codec_name"] = "mjpeg"
+        mock_moov_parser = mocks["patches"]["moov_parse"].kwargs["return_value"]
+        mock_moov_parser.extract_track_at.return_value = _mock_track_parser(
+            [
+                sample._replace(
+                    raw_sample=sample.raw_sample._replace(
+                        offset=idx * len(image), size=len(image)
+                    )
+                )
+                for idx, sample in enumerate(mocks["video_samples"])
+            ]
+        )
+
+        with (
+            mocks["patches"]["ffmpeg_cls"],
+            mocks["patches"]["geotag_cls"],
+            mocks["patches"]["moov_parse"],
+        ):
+            sample_video.sample_video(
+                video_import_path=video_file,
+                import_path=output_dir,
+                video_sample_distance=0.0,
+            )
+
+        mock_ffmpeg.extract_specified_frames.assert_not_called()
+        mock_ffmpeg.iterate_specified_frames.assert_not_called()
+
+        frames = sorted((output_dir / "test.mov").iterdir())
+        assert len(frames) == 10
+        for frame, point in zip(frames, mocks["gps_points"]):
+            exif = exif_read.ExifRead(frame)
+            assert exif.extract_lon_lat() == pytest.approx((point.lon, point.lat))
+
+    def _setup_stream_copy_mocks(
+        self, tmp_path: Path, video_file: Path, images: list[bytes]
+    ) -> dict:
+        """Store the images as the samples of an MJPEG video"""
+        video_file.write_bytes(b"".join(images))
+        mocks = self._setup_mocks(tmp_path, video_file)
+        mock_ffmpeg = mocks["patches"]["ffmpeg_cls"].new.return_value
+        probe_output = mock_ffmpeg.probe_format_and_streams.return_value
+        probe_output["streams"][0]["codec_name"] = "mjpeg"
+        offsets = list(
+            itertools.accumulate((len(image) for image in images), initial=0)
+        )
+        mock_moov_parser = mocks["patches"]["moov_parse"].kwargs["return_value"]
+        mock_moov_parser.extract_track_at.return_value = _mock_track_parser(
+            [
+                sample._replace(
+                    raw_sample=sample.raw_sample._replace(
+                        offset=offset, size=len(image)
+                    )
+                )
+                for sample, offset, image in zip(
+                    mocks["video_samples"], offsets, images
+                )
+            ]
+        )
+        return mocks
+
+    def test_single_video_file_stream_copy_fallback(self, tmp_path: Path) -> None:
+        """Samples after the first one that is not a complete JPEG image are extracted with ffmpeg."""
+        video_dir = tmp_path / "videos"
+        video_dir.mkdir()
+        video_file = video_dir / "test.mov"
+        output_dir = tmp_path / "output"
+        image = TEST_EXIF_JPG.read_bytes()
+        # An MJPEG frame without the Huffman tables
+        image_without_dht = b"\xff\xd8\xff\xda\x00\x02\x00\xff\xd9"
+        mocks = self._setup_stream_copy_mocks(
+            tmp_path, video_file, [image] * 6 + [image_without_dht] + [image] * 3
+        )
+        mock_ffmpeg = mocks["patches"]["ffmpeg_cls"].new.return_value
+
+        with (
+            mocks["patches"]["ffmpeg_cls"],
+            mocks["patches"]["geotag_cls"],
+            mocks["patches"]["moov_parse"],
+        ):
+            sample_video.sample_video(
+                video_import_path=video_file,
+                import_path=output_dir,
+                video_sample_distance=0.0,
+            )
+
+        # Only the remaining samples are extracted with ffmpeg
+        [call] = mock_ffmpeg.extract_specified_frames.call_args_list
+        assert call.kwargs["start_number"] == 7
+        assert len(call.kwargs["frame_indices"]) == 4
+
+        frames = sorted((output_dir / "test.mov").iterdir())
+        assert [frame.name for frame in frames] == [
+            f"test_0_{idx:06d}.jpg" for idx in range(1, 11)
+        ]
+        for frame, point in zip(frames, mocks["gps_points"]):
+            exif = exif_read.ExifRead(frame)
+            assert exif.extract_lon_lat() == pytest.approx((point.lon, point.lat))
+
+    def test_single_video_file_stream_copy_interlaced(self, tmp_path: Path) -> None:
+        """Samples of Motion JPEG format A (mjpa) are extracted with ffmpeg."""
+        video_dir = tmp_path / "videos"
+        video_dir.mkdir()
+        video_file = video_dir / "test.mov"
+        output_dir = tmp_path / "output"
+        image = TEST_EXIF_JPG.read_bytes()
+        mocks = self._setup_stream_copy_mocks(tmp_path, video_file, [image] * 10)
+        mock_ffmpeg = mocks["patches"]["ffmpeg_cls"].new.return_value
+        probe_output = mock_ffmpeg.probe_format_and_streams.return_value
+        probe_output["streams"][0]["codec_tag_string"] = "mjpa"
+
+        with (
+            mocks["patches"]["ffmpeg_cls"],
+            mocks["patches"]["geotag_cls"],
+            mocks["patches"]["moov_parse"],
+        ):
+            sample_video.sample_video(
+                video_import_path=video_file,
+                import_path=output_dir,
+                video_sample_distance=0.0,
+            )
+
+        mock_ffmpeg.extract_specified_frames.assert_called_once()
+        assert len(list((output_dir / "test.mov").iterdir())) == 10
+
+    def test_is_complete_jpeg(self) -> None:
+        image = TEST_EXIF_JPG.read_bytes()
+        assert sample_video._is_complete_jpeg(image)
+        # Truncated
+        assert not sample_video._is_complete_jpeg(image[: len(image) // 2])
+        # Two fields of an interlaced frame
+        assert not sample_video._is_complete_jpeg(image + image)
+
     def test_video_directory(self, tmp_path: Path) -> None:
         """sample_video with a directory processes all videos."""
         video_dir = tmp_path / "videos"
@@ -608,3 +1166,453 @@ class TestSampleVideoDistanceIntegration:
         # First GPS point is at (40.0, -74.0)
         assert abs(lat - 40.0) < 0.01
         assert abs(lon - (-74.0)) < 0.01
+
+
+# ---------------------------------------------------------------------------
+# sample_video() with concurrent sampling workers
+# ---------------------------------------------------------------------------
+
+
+class TestSampleVideoConcurrently:
+    """Test sampling multiple videos concurrently."""
+
+    def _setup_videos(self, tmp_path: Path, count: int) -> Path:
+        video_dir = tmp_path / "videos"
+        video_dir.mkdir()
+        for idx in range(count):
+            (video_dir / f"clip{idx}.mp4").touch()
+        return video_dir
+
+    def test_sample_all_videos(self, tmp_path: Path) -> None:
+        video_dir = self._setup_videos(tmp_path, 5)
+
+        with mock.patch.object(
+            sample_video, "_sample_single_video_by_distance"
+        ) as mock_sample:
+            sample_video.sample_video(
+                video_import_path=video_dir,
+                import_path=tmp_path / "output",
+                num_sample_workers=3,
+            )
+
+        assert mock_sample.call_count == 5
+        assert {call.args[0].name for call in mock_sample.call_args_list} == {
+            f"clip{idx}.mp4" for idx in range(5)
+        }
+        for call in mock_sample.call_args_list:
+            assert (
+                call.kwargs["ffmpeg_threads"]
+                == sample_video.constants.VIDEO_SAMPLE_FFMPEG_THREADS
+            )
+
+    def test_single_worker_does_not_limit_ffmpeg_threads(self, tmp_path: Path) -> None:
+        video_dir = self._setup_videos(tmp_path, 2)
+
+        with mock.patch.object(
+            sample_video, "_sample_single_video_by_distance"
+        ) as mock_sample:
+            sample_video.sample_video(
+                video_import_path=video_dir,
+                import_path=tmp_path / "output",
+                num_sample_workers=1,
+            )
+
+        assert mock_sample.call_count == 2
+        for call in mock_sample.call_args_list:
+            assert call.kwargs["ffmpeg_threads"] is None
+
+    def _fail_clip1(self, video_path: Path, *args, **kwargs) -> None:
+        if video_path.name == "clip1.mp4":
+            raise exceptions.MapillaryVideoError("broken video")
+
+    def test_skip_sample_errors(self, tmp_path: Path) -> None:
+        video_dir = self._setup_videos(tmp_path, 4)
+
+        with mock.patch.object(
+            sample_video,
+            "_sample_single_video_by_distance",
+            side_effect=self._fail_clip1,
+        ) as mock_sample:
+            sample_video.sample_video(
+                video_import_path=video_dir,
+                import_path=tmp_path / "output",
+                skip_sample_errors=True,
+                num_sample_workers=2,
+            )
+
+        assert mock_sample.call_count == 4
+
+    def test_raise_sample_errors(self, tmp_path: Path) -> None:
+        video_dir = self._setup_videos(tmp_path, 4)
+
+        with mock.patch.object(
+            sample_video,
+            "_sample_single_video_by_distance",
+            side_effect=self._fail_clip1,
+        ):
+            with pytest.raises(exceptions.MapillaryVideoError):
+                sample_video.sample_video(
+                    video_import_path=video_dir,
+                    import_path=tmp_path / "output",
+                    num_sample_workers=2,
+                )
+
+    def test_ffmpeg_not_found_is_fatal(self, tmp_path: Path) -> None:
+        video_dir = self._setup_videos(tmp_path, 2)
+
+        with mock.patch.object(
+            sample_video,
+            "_sample_single_video_by_distance",
+            side_effect=ffmpeglib.FFmpegNotFoundError("ffmpeg not found"),
+        ):
+            with pytest.raises(exceptions.MapillaryFFmpegNotFoundError):
+                sample_video.sample_video(
+                    video_import_path=video_dir,
+                    import_path=tmp_path / "output",
+                    skip_sample_errors=True,
+                    num_sample_workers=2,
+                )
+
+    def test_resolve_num_sample_workers(self) -> None:
+        assert sample_video._resolve_num_sample_workers(3, 10) == 3
+        assert sample_video._resolve_num_sample_workers(0, 10) == 1
+        assert sample_video._resolve_num_sample_workers(8, 2) == 2
+        assert 1 <= sample_video._resolve_num_sample_workers(None, 1000)
+
+
+# ---------------------------------------------------------------------------
+# Distance-based sampling: seeking to keyframes
+# ---------------------------------------------------------------------------
+
+
+def _make_gop_samples(count: int, gop_size: int) -> list[mp4_sample_parser.Sample]:
+    """Create samples at 25 fps with a sync sample every gop_size samples."""
+    return [
+        _make_sample(idx * 0.04, timedelta=0.04, is_sync=idx % gop_size == 0)
+        for idx in range(count)
+    ]
+
+
+class TestExtractFramesBySeeking:
+    """Tests for choosing between full decoding and seeking to keyframes."""
+
+    @pytest.fixture(autouse=True)
+    def _auto_mode(self, monkeypatch) -> None:
+        monkeypatch.setattr(
+            sample_video.constants, "VIDEO_FRAME_EXTRACTION_MODE", "auto"
+        )
+
+    def test_plan_seek_groups(self) -> None:
+        samples = _make_gop_samples(1000, gop_size=25)
+        groups = sample_video._plan_seek_groups(
+            _video_frames(samples), [3, 30, 40, 500, 510, 999]
+        )
+        assert groups == [
+            # 30 and 40 are decoded from the keyframe 25, which is close to 3
+            sample_video._FrameSeekGroup(0, [3, 30, 40]),
+            sample_video._FrameSeekGroup(500, [500, 510]),
+            sample_video._FrameSeekGroup(975, [999]),
+        ]
+
+    def test_plan_seek_groups_without_sync_samples(self) -> None:
+        samples = [_make_sample(idx * 0.04, is_sync=False) for idx in range(500)]
+        groups = sample_video._plan_seek_groups(_video_frames(samples), [10, 400])
+        # All frames are decoded from the beginning
+        assert groups == [sample_video._FrameSeekGroup(0, [10, 400])]
+
+    def _plan(
+        self, samples: list[mp4_sample_parser.Sample], frame_indices: list[int]
+    ) -> list[sample_video._FrameExtractionJob]:
+        return sample_video._plan_frame_extraction(
+            frame_indices, _video_frames(samples), stream_start_offset=1.0
+        )
+
+    def test_seek_sparse_frames(self) -> None:
+        samples = _make_gop_samples(10_000, gop_size=25)
+        jobs = self._plan(samples, [10, 3010, 3020, 6000])
+
+        assert [job.frame_indices for job in jobs] == [{10}, {10, 20}, {0}]
+        assert [job.start_number for job in jobs] == [1, 2, 4]
+        assert jobs[0].seek_time is None
+        # Keyframe 3000 is at 120s, shifted by the stream start offset and half a frame
+        assert jobs[1].seek_time == pytest.approx(120 + 1.0 - 0.02)
+        assert jobs[2].seek_time == pytest.approx(240 + 1.0 - 0.02)
+
+        mock_ffmpeg = mock.MagicMock(spec=ffmpeglib.FFMPEG)
+        sample_video._extract_specified_frames(
+            mock_ffmpeg, Path("video.mp4"), Path("samples"), jobs, "0"
+        )
+        calls = mock_ffmpeg.extract_specified_frames.call_args_list
+        assert [call.kwargs["seek_time"] for call in calls] == [
+            job.seek_time for job in jobs
+        ]
+        assert [call.kwargs["start_number"] for call in calls] == [1, 2, 4]
+
+    def test_decode_dense_frames(self) -> None:
+        samples = _make_gop_samples(1000, gop_size=25)
+        jobs = self._plan(samples, list(range(0, 1000, 10)))
+
+        assert jobs == [
+            sample_video._FrameExtractionJob(None, set(range(0, 1000, 10)), 1)
+        ]
+
+    def test_resume_from_keyframe(self, monkeypatch) -> None:
+        samples = _make_gop_samples(1000, gop_size=25)
+        # The first 40 of the dense frames were sampled in the previous run
+        jobs = sample_video._plan_frame_extraction(
+            list(range(400, 1000, 10)),
+            _video_frames(samples),
+            stream_start_offset=0.0,
+            start_number=41,
+        )
+
+        # Decode from the keyframe before the first remaining frame instead of the beginning
+        assert jobs == [
+            sample_video._FrameExtractionJob(
+                pytest.approx(16 - 0.02), set(range(0, 600, 10)), 41
+            )
+        ]
+
+    def test_forced_mode(self, monkeypatch) -> None:
+        samples = _make_gop_samples(10_000, gop_size=25)
+
+        monkeypatch.setattr(
+            sample_video.constants, "VIDEO_FRAME_EXTRACTION_MODE", "decode"
+        )
+        assert len(self._plan(samples, [10, 3010, 6000])) == 1
+
+        monkeypatch.setattr(
+            sample_video.constants, "VIDEO_FRAME_EXTRACTION_MODE", "seek"
+        )
+        jobs = self._plan(samples, list(range(0, 10_000, 10)))
+        # Dense frames are merged into one group decoded from the beginning
+        assert len(jobs) == 1
+        assert jobs[0].seek_time is None
+
+        monkeypatch.setattr(
+            sample_video.constants, "VIDEO_FRAME_EXTRACTION_MODE", "unknown"
+        )
+        with pytest.raises(exceptions.MapillaryBadParameterError):
+            self._plan(samples, [10, 3010, 6000])
+
+    @pytest.mark.parametrize(
+        "video_name, encoder",
+        [("sample-5s.mp4", "libx264"), ("sample-5s_h265.mp4", "libx265")],
+    )
+    def test_seek_extracts_same_frames_as_decode(
+        self, tmp_path: Path, monkeypatch, video_name: str, encoder: str
+    ) -> None:
+        pytest_skip_if_not_ffmpeg_installed()
+
+        ff = ffmpeglib.FFMPEG()
+
+        # The sample videos have a single keyframe, so re-encode them with short GOPs,
+        # keeping the B-frames (hence the edit lists) to test the start offsets
+        video_path = tmp_path / video_name
+        try:
+            ff.run_ffmpeg_non_interactive(
+                [
+                    *["-i", str(_PWD.parent / "data/videos" / video_name)],
+                    *["-an", "-c:v", encoder, "-g", "10", "-bf", "2"],
+                    str(video_path),
+                ]
+            )
+        except ffmpeglib.FFmpegCalledProcessError:
+            pytest.skip(f"ffmpeg does not support the encoder {encoder}")
+
+        probe = ffmpeglib.Probe(ff.probe_format_and_streams(video_path))
+        video_stream = probe.probe_video_with_max_resolution()
+        assert video_stream is not None
+        stream_idx = video_stream["index"]
+        video_frames = sample_video._VideoFrames.from_track(
+            mp4_sample_parser.MovieBoxParser.parse_file(video_path).extract_track_at(
+                stream_idx
+            )
+        )
+        frame_count = len(video_frames)
+        # Keyframes, the frames right before and after them, and the last frame
+        frame_indices = sorted(
+            {
+                idx
+                for k in range(10, frame_count, 30)
+                for idx in [k - 1, k, k + 3]
+                if idx < frame_count
+            }
+            | {frame_count - 1}
+        )
+
+        # Seek to every group of frames instead of merging them
+        monkeypatch.setattr(sample_video, "_SEEK_OVERHEAD_FRAMES", 0)
+
+        images_by_mode: dict[str, list[bytes]] = {}
+        for mode in ["decode", "seek"]:
+            monkeypatch.setattr(
+                sample_video.constants, "VIDEO_FRAME_EXTRACTION_MODE", mode
+            )
+            jobs = sample_video._plan_frame_extraction(
+                frame_indices,
+                video_frames,
+                stream_start_offset=probe.probe_stream_start_offset(video_stream),
+            )
+            if mode == "seek":
+                assert any(job.seek_time is not None for job in jobs)
+            sample_dir = tmp_path / mode
+            sample_dir.mkdir()
+            sample_video._extract_specified_frames(
+                ff, video_path, sample_dir, jobs, str(stream_idx)
+            )
+            images_by_mode[mode] = [
+                T.cast(Path, frame_paths[0]).read_bytes()
+                for _, frame_paths in ff.sort_selected_samples(
+                    sample_dir, video_path, [stream_idx]
+                )
+            ]
+
+        assert len(frame_indices) == len(images_by_mode["decode"])
+        assert images_by_mode["decode"] == images_by_mode["seek"]
+
+
+# ---------------------------------------------------------------------------
+# Native MP4 probing
+# ---------------------------------------------------------------------------
+
+
+def test_probe_mp4_format_and_streams(setup_data: py.path.local):
+    video_path = Path(setup_data.join("videos/sample-5s.mp4"))
+
+    moov_parser = sample_video._parse_mp4(video_path)
+    assert moov_parser is not None
+    probe_output = sample_video.probe_mp4_format_and_streams(moov_parser)
+    assert probe_output is not None
+    probe = ffmpeglib.Probe(probe_output)
+
+    # Same as test_probe_format_and_streams_ok which probes with ffprobe
+    assert probe.probe_video_start_time() is None
+    max_stream = probe.probe_video_with_max_resolution()
+    assert max_stream is not None
+    assert max_stream["index"] == 0
+    assert max_stream["codec_type"] == "video"
+    assert max_stream["codec_name"] == "h264"
+    assert (max_stream["width"], max_stream["height"]) == (1920, 1080)
+    assert float(max_stream["duration"]) == 5.7
+    assert [s["codec_type"] for s in probe_output["streams"]] == ["video", "audio"]
+
+    not_mp4 = Path(setup_data.join("not_mp4.mp4"))
+    not_mp4.write_bytes(b"hello world")
+    assert sample_video._parse_mp4(not_mp4) is None
+
+
+def test_probe_mp4_track_without_edit_list(setup_data: py.path.local):
+    video_path = Path(setup_data.join("videos/sample-5s.mp4"))
+    moov_parser = mp4_sample_parser.MovieBoxParser.parse_file(video_path)
+    video_track = moov_parser.extract_track_at(0)
+    # The edit list skips the composition offset (1024 in timescale 15360) of B-frames
+    assert video_track.extract_elst_boxdata() is not None
+    track = mp4_sample_parser.TrackBoxParser(
+        [box for box in video_track.trak_children if box["type"] != b"edts"]
+    )
+
+    stream = sample_video._probe_mp4_track(track, 0, 1000)
+    # Same as ffprobe reports without the edit list
+    assert float(stream["start_time"]) == pytest.approx(0.066667, abs=1e-6)
+    assert float(stream["duration"]) == pytest.approx(5.7)
+
+
+def test_format_mp4_creation_time():
+    assert sample_video._format_mp4_creation_time(0) is None
+    # 2019-11-18T15:41:18Z since 1904
+    creation_time = sample_video._format_mp4_creation_time(3656936478)
+    assert creation_time == "2019-11-18T15:41:18.000000Z"
+    # Unix timestamps are accepted like ffmpeg does
+    assert sample_video._format_mp4_creation_time(1574091678) == creation_time
+
+    stream = T.cast(
+        ffmpeglib.Stream, {"duration": "5.5", "tags": {"creation_time": creation_time}}
+    )
+    start_time = ffmpeglib.Probe.extract_stream_start_time(stream)
+    assert start_time is not None
+    assert start_time.isoformat() == "2019-11-18T15:41:12.500000+00:00"
+
+
+def test_probe_cache(tmp_path: Path):
+    video_path = tmp_path.joinpath("video.mp4")
+    video_path.write_bytes(b"foo")
+
+    probed: list[Path] = []
+
+    def _probe(path: Path) -> ffmpeglib.ProbeOutput:
+        probed.append(path)
+        return {"streams": [], "format": {"duration": "1", "start_time": "0"}}
+
+    cache = sample_video.ProbeCache(maxsize=1)
+    assert cache.probe(video_path, _probe)["format"]["duration"] == "1"
+    cache.probe(video_path, _probe)["streams"].append(T.cast(ffmpeglib.Stream, {}))
+    assert cache.probe(video_path, _probe)["streams"] == []
+    assert len(probed) == 1
+
+    # Probe again once the file is modified
+    video_path.write_bytes(b"foobar")
+    cache.probe(video_path, _probe)
+    assert len(probed) == 2
+
+    # Evict the least recently used
+    other_path = tmp_path.joinpath("other.mp4")
+    other_path.write_bytes(b"bar")
+    cache.probe(other_path, _probe)
+    assert len(cache) == 1
+    cache.probe(video_path, _probe)
+    assert len(probed) == 4
+
+    # Files that do not exist are not cached
+    cache.clear()
+    cache.probe(tmp_path.joinpath("missing.mp4"), _probe)
+    assert len(cache) == 0
+
+
+def _truncate_moov_after_mvhd(video_path: Path) -> None:
+    data = video_path.read_bytes()
+    # Keep the moov box header and the mvhd box, and drop the trak boxes
+    moov_offset = data.index(b"moov") - 4
+    mvhd_size = int.from_bytes(data[moov_offset + 8 : moov_offset + 12], "big")
+    video_path.write_bytes(data[: moov_offset + 8 + mvhd_size])
+
+
+def test_probe_video_truncated_moov(setup_data: py.path.local, monkeypatch):
+    video_path = Path(setup_data.join("videos/sample-5s.mp4"))
+    _truncate_moov_after_mvhd(video_path)
+    monkeypatch.setattr(sample_video, "PROBE_CACHE", sample_video.ProbeCache(1))
+
+    moov_parser = sample_video._parse_mp4(video_path)
+    assert moov_parser is not None
+    assert list(moov_parser.extract_tracks()) == []
+    assert sample_video.probe_mp4_format_and_streams(moov_parser) is None
+
+    # Fall back to ffprobe
+    probe_output = _load_probe_output()
+    mock_ffmpeg = mock.MagicMock(spec=ffmpeglib.FFMPEG)
+    mock_ffmpeg.probe_format_and_streams.return_value = probe_output
+    probe = sample_video._probe_video(mock_ffmpeg, video_path)
+    assert probe.probe_output == probe_output
+    mock_ffmpeg.probe_format_and_streams.assert_called_once_with(video_path)
+
+
+def test_probe_video_with_moov_parser(setup_data: py.path.local, monkeypatch):
+    video_path = Path(setup_data.join("videos/sample-5s.mp4"))
+    monkeypatch.setattr(sample_video, "PROBE_CACHE", sample_video.ProbeCache(1))
+    moov_parser = mp4_sample_parser.MovieBoxParser.parse_file(video_path)
+
+    # The parsed moov box is probed without parsing the video again
+    with mock.patch.object(
+        mp4_sample_parser.MovieBoxParser, "parse_file", side_effect=AssertionError
+    ):
+        mock_ffmpeg = mock.MagicMock(spec=ffmpeglib.FFMPEG)
+        probe = sample_video._probe_video(mock_ffmpeg, video_path, moov_parser)
+        assert [s["codec_type"] for s in probe.probe_output["streams"]] == [
+            "video",
+            "audio",
+        ]
+        mock_ffmpeg.probe_format_and_streams.assert_not_called()
+
+        # Cached
+        probe = sample_video._probe_video(mock_ffmpeg, video_path)
+        assert len(probe.probe_output["streams"]) == 2
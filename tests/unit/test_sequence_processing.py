@@ -6,6 +6,7 @@
 from __future__ import annotations
 
 import itertools
+import math
 import typing as T
 from pathlib import Path
 
@@ -1264,3 +1265,157 @@ def test_zigzag_backwards_walk_multiple_deviations(tmpdir: py.path.local):
     assert preserved_filenames == expected_preserved, (
         f"Expected preserved: {expected_preserved}, got: {preserved_filenames}"
     )
+
+
+def test_duplication_check_all_kept(tmpdir: py.path.local):
+    # GPS jitters back and forth while the camera is stationary
+    sequence = [
+        _make_image_metadata(Path(tmpdir) / "a.jpg", 1.0, 1.0, 1, angle=0),
+        _make_image_metadata(Path(tmpdir) / "b.jpg", 1.00002, 1.0, 2, angle=0),
+        _make_image_metadata(Path(tmpdir) / "c.jpg", 1.0, 1.0, 3, angle=0),
+        _make_image_metadata(Path(tmpdir) / "d.jpg", 1.00002, 1.0, 4, angle=0),
+        _make_image_metadata(Path(tmpdir) / "e.jpg", 1.001, 1.0, 5, angle=0),
+    ]
+
+    dedups, dups = psp.duplication_check(
+        sequence, max_duplicate_distance=1, max_duplicate_angle=5
+    )
+    assert [] == dups
+    assert sequence == dedups
+
+    dedups, dups = psp.duplication_check(
+        sequence, max_duplicate_distance=1, max_duplicate_angle=5, check_all_kept=True
+    )
+    assert ["c.jpg", "d.jpg"] == [d.filename.name for d in dups]
+    assert ["a.jpg", "b.jpg", "e.jpg"] == [d.filename.name for d in dedups]
+
+    # Angles still have to match
+    sequence[2].angle = 90
+    dedups, dups = psp.duplication_check(
+        sequence, max_duplicate_distance=1, max_duplicate_angle=5, check_all_kept=True
+    )
+    assert ["d.jpg"] == [d.filename.name for d in dups]
+
+
+def test_zigzag_global_radius(tmpdir: py.path.local):
+    # Moving ~11 meters per image, but img3 to img9 jump 1 km away,
+    # which is longer than the look-back window
+    lats = [1.0] * 3 + [1.01] * 7 + [1.0] * 3
+    sequence = [
+        _make_image_metadata(
+            Path(tmpdir) / f"img{idx}.jpg", 1.0 + idx * 0.0001, lat, idx * 10
+        )
+        for idx, lat in enumerate(lats)
+    ]
+
+    output_sequences, errors = psp._check_sequences_zigzag(
+        [sequence], window_size=5, min_distance=30
+    )
+    assert [] == errors
+
+    output_sequences, errors = psp._check_sequences_zigzag(
+        [sequence], window_size=5, min_distance=30, global_radius=100
+    )
+    assert [f"img{idx}.jpg" for idx in range(3, 10)] == [
+        e.filename.name for e in errors
+    ]
+    assert [f"img{idx}.jpg" for idx in [0, 1, 2, 10, 11, 12]] == [
+        image.filename.name for image in output_sequences[0]
+    ]
+
+    # The excursion is longer than the global window
+    output_sequences, errors = psp._check_sequences_zigzag(
+        [sequence],
+        window_size=5,
+        min_distance=30,
+        global_radius=100,
+        global_window_size=6,
+    )
+    assert [] == errors
+
+
+def test_zigzag_global_radius_loop(tmpdir: py.path.local):
+    # A loop route of ~300 meters radius with ~39 meters between images,
+    # ending where it starts
+    center_lat, center_lon = 1.0, 1.0
+    radius_deg = 300 / 111_320
+    sequence = [
+        _make_image_metadata(
+            Path(tmpdir) / f"img{idx}.jpg",
+            center_lon + radius_deg * math.cos(2 * math.pi * idx / 48),
+            center_lat + radius_deg * math.sin(2 * math.pi * idx / 48),
+            idx * 10,
+        )
+        for idx in range(51)
+    ]
+
+    for global_radius in [None, 50]:
+        output_sequences, errors = psp._check_sequences_zigzag(
+            [sequence], window_size=5, min_distance=30, global_radius=global_radius
+        )
+        assert [] == errors
+        assert sequence == output_sequences[0]
+
+
+def test_process_sequences_in_parallel(
+    tmpdir: py.path.local, monkeypatch: pytest.MonkeyPatch
+):
+    def _make_sequences():
+        metadatas: list[types.MetadataOrError] = []
+        for folder_idx in range(4):
+            folder = Path(tmpdir) / f"folder{folder_idx}"
+            for idx in range(30):
+                # Every 7th image duplicates its previous one
+                pos = idx - 1 if idx % 7 == 0 and idx else idx
+                metadatas.append(
+                    _make_image_metadata(
+                        folder / f"img{idx}.jpg",
+                        1.0 + folder_idx + pos * 0.0001,
+                        1.0,
+                        # Split by cutoff time in the middle
+                        idx * 2 + (100 if 15 <= idx else 0),
+                        angle=0,
+                        filesize=1,
+                    )
+                )
+            metadatas.append(
+                _make_image_metadata(folder / "null.jpg", 0, 0, 1000, filesize=1)
+            )
+        return metadatas
+
+    def _summarize(metadatas):
+        return [
+            (
+                d.filename,
+                type(d.error).__name__,
+            )
+            if isinstance(d, types.ErrorMetadata)
+            else (d.filename, d.MAPSequenceUUID, d.time, d.angle)
+            for d in metadatas
+        ]
+
+    sequential = psp.process_sequence_properties(_make_sequences(), num_processes=0)
+    parallel = psp.process_sequence_properties(_make_sequences(), num_processes=2)
+
+    assert _summarize(sequential) == _summarize(parallel)
+
+    # Sequential by default
+    def _fail_mp_map_maybe(*args, **kwargs):
+        raise AssertionError("should not start worker processes")
+
+    with monkeypatch.context() as m:
+        m.setattr(psp.utils, "mp_map_maybe", _fail_mp_map_maybe)
+        default = psp.process_sequence_properties(_make_sequences())
+    assert _summarize(sequential) == _summarize(default)
+
+    errors = [d for d in parallel if isinstance(d, types.ErrorMetadata)]
+    assert 4 == sum(
+        isinstance(d.error, exceptions.MapillaryNullIslandError) for d in errors
+    )
+    assert 4 * 4 == sum(
+        isinstance(d.error, exceptions.MapillaryDuplicationError) for d in errors
+    )
+    # Each folder is split into 2 by the cutoff time
+    assert 4 * 2 == len(
+        set(d.MAPSequenceUUID for d in parallel if isinstance(d, types.ImageMetadata))
+    )
@@ -53,6 +53,13 @@ def _build_and_parse_stbl(
     assert d[8:] == ss
     _, parsed_samples = sample_parser.extract_raw_samples_from_stbl_data(ss)
     assert expected_samples == list(parsed_samples)
+    assert ss == builder.build_stbl_data_from_raw_samples(
+        descriptions, expected_samples
+    )
+    # The samples can be streamed from an iterator
+    assert ss == builder.build_stbl_data_from_raw_samples(
+        descriptions, iter(expected_samples)
+    )
 
 
 def test_build_stbl_happy():
@@ -172,6 +179,67 @@ def test_build_stbl_happy():
     _build_and_parse_stbl(descriptions, [])
 
 
+def test_build_stbl_composition_offsets():
+    descriptions = [{"format": b"avc1", "data": b""}]
+
+    samples = [
+        sample_parser.RawSample(
+            description_idx=1,
+            offset=idx * 10,
+            size=10,
+            timedelta=512,
+            composition_offset=offset,
+            is_sync=idx == 0,
+        )
+        for idx, offset in enumerate([1024, 0, 512, 512, 1536])
+    ]
+    _build_and_parse_stbl(descriptions, samples)
+
+    # negative offsets are built into a version 1 ctts box
+    samples = [
+        sample._replace(composition_offset=sample.composition_offset - 512)
+        for sample in samples
+    ]
+    stbl_data = builder.build_stbl_data_from_raw_samples(descriptions, samples)
+    ctts = sparser.parse_box_data_firstx(io.BytesIO(stbl_data), [b"ctts"])
+    assert 1 == ctts[0]
+    _, parsed_samples = sample_parser.extract_raw_samples_from_stbl_data(stbl_data)
+    assert samples == list(parsed_samples)
+
+
+def test_transform_mp4_relocates_samples():
+    src_path = "tests/data/videos/sample-5s.mp4"
+    with open(src_path, "rb") as fp:
+        src_data = fp.read()
+    with open(src_path, "rb") as fp:
+        dst_data = builder.transform_mp4(fp).read()
+
+    def _video_samples(data: bytes) -> T.List[sample_parser.Sample]:
+        moov = sample_parser.MovieBoxParser.parse_stream(io.BytesIO(data))
+        for track in moov.extract_tracks():
+            if track.extract_sample_descriptions()[0]["format"] == b"avc1":
+                return list(track.extract_samples())
+        assert False, "video track not found"
+
+    src_samples = _video_samples(src_data)
+    dst_samples = _video_samples(dst_data)
+    assert len(src_samples) == len(dst_samples)
+    for src, dst in zip(src_samples, dst_samples):
+        assert src.raw_sample._replace(offset=0) == dst.raw_sample._replace(offset=0)
+        assert (
+            src_data[
+                src.raw_sample.offset : src.raw_sample.offset + src.raw_sample.size
+            ]
+            == dst_data[
+                dst.raw_sample.offset : dst.raw_sample.offset + dst.raw_sample.size
+            ]
+        )
+
+    # samples are placed right after the mdat header
+    mdat_offset = dst_data.index(b"mdat") + 4
+    assert mdat_offset == dst_samples[0].raw_sample.offset
+
+
 def test_parse_raw_samples_from_stbl():
     # building a stbl with 4 samples
     # chunk 1
@@ -3,10 +3,13 @@
 # This source code is licensed under the BSD license found in the
 # LICENSE file in the root directory of this source tree.
 
+import dataclasses
 import datetime
+import pickle
+import sys
 from pathlib import Path
 
-from mapillary_tools import geo, types
+from mapillary_tools import geo, telemetry, types
 from mapillary_tools.serializer import description
 
 
@@ -128,3 +131,45 @@ def test_datetimes():
         )
         < 0.001
     )
+
+
+def test_image_metadata_slots():
+    metadata = types.ImageMetadata(
+        filename=Path("foo.jpg"),
+        time=1,
+        lat=2,
+        lon=3,
+        alt=None,
+        angle=None,
+        MAPOrientation=1,
+    )
+
+    if sys.version_info >= (3, 10):
+        assert not hasattr(metadata, "__dict__")
+
+    replaced = dataclasses.replace(metadata, lat=4, angle=5)
+    assert isinstance(replaced, types.ImageMetadata)
+    assert (replaced.lat, replaced.angle, replaced.MAPOrientation) == (4, 5, 1)
+    assert metadata.lat == 2
+
+    assert pickle.loads(pickle.dumps(replaced)) == replaced
+
+
+def test_telemetry_slots():
+    gyro = telemetry.GyroscopeData(time=1, x=2, y=3, z=4)
+    assert not hasattr(gyro, "__dict__")
+
+    point = telemetry.GPSPoint(
+        time=1,
+        lat=2,
+        lon=3,
+        alt=None,
+        angle=None,
+        epoch_time=None,
+        fix=telemetry.GPSFix.FIX_3D,
+        precision=None,
+        ground_speed=None,
+    )
+    assert not hasattr(point, "__dict__")
+    assert pickle.loads(pickle.dumps(point)) == point
+    assert dataclasses.replace(point, lat=5).fix == telemetry.GPSFix.FIX_3D
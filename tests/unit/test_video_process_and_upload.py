@@ -0,0 +1,138 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the BSD license found in the
+# LICENSE file in the root directory of this source tree.
+
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+
+import py.path
+import pytest
+from mapillary_tools.commands import video_process_and_upload
+
+
+class FakeCommands:
+    def __init__(self, monkeypatch, import_path: Path):
+        self.import_path = import_path
+        self.sampled: list[Path] = []
+        self.uploaded: list[tuple[Path, list[str]]] = []
+        # The sample directories on disk when each upload starts
+        self.sample_dirs_on_upload: list[list[str]] = []
+        self.sampled_cond = threading.Condition()
+        self.fail_upload = False
+        self.num_videos = 0
+
+        test = self
+
+        def fake_sample(self, vars_args: dict):
+            video_path: Path = vars_args["video_import_path"]
+            sample_dir = Path(vars_args["import_path"]).joinpath(video_path.name)
+            sample_dir.mkdir(parents=True, exist_ok=True)
+            sample_dir.joinpath(f"{video_path.stem}_v_000001.jpg").write_bytes(b"")
+            with test.sampled_cond:
+                test.sampled.append(video_path)
+                test.sampled_cond.notify_all()
+
+        def fake_upload(self, vars_args: dict):
+            sample_dir = vars_args["import_path"]
+            # The next video is sampled while this one is uploaded
+            with test.sampled_cond:
+                assert test.sampled_cond.wait_for(
+                    lambda: (
+                        len(test.uploaded) + 2 <= len(test.sampled)
+                        or len(test.sampled) == test.num_videos
+                    ),
+                    timeout=10,
+                )
+            test.sample_dirs_on_upload.append(sorted(os.listdir(test.import_path)))
+            test.uploaded.append((sample_dir, sorted(os.listdir(sample_dir))))
+            if test.fail_upload:
+                raise RuntimeError("upload failed")
+
+        monkeypatch.setattr(video_process_and_upload.SampleCommand, "run", fake_sample)
+        monkeypatch.setattr(
+            video_process_and_upload.VideoProcessCommand,
+            "process_samples",
+            lambda self, args: None,
+        )
+        monkeypatch.setattr(video_process_and_upload.UploadCommand, "run", fake_upload)
+
+    def run(self, video_dir: Path, **kwargs):
+        self.num_videos = len(os.listdir(video_dir))
+        video_process_and_upload.Command().run(
+            {
+                "video_import_path": video_dir,
+                "import_path": self.import_path,
+                "user_items": {},
+                "stream_video_samples": True,
+                **kwargs,
+            }
+        )
+
+
+def _create_videos(video_dir: Path, names: list[str]) -> None:
+    video_dir.mkdir()
+    for name in names:
+        video_dir.joinpath(name).write_bytes(b"")
+
+
+def test_video_process_and_upload_streaming(tmpdir: py.path.local, monkeypatch):
+    video_dir = Path(tmpdir.join("videos"))
+    _create_videos(video_dir, ["a.mp4", "b.mp4", "c.mp4"])
+    import_path = Path(tmpdir.join("sampled_video_frames"))
+
+    fake = FakeCommands(monkeypatch, import_path)
+    fake.run(video_dir)
+
+    # Videos are uploaded in the order they are sampled
+    videos = [video_path.name for video_path in fake.sampled]
+    assert sorted(videos) == ["a.mp4", "b.mp4", "c.mp4"]
+    assert fake.uploaded == [
+        (import_path.joinpath(video), [f"{video[0]}_v_000001.jpg"]) for video in videos
+    ]
+    # Only the samples of the current and the next video are on disk
+    assert fake.sample_dirs_on_upload == [
+        sorted(videos[0:2]),
+        sorted(videos[1:3]),
+        videos[2:3],
+    ]
+    # Samples are removed once uploaded
+    assert os.listdir(import_path) == []
+
+
+def test_video_process_and_upload_streaming_keeps_existing_samples(
+    tmpdir: py.path.local, monkeypatch
+):
+    video_dir = Path(tmpdir.join("videos"))
+    _create_videos(video_dir, ["a.mp4", "b.mp4"])
+    import_path = Path(tmpdir.join("sampled_video_frames"))
+    import_path.joinpath("a.mp4").mkdir(parents=True)
+
+    fake = FakeCommands(monkeypatch, import_path)
+    fake.run(video_dir)
+
+    assert len(fake.uploaded) == 2
+    # Samples from a previous run are kept
+    assert os.listdir(import_path) == ["a.mp4"]
+
+
+def test_video_process_and_upload_streaming_cleans_up_on_error(
+    tmpdir: py.path.local, monkeypatch
+):
+    video_dir = Path(tmpdir.join("videos"))
+    _create_videos(video_dir, ["a.mp4", "b.mp4", "c.mp4"])
+    import_path = Path(tmpdir.join("sampled_video_frames"))
+
+    fake = FakeCommands(monkeypatch, import_path)
+    fake.fail_upload = True
+    with pytest.raises(RuntimeError):
+        fake.run(video_dir)
+
+    assert len(fake.uploaded) == 1
+    # The next video was sampled before the upload failed
+    assert len(fake.sampled) == 2
+    # Neither the failed video nor the one sampled ahead leaves samples behind
+    assert os.listdir(import_path) == []